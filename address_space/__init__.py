@@ -0,0 +1,4 @@
+from .builder import NodeBuilder, argument
+from .snapshot import AddressSpaceSnapshot, file_digest
+
+__all__ = ["AddressSpaceSnapshot", "NodeBuilder", "argument", "file_digest"]
@@ -0,0 +1,273 @@
+from typing import Any, Callable, Optional
+from asyncua import Node, ua
+
+_READ = ua.AccessLevel.CurrentRead.mask
+_READ_WRITE = ua.AccessLevel.CurrentRead.mask | ua.AccessLevel.CurrentWrite.mask
+
+
+def argument(vtype: ua.VariantType, name: str = "", array: bool = False) -> ua.Argument:
+    """Describe a method argument of the given type, a scalar or a 1-D array"""
+    description = ua.Argument()
+    description.Name = name
+    description.DataType = ua.NodeId(vtype.value)
+    if array:
+        description.ValueRank = ua.ValueRank.OneDimension
+        description.ArrayDimensions = [0]
+    return description
+
+
+class NodeBuilder:
+    """
+    Collects node definitions and creates them in bulk.
+
+    Node ids are allocated when a node is defined, so the returned Node can
+    be used right away as the parent of further definitions. `commit`
+    then creates every queued node with a single AddNodes call and every
+    extra reference with a single AddReferences call, instead of one
+    awaited call per node, per access level bit and per reference.
+
+    Example:
+        builder = NodeBuilder(parent_node.session)
+        line = builder.add_object(parent_node, idx, "Line")
+        rate = builder.add_variable(line, idx, "ProductionRate", 0.0, writable=True)
+        await builder.commit()
+    """
+
+    def __init__(self, session):
+        self._session = session
+        self._nodes: list[ua.AddNodesItem] = []
+        self._references: list[ua.AddReferencesItem] = []
+        self._methods: list[tuple[ua.NodeId, Callable]] = []
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __str__(self):
+        return (
+            f"NodeBuilder(nodes={len(self._nodes)}, references={len(self._references)})"
+        )
+
+    def _add(
+        self,
+        parent: Node,
+        idx: int,
+        name: str,
+        node_class: ua.NodeClass,
+        reference_type: int,
+        type_definition: Optional[int],
+        attributes: Any,
+    ) -> Node:
+        """Queue a node and return a handle with its allocated node id"""
+        nodeid = self._session.aspace.generate_nodeid(idx)
+        item = ua.AddNodesItem()
+        item.RequestedNewNodeId = nodeid
+        item.BrowseName = ua.QualifiedName(name, idx)
+        item.NodeClass = node_class
+        item.ParentNodeId = parent.nodeid
+        item.ReferenceTypeId = ua.NodeId(reference_type)
+        if type_definition is not None:
+            item.TypeDefinition = ua.NodeId(type_definition)
+        attributes.Description = ua.LocalizedText(name)
+        attributes.DisplayName = ua.LocalizedText(name)
+        attributes.WriteMask = 0
+        attributes.UserWriteMask = 0
+        item.NodeAttributes = attributes
+        self._nodes.append(item)
+        return Node(self._session, nodeid)
+
+    def add_object(
+        self,
+        parent: Node,
+        idx: int,
+        name: str,
+        reference_type: int = ua.ObjectIds.HasComponent,
+    ) -> Node:
+        """Queue an object node"""
+        attributes = ua.ObjectAttributes()
+        attributes.EventNotifier = 0
+        return self._add(
+            parent,
+            idx,
+            name,
+            ua.NodeClass.Object,
+            reference_type,
+            ua.ObjectIds.BaseObjectType,
+            attributes,
+        )
+
+    def add_folder(self, parent: Node, idx: int, name: str) -> Node:
+        """Queue a folder organized by its parent"""
+        attributes = ua.ObjectAttributes()
+        attributes.EventNotifier = 0
+        return self._add(
+            parent,
+            idx,
+            name,
+            ua.NodeClass.Object,
+            ua.ObjectIds.Organizes,
+            ua.ObjectIds.FolderType,
+            attributes,
+        )
+
+    def _add_variable(
+        self,
+        parent: Node,
+        idx: int,
+        name: str,
+        value: Any,
+        varianttype: Optional[ua.VariantType],
+        writable: bool,
+        is_property: bool,
+        datatype: Optional[int] = None,
+    ) -> Node:
+        variant = (
+            value if isinstance(value, ua.Variant) else ua.Variant(value, varianttype)
+        )
+        attributes = ua.VariableAttributes()
+        attributes.Value = variant
+        if datatype is not None:
+            attributes.DataType = ua.NodeId(datatype)
+        else:
+            attributes.DataType = ua.NodeId(
+                getattr(ua.ObjectIds, variant.VariantType.name)
+            )
+        if not isinstance(variant.Value, (list, tuple)):
+            attributes.ValueRank = ua.ValueRank.Scalar
+            attributes.ArrayDimensions = None
+        elif variant.Dimensions:
+            attributes.ValueRank = len(variant.Dimensions)
+            attributes.ArrayDimensions = variant.Dimensions
+        attributes.Historizing = False
+        attributes.AccessLevel = _READ_WRITE if writable else _READ
+        attributes.UserAccessLevel = _READ_WRITE if writable else _READ
+        return self._add(
+            parent,
+            idx,
+            name,
+            ua.NodeClass.Variable,
+            ua.ObjectIds.HasProperty if is_property else ua.ObjectIds.HasComponent,
+            (
+                ua.ObjectIds.PropertyType
+                if is_property
+                else ua.ObjectIds.BaseDataVariableType
+            ),
+            attributes,
+        )
+
+    def add_variable(
+        self,
+        parent: Node,
+        idx: int,
+        name: str,
+        value: Any,
+        varianttype: Optional[ua.VariantType] = None,
+        writable: bool = False,
+    ) -> Node:
+        """Queue a variable, writable by clients if requested"""
+        return self._add_variable(
+            parent, idx, name, value, varianttype, writable, False
+        )
+
+    def add_property(
+        self,
+        parent: Node,
+        idx: int,
+        name: str,
+        value: Any,
+        varianttype: Optional[ua.VariantType] = None,
+        writable: bool = False,
+    ) -> Node:
+        """Queue a property, writable by clients if requested"""
+        return self._add_variable(parent, idx, name, value, varianttype, writable, True)
+
+    def add_method(
+        self,
+        parent: Node,
+        idx: int,
+        name: str,
+        callback: Callable,
+        inputs: Optional[list[ua.VariantType | ua.Argument]] = None,
+        outputs: Optional[list[ua.VariantType | ua.Argument]] = None,
+    ) -> Node:
+        """
+        Queue a method with its argument properties and Python callback
+
+        Arguments are given by their variant type for unnamed scalars, or
+        described with `argument`.
+        """
+        attributes = ua.MethodAttributes()
+        attributes.Executable = True
+        attributes.UserExecutable = True
+        method = self._add(
+            parent,
+            idx,
+            name,
+            ua.NodeClass.Method,
+            ua.ObjectIds.HasComponent,
+            None,
+            attributes,
+        )
+        for arguments_name, arguments in (
+            ("InputArguments", inputs),
+            ("OutputArguments", outputs),
+        ):
+            if not arguments:
+                continue
+            arguments_node = self._add_variable(
+                method,
+                idx,
+                arguments_name,
+                ua.Variant(
+                    [
+                        vtype if isinstance(vtype, ua.Argument) else argument(vtype)
+                        for vtype in arguments
+                    ],
+                    ua.VariantType.ExtensionObject,
+                ),
+                None,
+                False,
+                True,
+                datatype=ua.ObjectIds.Argument,
+            )
+            # Argument properties live in namespace 0 like the ones asyncua creates
+            self._nodes[-1].BrowseName = ua.QualifiedName(arguments_name, 0)
+            self.add_reference(
+                arguments_node,
+                Node(self._session, ua.NodeId(ua.ObjectIds.ModellingRule_Mandatory)),
+                ua.ObjectIds.HasModellingRule,
+            )
+        self._methods.append((method.nodeid, callback))
+        return method
+
+    def add_reference(
+        self,
+        source: Node,
+        target: Node,
+        reference_type: int,
+        forward: bool = True,
+    ):
+        """Queue a reference between two nodes"""
+        item = ua.AddReferencesItem()
+        item.SourceNodeId = source.nodeid
+        item.TargetNodeId = target.nodeid
+        item.ReferenceTypeId = ua.NodeId(reference_type)
+        item.IsForward = forward
+        item.TargetNodeClass = ua.NodeClass.Unspecified
+        self._references.append(item)
+
+    async def commit(self):
+        """Create every queued node and reference in one batch each"""
+        nodes, self._nodes = self._nodes, []
+        references, self._references = self._references, []
+        methods, self._methods = self._methods, []
+
+        if nodes:
+            results = await self._session.add_nodes(nodes)
+            for result in results:
+                result.StatusCode.check()
+        for nodeid, callback in methods:
+            self._session.add_method_callback(nodeid, callback)
+        if references:
+            results = await self._session.add_references(references)
+            for result in results:
+                result.check()
@@ -0,0 +1,157 @@
+import gc
+import hashlib
+from pathlib import Path
+import pickle
+from typing import Any, Callable, Optional
+from asyncua import Node, Server, ua
+from asyncua.server.address_space import AttributeValue, NodeData
+from simulation import SimulatedVariable
+
+SNAPSHOT_VERSION = 3
+
+
+def file_digest(path: str | Path) -> str:
+    """SHA-256 of a file, used to detect a changed topology"""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _copy_node(ndata: NodeData) -> NodeData:
+    """Copy a node without its Python callbacks so it can be pickled"""
+    copy = NodeData(ndata.nodeid)
+    copy.attributes = {
+        attr: AttributeValue(value.value) for attr, value in ndata.attributes.items()
+    }
+    copy.references = list(ndata.references)
+    return copy
+
+
+class AddressSpaceSnapshot:
+    """
+    The plant part of a built address space, saved to a local binary file.
+
+    A snapshot holds every node outside of namespace 0 plus the references
+    that standard nodes (e.g. the Objects folder) hold toward them. Loading
+    it inserts the nodes in bulk; the plant classes then only resolve their
+    nodes by browse name and link their method callbacks again.
+
+    Attributes:
+    - namespaces: list[str] (namespace array of the server that was saved)
+    - topology_digest: str (digest of the topology file the plant was built from)
+    """
+
+    def __init__(
+        self,
+        namespaces: list[str],
+        topology_digest: str,
+        nodes: list[NodeData],
+        external_references: list[tuple[ua.NodeId, ua.ReferenceDescription]],
+    ):
+        self.namespaces = namespaces
+        self.topology_digest = topology_digest
+        self._nodes = nodes
+        self._external_references = external_references
+        self._children: dict[tuple[ua.NodeId, str], ua.NodeId] = {}
+        self._values: dict[ua.NodeId, ua.DataValue] = {}
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __str__(self):
+        return f"AddressSpaceSnapshot(nodes={len(self._nodes)})"
+
+    @classmethod
+    async def capture(cls, server: Server, topology_digest: str):
+        """Capture the plant nodes of a running server"""
+        nodes = []
+        external_references = []
+        for nodeid, ndata in server.iserver.aspace._nodes.items():
+            if nodeid.NamespaceIndex != 0:
+                nodes.append(_copy_node(ndata))
+                continue
+            for reference in ndata.references:
+                if reference.NodeId.NamespaceIndex != 0:
+                    external_references.append((nodeid, reference))
+        namespaces = await server.get_namespace_array()
+        return cls(namespaces, topology_digest, nodes, external_references)
+
+    def save(self, path: str | Path):
+        """Write the snapshot to a file"""
+        state = (
+            SNAPSHOT_VERSION,
+            self.namespaces,
+            self.topology_digest,
+            self._nodes,
+            self._external_references,
+        )
+        with open(path, "wb") as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str | Path) -> Optional["AddressSpaceSnapshot"]:
+        """Read a snapshot file, return None when it has another format version"""
+        # The snapshot is one large graph of long-lived small objects: keep
+        # the garbage collector from scanning it while and after it is loaded
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(path, "rb") as f:
+                version, *state = pickle.load(f)
+            gc.freeze()
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if version != SNAPSHOT_VERSION:
+            return None
+        return cls(*state)
+
+    async def is_compatible(self, server: Server, topology_digest: str) -> bool:
+        """Check that the snapshot matches the server namespaces and the topology"""
+        namespaces = await server.get_namespace_array()
+        return namespaces == self.namespaces and topology_digest == self.topology_digest
+
+    def install(self, server: Server):
+        """Insert the snapshot nodes into the server address space in bulk"""
+        aspace_nodes = server.iserver.aspace._nodes
+        for ndata in self._nodes:
+            aspace_nodes[ndata.nodeid] = ndata
+            value = ndata.attributes.get(ua.AttributeIds.Value)
+            if value is not None:
+                self._values[ndata.nodeid] = value.value
+            for reference in ndata.references:
+                if reference.IsForward:
+                    self._children[(ndata.nodeid, reference.BrowseName.Name)] = (
+                        reference.NodeId
+                    )
+        for nodeid, reference in self._external_references:
+            aspace_nodes[nodeid].references.append(reference)
+            if reference.IsForward:
+                self._children[(nodeid, reference.BrowseName.Name)] = reference.NodeId
+
+    def child(self, parent: Node, name: str) -> Node:
+        """Get the child node of `parent` with the given browse name"""
+        nodeid = self._children.get((parent.nodeid, name))
+        if nodeid is None:
+            raise KeyError(f"Node {name} not found under {parent.nodeid} in snapshot")
+        return Node(parent.session, nodeid)
+
+    def value(self, node: Node) -> ua.Variant:
+        """Get the saved value of a variable node"""
+        return self._values[node.nodeid].Value
+
+    def variable(
+        self,
+        parent: Node,
+        name: str,
+        generator: Optional[Callable[[Any], Any]] = None,
+    ) -> SimulatedVariable:
+        """Bind a simulated variable to a saved variable node"""
+        node = self.child(parent, name)
+        variant = self.value(node)
+        return SimulatedVariable(node, variant.VariantType, variant.Value, generator)
+
+    def link_method(self, parent: Node, name: str, callback: Callable) -> Node:
+        """Link a Python callback to a saved method node"""
+        node = self.child(parent, name)
+        parent.session.add_method_callback(node.nodeid, callback)
+        return node
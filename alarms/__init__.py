@@ -0,0 +1,3 @@
+from .engine import AlarmEngine
+
+__all__ = ["AlarmEngine"]
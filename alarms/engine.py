@@ -0,0 +1,287 @@
+import copy
+from datetime import datetime
+import logging
+from operator import attrgetter
+import time
+from typing import Optional
+import uuid
+import numpy as np
+from asyncua import Node, Server, ua
+from asyncua.common.event_objects import ExclusiveLimitAlarm
+from asyncua.common.methods import uamethod
+from simulation import SimulatedVariable, SimulationClock
+
+# Limit state of a condition
+NORMAL, HIGH, LOW = 0, 1, -1
+STATE_NAMES = {NORMAL: "Normal", HIGH: "High", LOW: "Low"}
+
+_value = attrgetter("value")
+
+
+class _Condition:
+    """The Python side of a limit alarm, its limits live in the engine's arrays"""
+
+    __slots__ = ("variable", "source", "source_name", "name", "severity", "event_id")
+
+    def __init__(
+        self,
+        variable: SimulatedVariable,
+        source: ua.NodeId,
+        source_name: str,
+        name: str,
+        severity: int,
+    ):
+        self.variable = variable
+        self.source = source
+        self.source_name = source_name
+        self.name = name
+        self.severity = severity
+        self.event_id: Optional[bytes] = None
+
+
+class AlarmEngine:
+    """
+    Exclusive limit alarms of the simulated variables, raised as OPC UA events
+
+    Every limit is a row of NumPy arrays (low and high limit, hysteresis,
+    state, acknowledgement). `evaluate` reads the current value of every
+    limited variable into one array, the only Python work per limit, and
+    finds the state transitions of every condition with a few vectorized
+    comparisons.
+
+    A condition goes High above its high limit and Low below its low limit,
+    and returns to Normal once the value is back inside the limit by more
+    than its `deadband`. Every transition to High or Low has to be
+    acknowledged (the standard Acknowledge method, called on the condition,
+    whose ConditionId is the node id of its variable). The events are
+    reported by the Server object and retained while a condition is active
+    or unacknowledged, so ConditionRefresh replays them.
+
+    At most `max_events_per_second` events are sent (with bursts of up to
+    one second of them). Conditions that change faster are coalesced: their
+    event is sent later and reports the state they are in by then.
+    """
+
+    def __init__(
+        self,
+        server: Server,
+        logger: logging.Logger,
+        clock: Optional[SimulationClock] = None,
+        max_events_per_second: float = 1000.0,
+        hysteresis: float = 0.01,
+    ):
+        self._server = server
+        self._logger = logger
+        self._clock = clock if clock is not None else SimulationClock()
+        self.max_events_per_second = max_events_per_second
+        self.hysteresis = hysteresis
+        self.events = 0
+        self.coalesced = 0
+        self._conditions: list[_Condition] = []
+        self._rows: dict[ua.NodeId, int] = {}
+        self._variables: list[SimulatedVariable] = []
+        self._low = np.empty(0)
+        self._high = np.empty(0)
+        self._deadband = np.empty(0)
+        self._state = np.empty(0, dtype=np.int8)
+        self._acked = np.empty(0, dtype=bool)
+        self._pending = np.empty(0, dtype=bool)
+        self._added: list[tuple[float, float, float]] = []
+        self._budget = max_events_per_second
+        self._refilled = time.monotonic()
+        self._template = ExclusiveLimitAlarm()
+        # ConditionId, not a component of the type but selected by clients
+        self._template.add_property("NodeId", None, ua.VariantType.NodeId)
+        self._template.emitting_node = ua.NodeId(ua.ObjectIds.Server)
+
+    def __str__(self):
+        return (
+            f"AlarmEngine(limits={len(self)}, active={self.active}, "
+            f"events={self.events})"
+        )
+
+    def __len__(self):
+        return len(self._conditions)
+
+    @property
+    def active(self) -> int:
+        """Number of conditions in the High or Low state"""
+        self._extend()
+        return int(np.count_nonzero(self._state))
+
+    def install(self):
+        """Answer the Acknowledge calls of the server's conditions"""
+        self._server.iserver.isession.add_method_callback(
+            ua.NodeId(ua.ObjectIds.AcknowledgeableConditionType_Acknowledge),
+            self._acknowledge,
+        )
+
+    def add(
+        self,
+        source: Node,
+        source_name: str,
+        name: str,
+        variable: SimulatedVariable,
+        low: Optional[float] = None,
+        high: Optional[float] = None,
+        severity: int = 500,
+        deadband: Optional[float] = None,
+    ) -> int:
+        """
+        Add a limit alarm on a variable of a source object, return its row
+
+        Without a `deadband` the hysteresis is `hysteresis` times the span
+        between the limits (or times the only limit).
+        """
+        if low is None and high is None:
+            raise ValueError(f"Limit alarm {name} needs a low or a high limit")
+        node_id = variable.node.nodeid
+        if node_id in self._rows:
+            raise ValueError(f"{variable} already has a limit alarm")
+        if deadband is None:
+            span = high - low if low is not None and high is not None else None
+            deadband = self.hysteresis * abs(span or low or high or 1.0)
+        row = len(self._conditions)
+        self._conditions.append(
+            _Condition(variable, source.nodeid, source_name, name, severity)
+        )
+        self._rows[node_id] = row
+        self._variables.append(variable)
+        # The arrays grow by all rows added since the last evaluation at once
+        self._added.append(
+            (
+                -np.inf if low is None else low,
+                np.inf if high is None else high,
+                deadband,
+            )
+        )
+        return row
+
+    def _extend(self):
+        """Add the rows of the limits added since the last call to the arrays"""
+        if not self._added:
+            return
+        low, high, deadband = np.array(self._added, dtype=np.float64).T
+        count = len(self._added)
+        self._added.clear()
+        self._low = np.concatenate((self._low, low))
+        self._high = np.concatenate((self._high, high))
+        self._deadband = np.concatenate((self._deadband, deadband))
+        self._state = np.concatenate((self._state, np.zeros(count, np.int8)))
+        self._acked = np.concatenate((self._acked, np.ones(count, bool)))
+        self._pending = np.concatenate((self._pending, np.zeros(count, bool)))
+
+    def evaluate(self) -> np.ndarray:
+        """Update the state of every condition, return the rows that changed"""
+        self._extend()
+        if not self._variables:
+            return np.empty(0, dtype=np.intp)
+        values = np.fromiter(
+            map(_value, self._variables), np.float64, len(self._variables)
+        )
+        state = self._state
+        new = state.copy()
+        # Back to normal only once inside the limit by more than the deadband
+        new[(state == HIGH) & (values < self._high - self._deadband)] = NORMAL
+        new[(state == LOW) & (values > self._low + self._deadband)] = NORMAL
+        new[values > self._high] = HIGH
+        new[values < self._low] = LOW
+        changed = np.flatnonzero(new != state)
+        if len(changed):
+            # Every new High or Low has to be acknowledged
+            raised = changed[new[changed] != NORMAL]
+            self._acked[raised] = False
+            self._state = new
+            # Changes of conditions whose last change is still unsent merge
+            self.coalesced += int(np.count_nonzero(self._pending[changed]))
+            self._pending[changed] = True
+        return changed
+
+    async def emit(self, now: Optional[datetime] = None) -> int:
+        """Send the events of the changed conditions within the rate budget"""
+        clock = time.monotonic()
+        self._budget = min(
+            self.max_events_per_second,
+            self._budget + (clock - self._refilled) * self.max_events_per_second,
+        )
+        self._refilled = clock
+        self._extend()
+        pending = np.flatnonzero(self._pending)
+        if not len(pending):
+            return 0
+        count = min(len(pending), int(self._budget))
+        now = now if now is not None else self._clock.now()
+        for row in pending[:count].tolist():
+            await self._trigger(row, now)
+        self._pending[pending[:count]] = False
+        self._budget -= count
+        return count
+
+    async def _trigger(self, row: int, now: datetime, comment: str = ""):
+        condition = self._conditions[row]
+        state = int(self._state[row])
+        acked = bool(self._acked[row])
+        active = state != NORMAL
+        value = condition.variable.value
+        event = copy.copy(self._template)
+        condition.event_id = uuid.uuid4().bytes
+        event.EventId = condition.event_id
+        event.Time = event.ReceiveTime = now
+        event.SourceNode = condition.source
+        event.SourceName = condition.source_name
+        event.NodeId = condition.variable.node.nodeid
+        event.InputNode = condition.variable.node.nodeid
+        event.ConditionName = condition.name
+        event.ConditionClassId = ua.NodeId(ua.ObjectIds.ProcessConditionClassType)
+        event.ConditionClassName = ua.LocalizedText("Process")
+        event.BranchId = ua.NodeId()
+        event.Severity = event.LastSeverity = condition.severity
+        event.Quality = ua.StatusCode()
+        event.Message = ua.LocalizedText(
+            f"{condition.source_name} {condition.name} {STATE_NAMES[state]} ({value})"
+        )
+        event.Comment = ua.LocalizedText(comment)
+        event.Retain = active or not acked
+        for name, flag, true_state, false_state in (
+            ("EnabledState", True, "Enabled", "Disabled"),
+            ("ActiveState", active, STATE_NAMES[state], "Inactive"),
+            ("AckedState", acked, "Acknowledged", "Unacknowledged"),
+            ("ConfirmedState", True, "Confirmed", "Unconfirmed"),
+        ):
+            setattr(event, f"{name}/Id", flag)
+            setattr(event, name, ua.LocalizedText(true_state if flag else false_state))
+        event.SuppressedOrShelved = False
+        if np.isfinite(self._high[row]):
+            event.HighLimit = float(self._high[row])
+        if np.isfinite(self._low[row]):
+            event.LowLimit = float(self._low[row])
+        await self._server.iserver.subscription_service.trigger_event(event)
+        self.events += 1
+
+    @uamethod
+    async def _acknowledge(self, parent: ua.NodeId, event_id: bytes, comment=None):
+        """Acknowledge the last event of a condition"""
+        row = self._rows.get(parent)
+        if row is None:
+            return ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
+        condition = self._conditions[row]
+        if condition.event_id is None or event_id != condition.event_id:
+            return ua.StatusCode(ua.StatusCodes.BadEventIdUnknown)
+        if self._acked[row]:
+            return ua.StatusCode(ua.StatusCodes.BadConditionBranchAlreadyAcked)
+        self._acked[row] = True
+        # The acknowledgement is reported right away, outside the rate budget
+        self._pending[row] = False
+        text = comment.Text if isinstance(comment, ua.LocalizedText) else ""
+        await self._trigger(row, self._clock.now(), text or "")
+        self._logger.info(f"Acknowledged {condition.source_name} {condition.name}")
+
+    async def run(self, period: float = 1.0):
+        """Evaluate the limits every `period` simulated seconds until cancelled"""
+        while True:
+            await self._clock.sleep(period)
+            try:
+                self.evaluate()
+                await self.emit()
+            except Exception:
+                self._logger.exception(f"Failed to evaluate the limits of {self}")
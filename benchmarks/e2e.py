@@ -0,0 +1,367 @@
+"""
+End-to-end benchmark: the simulator under load from local asyncua clients
+
+Starts the simulator on localhost, either as a subprocess or in-process, and
+runs the load scenarios one after the other:
+
+- subscriptions: N sessions with M monitored items each, per publishing interval
+- bulk_read: repeated Read of every variable of the ModelView tree
+- start_production / run_test: method-call storms
+- start_batches / stop_batches: storms of bulk batch changes on every line
+
+For every scenario it reports the client-side numbers plus the server CPU,
+RSS and (in-process only) event-loop lag, and saves everything as JSON.
+In-process the CPU and RSS are those of the whole benchmark process, the
+load clients included, and `server.scope` says so.
+Pass the JSON of an earlier run as --baseline to print the differences.
+
+Usage:
+    python -m benchmarks.e2e --output results.json
+    python -m benchmarks.e2e --topology topologies/load_test.toml \\
+        --sessions 8 --items 1000 --publishing-interval 100 1000 \\
+        --server-args=--simulation-worker --baseline results.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+import platform
+import shlex
+import subprocess
+import sys
+import time
+from typing import Optional
+import asyncua
+from asyncua import Client, ua
+from . import load_client
+from diagnostics import LoopLagMonitor
+from .load_client import PlantNodes
+
+ROOT = Path(__file__).parent.parent
+DEFAULT_TOPOLOGY = ROOT / "topologies" / "dairy_enterprise.toml"
+SCENARIOS = [
+    "subscriptions",
+    "bulk_read",
+    "start_production",
+    "run_test",
+    "start_batches",
+    "stop_batches",
+]
+# No lines start or stop the batches of every line
+ALL_LINES = ua.Variant([], ua.VariantType.String)
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+class ProcessSampler:
+    """Samples the CPU usage and RSS of a process from /proc (Linux)"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self._pid = pid
+        self._interval = interval
+        self.cpu_percent: list[float] = []
+        self.rss_mb: list[float] = []
+
+    def _cpu_seconds(self) -> float:
+        with open(f"/proc/{self._pid}/stat") as f:
+            # Fields after the command name, which may contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+
+    def _rss_mb(self) -> float:
+        with open(f"/proc/{self._pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+
+    async def run(self):
+        """Sample until cancelled"""
+        cpu = self._cpu_seconds()
+        sampled = time.perf_counter()
+        while True:
+            await asyncio.sleep(self._interval)
+            now_cpu, now = self._cpu_seconds(), time.perf_counter()
+            self.cpu_percent.append(100 * (now_cpu - cpu) / (now - sampled))
+            self.rss_mb.append(self._rss_mb())
+            cpu, sampled = now_cpu, now
+
+    def summary(self) -> dict:
+        if not self.cpu_percent:
+            return {
+                "cpu_percent_mean": None,
+                "cpu_percent_max": None,
+                "rss_mb_max": None,
+            }
+        return {
+            "cpu_percent_mean": round(sum(self.cpu_percent) / len(self.cpu_percent), 1),
+            "cpu_percent_max": round(max(self.cpu_percent), 1),
+            "rss_mb_max": round(max(self.rss_mb), 1),
+        }
+
+
+class SimulatorUnderTest:
+    """The simulator started on localhost for the benchmark"""
+
+    ready_timeout = 600.0
+
+    def __init__(
+        self,
+        topology: Path,
+        port: int,
+        in_process: bool,
+        server_args: list[str],
+        log_path: Optional[Path] = None,
+    ):
+        self.topology = topology
+        self.url = f"opc.tcp://127.0.0.1:{port}/freeopcua/server"
+        self._endpoint = f"opc.tcp://0.0.0.0:{port}/freeopcua/server"
+        self.in_process = in_process
+        self._server_args = server_args
+        self._log_path = log_path
+        self._process: Optional[subprocess.Popen] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pid(self) -> int:
+        return os.getpid() if self.in_process else self._process.pid
+
+    async def start(self) -> PlantNodes:
+        """Start the simulator and wait until its plant is built"""
+        if self.in_process:
+            import main
+
+            self._task = asyncio.create_task(
+                main.main(self.topology, endpoint=self._endpoint)
+            )
+        else:
+            log = open(self._log_path or os.devnull, "w")
+            self._process = subprocess.Popen(
+                [
+                    sys.executable,
+                    "main.py",
+                    "--topology",
+                    str(self.topology),
+                    "--endpoint",
+                    self._endpoint,
+                    *self._server_args,
+                ],
+                cwd=ROOT,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+        return await self._wait_ready()
+
+    async def _wait_ready(self) -> PlantNodes:
+        """Browse the plant until two browses a second apart agree"""
+        deadline = time.monotonic() + self.ready_timeout
+        previous = -1
+        while time.monotonic() < deadline:
+            if self._process is not None and self._process.poll() is not None:
+                raise RuntimeError(f"Simulator exited with {self._process.returncode}")
+            if self._task is not None and self._task.done():
+                self._task.result()
+            try:
+                async with Client(self.url) as client:
+                    plant = await PlantNodes.browse(client)
+                if plant.variables and len(plant.variables) == previous:
+                    return plant
+                previous = len(plant.variables)
+            except (OSError, asyncio.TimeoutError, RuntimeError, asyncua.ua.UaError):
+                pass
+            await asyncio.sleep(1)
+        raise TimeoutError(f"Simulator not ready after {self.ready_timeout}s")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+
+
+async def measure(simulator: SimulatorUnderTest, scenario) -> dict:
+    """Run a scenario while sampling the server process"""
+    sampler = ProcessSampler(simulator.pid)
+    tasks = [asyncio.create_task(sampler.run())]
+    loop_lag = None
+    if simulator.in_process:
+        # Every wake-up of the scenario counts, not only the last few seconds
+        loop_lag = LoopLagMonitor(interval=0.01, window=None)
+        tasks.append(asyncio.create_task(loop_lag.run()))
+    try:
+        result = await scenario
+    finally:
+        for task in tasks:
+            task.cancel()
+    result["server"] = sampler.summary()
+    # In-process the clients run in the sampled process too
+    result["server"]["scope"] = "process" if simulator.in_process else "server"
+    result["server"]["loop_lag"] = (
+        None
+        if loop_lag is None
+        else {f"{key}_ms": value for key, value in loop_lag.percentiles().items()}
+    )
+    return result
+
+
+def metadata() -> dict:
+    """Describe the code and machine the benchmark ran on"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit or None,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "asyncua": asyncua.__version__ if hasattr(asyncua, "__version__") else None,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    simulator = SimulatorUnderTest(
+        args.topology,
+        args.port,
+        args.in_process,
+        shlex.split(args.server_args),
+        args.server_log,
+    )
+    results = {
+        "meta": metadata(),
+        "config": {
+            key: str(value) if isinstance(value, Path) else value
+            for key, value in vars(args).items()
+            if key not in ("output", "baseline", "server_log")
+        },
+        "scenarios": {},
+    }
+    scenarios = results["scenarios"]
+    try:
+        plant = await simulator.start()
+        print(f"Simulator ready with {len(plant.variables)} variables", flush=True)
+        url = simulator.url
+
+        if "subscriptions" in args.scenarios:
+            for interval in args.publishing_interval:
+                name = f"subscriptions_{interval:g}ms"
+                scenarios[name] = await measure(
+                    simulator,
+                    load_client.subscriptions(
+                        url, plant, args.sessions, args.items, interval, args.duration
+                    ),
+                )
+                print(name, json.dumps(scenarios[name]), flush=True)
+        if "bulk_read" in args.scenarios:
+            scenarios["bulk_read"] = await measure(
+                simulator, load_client.bulk_read(url, plant, args.duration)
+            )
+            print("bulk_read", json.dumps(scenarios["bulk_read"]), flush=True)
+        storms = {
+            "start_production": (plant.enterprise, plant.start_production, ()),
+            "run_test": (plant.quality_control, plant.run_test, ()),
+            "start_batches": (
+                plant.enterprise,
+                plant.start_batches,
+                (ALL_LINES, ua.Variant(["benchmark"], ua.VariantType.String)),
+            ),
+            "stop_batches": (plant.enterprise, plant.stop_batches, (ALL_LINES,)),
+        }
+        for name, (parent, method, arguments) in storms.items():
+            if name not in args.scenarios or method is None:
+                continue
+            scenarios[name] = await measure(
+                simulator,
+                load_client.method_storm(
+                    url,
+                    parent,
+                    method,
+                    args.method_sessions,
+                    args.method_concurrency,
+                    args.duration,
+                    arguments,
+                ),
+            )
+            print(name, json.dumps(scenarios[name]), flush=True)
+    finally:
+        await simulator.stop()
+    return results
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    """Numeric leaves of nested results as dotted keys"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(baseline: dict, results: dict):
+    """Print every metric next to its baseline value"""
+    old = flatten(baseline["scenarios"])
+    new = flatten(results["scenarios"])
+    print(f"\nCompared with {baseline['meta'].get('commit')}:")
+    for key in sorted(old.keys() & new.keys()):
+        change = (
+            f"{100 * (new[key] - old[key]) / old[key]:+.1f}%" if old[key] else "n/a"
+        )
+        print(f"  {key:<60} {old[key]:>12} -> {new[key]:>12} ({change})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end simulator benchmark")
+    parser.add_argument("--topology", type=Path, default=DEFAULT_TOPOLOGY)
+    parser.add_argument("--port", type=int, default=4850)
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Run the simulator on the benchmark's own event loop instead of a "
+        "subprocess, which also measures its event-loop lag; the CPU and RSS "
+        "then include the load clients",
+    )
+    parser.add_argument(
+        "--server-args",
+        default="",
+        help="Extra arguments of main.py, e.g. --server-args=--simulation-worker "
+        "(subprocess only)",
+    )
+    parser.add_argument("--server-log", type=Path, default=None)
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds each")
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--items", type=int, default=100, help="Per session")
+    parser.add_argument(
+        "--publishing-interval", type=float, nargs="+", default=[100.0, 1000.0]
+    )
+    parser.add_argument("--method-sessions", type=int, default=2)
+    parser.add_argument("--method-concurrency", type=int, default=8)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None)
+    args = parser.parse_args()
+    if args.in_process and args.server_args:
+        parser.error("--server-args only apply to a subprocess, not --in-process")
+
+    logging.basicConfig(level=logging.WARNING)
+    # Failed calls are counted as errors, not logged one by one
+    logging.getLogger("asyncua").setLevel(logging.ERROR)
+    if args.in_process:
+        # Keep the interval summaries of the simulator out of the report
+        logging.getLogger("main").setLevel(logging.WARNING)
+    results = asyncio.run(run(args))
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.baseline is not None:
+        compare(json.loads(args.baseline.read_text()), results)
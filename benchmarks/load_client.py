@@ -0,0 +1,244 @@
+"""
+Load scenarios driving the simulator with asyncua clients
+
+Every scenario returns a dict of plain numbers so the results can be saved
+as JSON and compared between versions.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+import time
+from typing import Optional
+from asyncua import Client, Node, ua
+
+# Variables read per Read request in the bulk read scenario
+READ_CHUNK = 1000
+
+
+class LatencyStats:
+    """Collects latency samples in seconds and summarizes them in ms"""
+
+    def __init__(self):
+        self.samples: list[float] = []
+
+    def __len__(self):
+        return len(self.samples)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def summary(self) -> dict[str, Optional[float]]:
+        """Percentiles of the samples in milliseconds"""
+        if not self.samples:
+            return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+        samples = sorted(self.samples)
+
+        def percentile(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1e3, 3)
+
+        return {
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(samples[-1] * 1e3, 3),
+        }
+
+
+def _age(timestamp: Optional[datetime]) -> Optional[float]:
+    """Seconds elapsed since a (UTC) source timestamp"""
+    if timestamp is None:
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - timestamp).total_seconds()
+
+
+class PlantNodes:
+    """Nodes of the plant found by browsing the ModelView tree once"""
+
+    def __init__(self):
+        self.variables: list[Node] = []
+        self.enterprise: Optional[Node] = None
+        self.start_production: Optional[Node] = None
+        self.start_batches: Optional[Node] = None
+        self.stop_batches: Optional[Node] = None
+        self.quality_control: Optional[Node] = None
+        self.run_test: Optional[Node] = None
+
+    def __str__(self):
+        return f"PlantNodes(variables={len(self.variables)})"
+
+    @classmethod
+    async def browse(cls, client: Client) -> "PlantNodes":
+        """Walk the ModelView tree, the plant may span several namespaces"""
+        plant = cls()
+        objects = client.nodes.objects
+        model_view = None
+        for reference in await objects.get_children_descriptions():
+            if reference.BrowseName.Name == "ModelView":
+                model_view = client.get_node(reference.NodeId)
+        if model_view is None:
+            raise RuntimeError("No ModelView folder on the server")
+
+        seen = set()
+        pending = [(model_view, None)]
+        while pending:
+            node, parent = pending.pop()
+            for reference in await node.get_children_descriptions():
+                nodeid = reference.NodeId
+                if nodeid in seen or nodeid.NamespaceIndex == 0:
+                    continue
+                seen.add(nodeid)
+                child = client.get_node(nodeid)
+                name = reference.BrowseName.Name
+                if reference.NodeClass == ua.NodeClass.Variable:
+                    plant.variables.append(child)
+                elif reference.NodeClass == ua.NodeClass.Method:
+                    if name == "StartProduction":
+                        plant.enterprise, plant.start_production = node, child
+                    elif name == "StartBatches":
+                        plant.start_batches = child
+                    elif name == "StopBatches":
+                        plant.stop_batches = child
+                    elif name == "RunTest" and plant.run_test is None:
+                        plant.quality_control, plant.run_test = node, child
+                elif reference.NodeClass == ua.NodeClass.Object:
+                    # The runtime metrics are not part of the plant
+                    if name != "Diagnostics":
+                        pending.append((child, node))
+        return plant
+
+
+class _DataChangeHandler:
+    """Counts notifications and their age relative to the source timestamp"""
+
+    def __init__(self, latency: LatencyStats):
+        self.notifications = 0
+        self._latency = latency
+
+    def datachange_notification(self, node, val, data):
+        self.notifications += 1
+        age = _age(data.monitored_item.Value.SourceTimestamp)
+        if age is not None:
+            self._latency.add(age)
+
+
+async def subscriptions(
+    url: str,
+    plant: PlantNodes,
+    sessions: int,
+    items: int,
+    publishing_interval: float,
+    duration: float,
+) -> dict:
+    """
+    N sessions subscribe to M variables each and count the notifications
+
+    Sessions subscribe to consecutive slices of the plant variables,
+    wrapping around when there are fewer variables than monitored items.
+    """
+    latency = LatencyStats()
+    handlers = [_DataChangeHandler(latency) for _ in range(sessions)]
+    clients = [Client(url) for _ in range(sessions)]
+    variables = plant.variables
+    try:
+        await asyncio.gather(*(client.connect() for client in clients))
+        for number, (client, handler) in enumerate(zip(clients, handlers)):
+            subscription = await client.create_subscription(
+                publishing_interval, handler
+            )
+            start = number * items
+            nodes = [variables[(start + i) % len(variables)] for i in range(items)]
+            await subscription.subscribe_data_change(nodes)
+
+        # Skip the initial notifications of every item
+        await asyncio.sleep(publishing_interval / 1e3 * 2)
+        before = sum(handler.notifications for handler in handlers)
+        latency.samples.clear()
+        started = time.perf_counter()
+        await asyncio.sleep(duration)
+        elapsed = time.perf_counter() - started
+        received = sum(handler.notifications for handler in handlers) - before
+    finally:
+        await asyncio.gather(
+            *(client.disconnect() for client in clients), return_exceptions=True
+        )
+    return {
+        "sessions": sessions,
+        "monitored_items": sessions * items,
+        "publishing_interval_ms": publishing_interval,
+        "notifications": received,
+        "notifications_per_s": round(received / elapsed, 1),
+        "latency": latency.summary(),
+    }
+
+
+async def bulk_read(url: str, plant: PlantNodes, duration: float) -> dict:
+    """Read the value of every plant variable over and over"""
+    latency = LatencyStats()
+    values = 0
+    nodes = plant.variables
+    async with Client(url) as client:
+        started = time.perf_counter()
+        while time.perf_counter() - started < duration:
+            read_started = time.perf_counter()
+            for offset in range(0, len(nodes), READ_CHUNK):
+                chunk = nodes[offset : offset + READ_CHUNK]
+                values += len(await client.read_values(chunk))
+            latency.add(time.perf_counter() - read_started)
+        elapsed = time.perf_counter() - started
+    return {
+        "variables": len(nodes),
+        "tree_reads": len(latency),
+        "values_per_s": round(values / elapsed, 1),
+        "tree_read_latency": latency.summary(),
+    }
+
+
+async def method_storm(
+    url: str,
+    parent: Node,
+    method: Node,
+    sessions: int,
+    concurrency: int,
+    duration: float,
+    arguments: tuple[ua.Variant, ...] = (),
+) -> dict:
+    """Call a method from `concurrency` callers per session as fast as possible"""
+    latency = LatencyStats()
+    errors = 0
+
+    async def caller(client: Client, deadline: float):
+        nonlocal errors
+        client_parent = client.get_node(parent.nodeid)
+        while time.perf_counter() < deadline:
+            call_started = time.perf_counter()
+            try:
+                await client_parent.call_method(method.nodeid, *arguments)
+            except ua.UaError:
+                errors += 1
+            latency.add(time.perf_counter() - call_started)
+
+    clients = [Client(url) for _ in range(sessions)]
+    try:
+        await asyncio.gather(*(client.connect() for client in clients))
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(
+                caller(client, started + duration)
+                for client in clients
+                for _ in range(concurrency)
+            )
+        )
+        elapsed = time.perf_counter() - started
+    finally:
+        await asyncio.gather(
+            *(client.disconnect() for client in clients), return_exceptions=True
+        )
+    return {
+        "callers": sessions * concurrency,
+        "calls": len(latency),
+        "errors": errors,
+        "calls_per_s": round(len(latency) / elapsed, 1),
+        "latency": latency.summary(),
+    }
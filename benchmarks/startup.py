@@ -0,0 +1,137 @@
+"""
+Startup-time benchmark of the address-space construction
+
+Builds the load-test plant scaled to a number of nodes on a fresh server and
+reports the cold build time, the time to save a snapshot and the warm start
+time from that snapshot.
+
+Usage:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --nodes 1000 10000 --json startup.json
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import logging
+from pathlib import Path
+import tempfile
+import time
+from asyncua import Server
+from address_space import AddressSpaceSnapshot
+from enterprise import Enterprise
+from topology import PlantTopology, build_plant, load_topology_file
+
+TOPOLOGY = Path(__file__).parent.parent / "topologies" / "load_test.toml"
+NAMESPACE = "https://kanapuli.github.io/dairy-enterprise"
+DEFAULT_NODES = [1_000, 10_000, 100_000]
+
+
+def scaled_topology(spec: dict, lines: int) -> PlantTopology:
+    """The topology with its production lines repeated `lines` times"""
+    spec = copy.deepcopy(spec)
+    spec["production_lines"][0]["repeat"] = lines
+    return PlantTopology(spec)
+
+
+async def start_server() -> tuple[Server, int]:
+    """A fresh, unstarted server with the plant namespace registered"""
+    server = Server()
+    await server.init()
+    idx = await server.register_namespace(NAMESPACE)
+    # The enterprise is a singleton, every run builds a new one
+    Enterprise._instance = None
+    return server, idx
+
+
+async def build(
+    topology: PlantTopology,
+    logger: logging.Logger,
+    snapshot: AddressSpaceSnapshot | None = None,
+) -> tuple[Server, int, float]:
+    """Build the plant, return the server, its plant node count and the time"""
+    server, idx = await start_server()
+    nodes_before = len(server.iserver.aspace._nodes)
+    start = time.perf_counter()
+    if snapshot is not None:
+        snapshot.install(server)
+    await build_plant(topology, server, idx, logger, snapshot)
+    elapsed = time.perf_counter() - start
+    return server, len(server.iserver.aspace._nodes) - nodes_before, elapsed
+
+
+async def nodes_per_line(spec: dict, logger: logging.Logger) -> tuple[int, int]:
+    """Count the fixed plant nodes and the nodes added by each production line"""
+    _, one_line, _ = await build(scaled_topology(spec, 1), logger)
+    _, two_lines, _ = await build(scaled_topology(spec, 2), logger)
+    per_line = two_lines - one_line
+    return one_line - per_line, per_line
+
+
+async def run(target_nodes: list[int], logger: logging.Logger) -> list[dict]:
+    spec = load_topology_file(TOPOLOGY)
+    fixed, per_line = await nodes_per_line(spec, logger)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for target in target_nodes:
+            lines = max(1, round((target - fixed) / per_line))
+            topology = scaled_topology(spec, lines)
+            server, nodes, cold = await build(topology, logger)
+
+            path = Path(tmp) / f"plant-{lines}.snapshot"
+            start = time.perf_counter()
+            snapshot = await AddressSpaceSnapshot.capture(server, str(lines))
+            snapshot.save(path)
+            save = time.perf_counter() - start
+
+            # A warm start loads the snapshot file, installs and binds it
+            start = time.perf_counter()
+            snapshot = AddressSpaceSnapshot.load(path)
+            load = time.perf_counter() - start
+            _, _, warm = await build(topology, logger, snapshot)
+            warm += load
+
+            results.append(
+                {
+                    "target_nodes": target,
+                    "nodes": nodes,
+                    "production_lines": lines,
+                    "cold_build_s": round(cold, 3),
+                    "snapshot_save_s": round(save, 3),
+                    "warm_start_s": round(warm, 3),
+                    "nodes_per_s": round(nodes / cold),
+                }
+            )
+            print(
+                f"{target:>9} {nodes:>9} {lines:>6} {cold:>10.2f}"
+                f" {save:>9.2f} {warm:>9.2f} {nodes / cold:>10.0f}",
+                flush=True,
+            )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Address-space startup benchmark")
+    parser.add_argument(
+        "--nodes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_NODES,
+        help="Approximate plant sizes to build, in nodes",
+    )
+    parser.add_argument(
+        "--json", type=Path, default=None, help="Also write the results to a file"
+    )
+    args = parser.parse_args()
+
+    # Per-node logging would dominate the measurement
+    logging.basicConfig(level=logging.WARNING)
+    print(
+        f"{'target':>9} {'nodes':>9} {'lines':>6} {'cold (s)':>10}"
+        f" {'save (s)':>9} {'warm (s)':>9} {'nodes/s':>10}"
+    )
+    results = asyncio.run(run(args.nodes, logging.getLogger("benchmark")))
+    if args.json is not None:
+        args.json.write_text(json.dumps(results, indent=2))
@@ -0,0 +1,16 @@
+from .loop_lag import LoopLagMonitor
+from .metrics import RuntimeMetrics, resident_memory_mb
+from .diagnostics import Diagnostics
+from .profiler import Profiler
+from .logs import LogSummary, log_summary, queued_logging
+
+__all__ = [
+    "LoopLagMonitor",
+    "RuntimeMetrics",
+    "resident_memory_mb",
+    "Diagnostics",
+    "Profiler",
+    "LogSummary",
+    "log_summary",
+    "queued_logging",
+]
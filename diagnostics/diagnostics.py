@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable, Optional
+from asyncua import Node, Server, ua
+from address_space import NodeBuilder
+from simulation import BatchWriter, SimulatedVariable
+from .metrics import RuntimeMetrics
+
+# Diagnostics variables: name -> (variant type, value in the metrics)
+VARIABLES: dict[str, tuple[ua.VariantType, Callable[[dict], Any]]] = {
+    "WritesPerSecond": (ua.VariantType.Double, lambda m: m["writes_per_second"]),
+    "TicksPerSecond": (ua.VariantType.Double, lambda m: m["ticks_per_second"]),
+    "SimulationSpeed": (ua.VariantType.Double, lambda m: m["simulation_speed"]),
+    "LoopLagP50Ms": (ua.VariantType.Double, lambda m: m["loop_lag_ms"]["p50"]),
+    "LoopLagP95Ms": (ua.VariantType.Double, lambda m: m["loop_lag_ms"]["p95"]),
+    "LoopLagP99Ms": (ua.VariantType.Double, lambda m: m["loop_lag_ms"]["p99"]),
+    "LoopLagMaxMs": (ua.VariantType.Double, lambda m: m["loop_lag_ms"]["max"]),
+    "AsyncioTasks": (ua.VariantType.Int32, lambda m: m["asyncio_tasks"]),
+    "ActiveSessions": (ua.VariantType.Int32, lambda m: m["active_sessions"]),
+    "MonitoredItems": (ua.VariantType.Int32, lambda m: m["monitored_items"]),
+    "ResidentMemoryMb": (ua.VariantType.Double, lambda m: m["resident_memory_mb"]),
+    "SheddingLevel": (ua.VariantType.Int32, lambda m: m["shedding_level"]),
+    "DeferredWrites": (ua.VariantType.Int32, lambda m: m["deferred_writes"]),
+    "CoalescedWrites": (ua.VariantType.Int64, lambda m: m["coalesced_writes"]),
+}
+
+# Variables of every rate group: name -> (variant type, key in the group metrics)
+RATE_GROUP_VARIABLES: dict[str, tuple[ua.VariantType, str]] = {
+    "ScheduledPeriod": (ua.VariantType.Double, "period"),
+    "ActualPeriod": (ua.VariantType.Double, "actual_period"),
+    "LastTickDuration": (ua.VariantType.Double, "last_duration"),
+    "Ticks": (ua.VariantType.Int64, "ticks"),
+    "Overruns": (ua.VariantType.Int64, "overruns"),
+    "SkippedTicks": (ua.VariantType.Int64, "skipped"),
+    "Variables": (ua.VariantType.Int32, "variables"),
+}
+
+
+class Diagnostics:
+    """
+    Live runtime metrics of the simulator as OPC UA variables
+
+    A `Diagnostics` object under the enterprise node holds the process-wide
+    metrics and one `RateGroup <period>s` object per scheduler rate group.
+    The values are refreshed every `period` seconds and optionally dumped
+    to a local JSON (.json) or text file.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        parent_node: Node,
+        idx: int,
+        server: Server,
+        metrics: RuntimeMetrics,
+        name: str = "Diagnostics",
+    ):
+        self.name = name
+        self._logger = logger
+        self._parent_node = parent_node
+        self._idx = idx
+        self._metrics = metrics
+        # Writes of the diagnostics are not counted as simulation writes
+        self._writer = BatchWriter(server, logger)
+        self.node: Optional[Node] = None
+        self._variables: dict[str, SimulatedVariable] = {}
+        self._rate_groups: dict[float, dict[str, SimulatedVariable]] = {}
+
+    def __str__(self):
+        return f"Diagnostics(name={self.name})"
+
+    def _add_variable(
+        self, builder: NodeBuilder, parent: Node, name: str, vtype: ua.VariantType
+    ) -> SimulatedVariable:
+        value = 0.0 if vtype == ua.VariantType.Double else 0
+        node = builder.add_variable(parent, self._idx, name, value, vtype)
+        return SimulatedVariable(node, vtype, value)
+
+    async def initialize(self) -> Node:
+        """Create the diagnostics object and its variables"""
+        builder = NodeBuilder(self._parent_node.session)
+        self.node = builder.add_object(self._parent_node, self._idx, self.name)
+        for name, (vtype, _) in VARIABLES.items():
+            self._variables[name] = self._add_variable(builder, self.node, name, vtype)
+        await builder.commit()
+        self._logger.info(f"Created diagnostics node: {self.name}")
+        return self.node
+
+    async def _rate_group(self, period: float) -> dict[str, SimulatedVariable]:
+        """Get the variables of a rate group, creating them on first use"""
+        variables = self._rate_groups.get(period)
+        if variables is None:
+            builder = NodeBuilder(self.node.session)
+            node = builder.add_object(self.node, self._idx, f"RateGroup {period:g}s")
+            variables = {
+                name: self._add_variable(builder, node, name, vtype)
+                for name, (vtype, _) in RATE_GROUP_VARIABLES.items()
+            }
+            await builder.commit()
+            self._rate_groups[period] = variables
+        return variables
+
+    async def update(self) -> dict[str, Any]:
+        """Sample the metrics and write them to the address space"""
+        metrics = self._metrics.sample()
+        changed = []
+        for name, (_, value) in VARIABLES.items():
+            variable = self._variables[name]
+            variable.value = variable.published = value(metrics)
+            changed.append(variable)
+        for group in metrics["rate_groups"]:
+            variables = await self._rate_group(group["period"])
+            for name, (_, key) in RATE_GROUP_VARIABLES.items():
+                variables[name].value = variables[name].published = group[key]
+                changed.append(variables[name])
+        await self._writer.write(changed)
+        return metrics
+
+    @staticmethod
+    def dump(metrics: dict[str, Any], path: Path):
+        """Write the metrics to a JSON file, or a text file for other suffixes"""
+        if path.suffix == ".json":
+            content = json.dumps(metrics, indent=2)
+        else:
+            lines = [
+                f"{key} {value}"
+                for key, value in metrics.items()
+                if not isinstance(value, (dict, list))
+            ]
+            lines += [f"loop_lag_ms_{p} {v}" for p, v in metrics["loop_lag_ms"].items()]
+            for group in metrics["rate_groups"]:
+                prefix = f"rate_group_{group['period']:g}s"
+                lines += [
+                    f"{prefix}_{key} {value}"
+                    for key, value in group.items()
+                    if key != "period"
+                ]
+            content = "\n".join(lines) + "\n"
+        # Replace the file at once so readers never see a partial dump
+        temporary = path.with_name(f".{path.name}.tmp")
+        temporary.write_text(content)
+        os.replace(temporary, path)
+
+    async def run(self, period: float = 1.0, dump_path: Optional[Path] = None):
+        """Refresh the diagnostics every `period` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(period)
+            try:
+                metrics = await self.update()
+                if dump_path is not None:
+                    self.dump(metrics, dump_path)
+            except Exception:
+                self._logger.exception(f"Failed to update {self}")
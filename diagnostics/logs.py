@@ -0,0 +1,146 @@
+import asyncio
+import contextlib
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import time
+from typing import Iterator
+
+
+class ValueStats:
+    """Number of updates and min/max/last value of one simulated value"""
+
+    __slots__ = ("count", "minimum", "maximum", "last")
+
+    def __init__(self, value: float):
+        self.count = 1
+        self.minimum = self.maximum = self.last = value
+
+    def add(self, value: float):
+        self.count += 1
+        self.last = value
+        if value < self.minimum:
+            self.minimum = value
+        elif value > self.maximum:
+            self.maximum = value
+
+
+class LogSummary:
+    """
+    Aggregates per-tick values and logs them once per interval
+
+    Simulation loops call `record` instead of logging every value. `flush`
+    logs one line per value name over all components at `level`, and one
+    line per component at DEBUG. Nothing is collected or formatted while
+    the logger does not log at `level`.
+    """
+
+    def __init__(self, logger: logging.Logger, level: int = logging.INFO):
+        self._logger = logger
+        self._level = level
+        self._stats: dict[tuple[str, str], ValueStats] = {}
+        self._started = time.monotonic()
+
+    def __str__(self):
+        return f"LogSummary(logger={self._logger.name}, values={len(self._stats)})"
+
+    def record(self, component: str, name: str, value: float):
+        """Account an update of the value `name` of `component`"""
+        if not self._logger.isEnabledFor(self._level):
+            return
+        stats = self._stats.get((component, name))
+        if stats is None:
+            self._stats[(component, name)] = ValueStats(value)
+        else:
+            stats.add(value)
+
+    def flush(self):
+        """Log the values recorded since the last flush and reset them"""
+        now = time.monotonic()
+        elapsed, self._started = now - self._started, now
+        stats, self._stats = self._stats, {}
+        if not stats or not self._logger.isEnabledFor(self._level):
+            return
+
+        totals: dict[str, list] = {}
+        for (component, name), value in stats.items():
+            total = totals.get(name)
+            if total is None:
+                totals[name] = [1, value.count, value.minimum, value.maximum]
+            else:
+                total[0] += 1
+                total[1] += value.count
+                total[2] = min(total[2], value.minimum)
+                total[3] = max(total[3], value.maximum)
+        self._logger.log(
+            self._level,
+            "Simulated over %.1fs: %s",
+            elapsed,
+            "; ".join(
+                f"{name} {components} components, {count} updates, "
+                f"min {minimum:g}, max {maximum:g}"
+                for name, (components, count, minimum, maximum) in totals.items()
+            ),
+        )
+        if self._logger.isEnabledFor(logging.DEBUG):
+            for (component, name), value in stats.items():
+                self._logger.debug(
+                    "%s %s: %d updates, min %g, max %g, last %g",
+                    component,
+                    name,
+                    value.count,
+                    value.minimum,
+                    value.maximum,
+                    value.last,
+                )
+
+    async def run(self, interval: float = 10.0):
+        """Flush every `interval` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            self.flush()
+
+
+_summaries: dict[str, LogSummary] = {}
+
+
+def log_summary(logger: logging.Logger) -> LogSummary:
+    """The summary of a logger, shared like the logger itself"""
+    summary = _summaries.get(logger.name)
+    if summary is None:
+        summary = _summaries[logger.name] = LogSummary(logger)
+    return summary
+
+
+class _LocalQueueHandler(QueueHandler):
+    """Queues the record as is, the listener thread formats it"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+@contextlib.contextmanager
+def queued_logging() -> Iterator[QueueListener]:
+    """
+    Move the handlers of the root logger to a background thread
+
+    Records are put on a queue by the event loop thread and formatted and
+    written by a `QueueListener`, so slow terminals or files do not block
+    the simulation.
+    """
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    handler = _LocalQueueHandler(records)
+    for original in handlers:
+        root.removeHandler(original)
+    root.addHandler(handler)
+    listener.start()
+    try:
+        yield listener
+    finally:
+        listener.stop()
+        root.removeHandler(handler)
+        for original in handlers:
+            root.addHandler(original)
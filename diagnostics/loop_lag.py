@@ -0,0 +1,44 @@
+import asyncio
+from collections import deque
+import time
+from typing import Optional
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a task sleeping `interval`
+
+    The lag of the last `window` wake-ups is kept, so the percentiles
+    reflect the last few seconds of load; with no window every wake-up is.
+    """
+
+    def __init__(self, interval: float = 0.05, window: Optional[int] = 200):
+        self._interval = interval
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def __str__(self):
+        return f"LoopLagMonitor(samples={len(self._samples)})"
+
+    async def run(self):
+        """Sample the lag until cancelled"""
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self._interval)
+            lag = time.monotonic() - started - self._interval
+            self._samples.append(max(0.0, lag))
+
+    def percentiles(self) -> dict[str, float]:
+        """p50, p95, p99 and max lag of the window in milliseconds"""
+        if not self._samples:
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+        samples = sorted(self._samples)
+
+        def percentile(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1e3, 3)
+
+        return {
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": round(samples[-1] * 1e3, 3),
+        }
@@ -0,0 +1,110 @@
+import asyncio
+import resource
+import time
+from typing import Any
+from asyncua import Server
+from asyncua.server.internal_session import SessionState
+from simulation import BatchWriter, Scheduler
+from .loop_lag import LoopLagMonitor
+
+
+def resident_memory_mb() -> float:
+    """Current RSS of the process, peak RSS where /proc is not available"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RuntimeMetrics:
+    """
+    Collects the runtime numbers of the simulator
+
+    Rates (writes and ticks per second, simulated seconds per second) are
+    computed between two calls of `sample`, in real time.
+    """
+
+    def __init__(
+        self,
+        server: Server,
+        scheduler: Scheduler,
+        writer: BatchWriter,
+        loop_lag: LoopLagMonitor,
+    ):
+        self._server = server
+        self._scheduler = scheduler
+        self._writer = writer
+        self._loop_lag = loop_lag
+        self._last_writes = writer.writes
+        self._last_ticks = self._ticks()
+        self._last_simulated = scheduler.clock.monotonic()
+        self._last_sample = time.monotonic()
+
+    def _monitored_items(self) -> int:
+        subscriptions = self._server.iserver.subscription_service.subscriptions
+        return sum(
+            len(subscription.monitored_item_srv._monitored_items)
+            for subscription in subscriptions.values()
+        )
+
+    def _active_sessions(self) -> int:
+        """Client sessions activated on the open connections"""
+        count = 0
+        for transport in self._server.iserver.asyncio_transports:
+            processor = getattr(transport.get_protocol(), "processor", None)
+            session = getattr(processor, "session", None)
+            if session is not None and session.state == SessionState.Activated:
+                count += 1
+        return count
+
+    def _ticks(self) -> int:
+        return sum(group.ticks for group in self._scheduler.rate_groups)
+
+    def sample(self) -> dict[str, Any]:
+        """Get the current metrics as plain numbers"""
+        now = time.monotonic()
+        writes = self._writer.writes
+        ticks = self._ticks()
+        simulated = self._scheduler.clock.monotonic()
+        elapsed = now - self._last_sample
+
+        def rate(count: float, last: float) -> float:
+            return (count - last) / elapsed if elapsed else 0.0
+
+        writes_per_second = rate(writes, self._last_writes)
+        ticks_per_second = rate(ticks, self._last_ticks)
+        simulation_speed = rate(simulated, self._last_simulated)
+        self._last_writes, self._last_sample = writes, now
+        self._last_ticks, self._last_simulated = ticks, simulated
+        shedder = self._scheduler.shedder
+
+        return {
+            "writes_per_second": round(writes_per_second, 1),
+            "ticks_per_second": round(ticks_per_second, 1),
+            "simulation_speed": round(simulation_speed, 2),
+            "simulated_time": self._scheduler.clock.now().isoformat(),
+            "loop_lag_ms": self._loop_lag.percentiles(),
+            "asyncio_tasks": len(asyncio.all_tasks()),
+            "active_sessions": self._active_sessions(),
+            "monitored_items": self._monitored_items(),
+            "resident_memory_mb": round(resident_memory_mb(), 1),
+            "shedding_level": 0 if shedder is None else shedder.level,
+            "deferred_writes": 0 if shedder is None else shedder.deferred,
+            "coalesced_writes": 0 if shedder is None else shedder.coalesced,
+            "rate_groups": [
+                {
+                    "period": group.period,
+                    "actual_period": round(group.actual_period, 4),
+                    "last_duration": round(group.last_duration, 4),
+                    "ticks": group.ticks,
+                    "overruns": group.overruns,
+                    "skipped": group.skipped,
+                    "variables": len(group),
+                }
+                for group in self._scheduler.rate_groups
+            ],
+        }
@@ -0,0 +1,187 @@
+import asyncio
+import cProfile
+import io
+import logging
+from pathlib import Path
+import pstats
+import time
+import tracemalloc
+from typing import Optional
+from asyncua import Node, ua
+from asyncua.common.methods import uamethod
+from address_space import NodeBuilder
+
+# Frames kept per allocation traced by tracemalloc
+TRACEMALLOC_FRAMES = 10
+# Lines of the text summaries
+TOP_ENTRIES = 50
+
+
+class Profiler:
+    """
+    Profiles the running simulator on demand
+
+    `StartProfiling(duration)`, `StopProfiling()` and `SnapshotMemory()`
+    methods on the parent node switch cProfile and tracemalloc on for at
+    most `max_duration` seconds and write the stats to `output_dir`:
+    a `.prof` file for pstats/snakeviz and `.txt` summaries.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        parent_node: Node,
+        idx: int,
+        output_dir: Path,
+        max_duration: float = 300.0,
+    ):
+        self._logger = logger
+        self._parent_node = parent_node
+        self._idx = idx
+        self.output_dir = output_dir
+        self.max_duration = max_duration
+        self._profile: Optional[cProfile.Profile] = None
+        self._started = 0.0
+        self._timeout: Optional[asyncio.TimerHandle] = None
+        # Whether tracemalloc was started here, and so is stopped here too
+        self._tracing = False
+
+    def __str__(self):
+        return f"Profiler(output_dir={self.output_dir}, active={self.active})"
+
+    @property
+    def active(self) -> bool:
+        return self._profile is not None
+
+    async def initialize(self, builder: Optional[NodeBuilder] = None):
+        """Add the profiling methods to the parent node"""
+        own_builder = builder is None
+        if own_builder:
+            builder = NodeBuilder(self._parent_node.session)
+        builder.add_method(
+            self._parent_node,
+            self._idx,
+            "StartProfiling",
+            self._start_profiling,
+            [ua.VariantType.Double],
+            [ua.VariantType.String],
+        )
+        builder.add_method(
+            self._parent_node,
+            self._idx,
+            "StopProfiling",
+            self._stop_profiling,
+            [],
+            [ua.VariantType.String],
+        )
+        builder.add_method(
+            self._parent_node,
+            self._idx,
+            "SnapshotMemory",
+            self._snapshot_memory,
+            [],
+            [ua.VariantType.String],
+        )
+        if own_builder:
+            await builder.commit()
+
+    def _path(self, kind: str, suffix: str) -> Path:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        milliseconds = int(time.time() * 1000) % 1000
+        timestamp = f"{time.strftime('%Y%m%d-%H%M%S')}.{milliseconds:03d}"
+        return self.output_dir / f"{kind}-{timestamp}{suffix}"
+
+    def start(self, duration: float) -> float:
+        """
+        Profile the event loop thread for `duration` seconds
+
+        A duration of zero or more than `max_duration` is capped to
+        `max_duration`, so a forgotten session cannot slow the simulator
+        down indefinitely. Returns the effective duration.
+        """
+        if self.active:
+            raise RuntimeError(f"{self} is already profiling")
+        if duration <= 0 or duration > self.max_duration:
+            duration = self.max_duration
+        self._tracing = not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        self._started = time.monotonic()
+        self._timeout = asyncio.get_running_loop().call_later(duration, self.stop)
+        self._logger.info(f"Profiling for {duration}s into {self.output_dir}")
+        return duration
+
+    def stop(self) -> Path:
+        """Stop profiling and write the CPU and memory stats, return the .prof path"""
+        if not self.active:
+            raise RuntimeError(f"{self} is not profiling")
+        self._profile.disable()
+        profile, self._profile = self._profile, None
+        self._timeout.cancel()
+        elapsed = time.monotonic() - self._started
+        # Before the CPU stats are processed, which allocate themselves
+        self.snapshot_memory()
+        if self._tracing:
+            # Leave tracing on when it was started elsewhere, e.g. PYTHONTRACEMALLOC
+            tracemalloc.stop()
+            self._tracing = False
+
+        path = self._path("profile", ".prof")
+        profile.dump_stats(path)
+        summary = io.StringIO()
+        stats = pstats.Stats(profile, stream=summary)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_ENTRIES)
+        path.with_suffix(".txt").write_text(summary.getvalue())
+        self._logger.info(f"Profiled {elapsed:.1f}s, stats written to {path}")
+        return path
+
+    def snapshot_memory(self) -> Path:
+        """Write the traced allocations, grouped by line, return the .txt path"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("Memory allocations are only traced while profiling")
+        # Leave out the allocations of the profilers themselves
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, cProfile.__file__),
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            ]
+        )
+        path = self._path("memory", ".txt")
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"Traced memory: {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB"
+        ]
+        lines += [str(stat) for stat in snapshot.statistics("lineno")[:TOP_ENTRIES]]
+        path.write_text("\n".join(lines) + "\n")
+        # The full snapshot can be compared with another one via tracemalloc
+        snapshot.dump(str(path.with_suffix(".tracemalloc")))
+        self._logger.info(f"Memory snapshot written to {path}")
+        return path
+
+    # The methods are coroutines: asyncua runs plain functions in a thread
+    # pool, where cProfile would only see that thread
+    @uamethod
+    async def _start_profiling(self, parent, duration: float):
+        try:
+            return f"Profiling for {self.start(duration)}s into {self.output_dir}"
+        except RuntimeError as e:
+            self._logger.warning(e)
+            return ua.StatusCode(ua.StatusCodes.BadInvalidState)
+
+    @uamethod
+    async def _stop_profiling(self, parent):
+        try:
+            return str(self.stop())
+        except RuntimeError as e:
+            self._logger.warning(e)
+            return ua.StatusCode(ua.StatusCodes.BadInvalidState)
+
+    @uamethod
+    async def _snapshot_memory(self, parent):
+        try:
+            return str(self.snapshot_memory())
+        except RuntimeError as e:
+            self._logger.warning(e)
+            return ua.StatusCode(ua.StatusCodes.BadInvalidState)
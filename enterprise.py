@@ -1,13 +1,17 @@
 import asyncio
-from asyncio import Task
 import logging
 import random
 from asyncua import Server, ua, Node
+from production_line.equipment import Equipment
 from production_line.production_line import ProductionLine
-from storage import MilkStorageTank, ColdStorage
+from storage import Storage, MilkStorageTank, ColdStorage
 from asyncua.common.methods import uamethod
-from typing import Optional
+from typing import Awaitable, Callable, Iterable, Optional
 from quality_control.milk_quality_control import get_milk_quality_control
+from simulation import CRITICAL, BatchWriter, Scheduler, SimulatedVariable
+from address_space import AddressSpaceSnapshot, NodeBuilder, argument
+from diagnostics import log_summary
+from alarms import AlarmEngine
 
 
 class Enterprise:
@@ -16,7 +20,13 @@ class Enterprise:
     """
 
     _instance = None
-    _total_milk_processed: Optional[Node] = None
+    storage_types: dict[str, type[Storage]] = {
+        "MilkStorageTank": MilkStorageTank,
+        "ColdStorage": ColdStorage,
+    }
+    default_storage = [{"type": "MilkStorageTank"}, {"type": "ColdStorage"}]
+    default_quality_controls = ["Milk Quality Control"]
+    _total_milk_processed: Optional[SimulatedVariable] = None
     _production_status: Optional[Node] = None
 
     def __init__(
@@ -26,17 +36,36 @@ class Enterprise:
         server: Server,
         idx: int,
         production_lines: list[ProductionLine],
+        storage: Optional[list[dict[str, str]]] = None,
+        quality_controls: Optional[list[str]] = None,
     ) -> None:
         # Initialize instance attributes
         self.name = name
         self._logger = logger
+        self._summary = log_summary(logger)
+        self._random = random
         self._server = server
         self._idx = idx
         self._initialized = False
         self._production_lines = production_lines
+        self._storage = self.default_storage if storage is None else storage
+        self._quality_control_names = (
+            self.default_quality_controls
+            if quality_controls is None
+            else quality_controls
+        )
+        self._storage_units: list[Storage] = []
         self._milk_storage: Optional[MilkStorageTank] = None
         self._cold_storage: Optional[ColdStorage] = None
+        self._quality_controls = []
         self._quality_control = None
+        self._writer: Optional[BatchWriter] = None
+        self._scheduler: Optional[Scheduler] = None
+        self._storage_connections = 0
+        # Awaited with the variables added and removed while the plant runs
+        self.variable_listeners: list[
+            Callable[[list[SimulatedVariable], list[SimulatedVariable]], Awaitable]
+        ] = []
 
     @classmethod
     async def create(
@@ -46,100 +75,356 @@ class Enterprise:
         server: Server,
         idx: int,
         production_lines: list[ProductionLine],
+        storage: Optional[list[dict[str, str]]] = None,
+        quality_controls: Optional[list[str]] = None,
+        snapshot: Optional[AddressSpaceSnapshot] = None,
     ):
         if not cls._instance:
             # Create new instance
-            cls._instance = cls(name, logger, server, idx, production_lines)
-            # Perform async initialization
-            await cls._instance._initialize()
-            await cls._instance._initialize_storage()
+            cls._instance = cls(
+                name, logger, server, idx, production_lines, storage, quality_controls
+            )
+            if snapshot is not None:
+                # The nodes already exist, only bind them
+                await cls._instance._bind(snapshot)
+            else:
+                # Perform async initialization, the quality control and
+                # storage subtrees are independent and built concurrently
+                await cls._instance._initialize()
+                await asyncio.gather(
+                    cls._instance._initialize_quality_controls(),
+                    cls._instance._initialize_storage(),
+                )
             cls._instance._initialized = True
         return cls._instance
 
+    async def _bind(self, snapshot: AddressSpaceSnapshot):
+        """Bind the enterprise to its nodes in an address-space snapshot"""
+        model_view = snapshot.child(self._server.get_objects_node(), "ModelView")
+        self.node = snapshot.child(model_view, self.name)
+
+        quality_control_idx = self._idx + 2000
+        for quality_control_name in self._quality_control_names:
+            quality_control = await get_milk_quality_control(
+                self.node,
+                quality_control_idx,
+                self._logger,
+                name=quality_control_name,
+                snapshot=snapshot,
+            )
+            self._quality_controls.append(quality_control)
+        self._quality_control = next(iter(self._quality_controls), None)
+
+        self._total_milk_processed = snapshot.variable(
+            self.node, "TotalMilkProcessed", self._next_total_milk_processed
+        )
+        self._production_status = snapshot.child(self.node, "ProductionStatus")
+        snapshot.link_method(self.node, "StartProduction", self._start_production)
+        snapshot.link_method(self.node, "StopProduction", self._stop_production)
+        snapshot.link_method(self.node, "StartBatches", self._start_batches)
+        snapshot.link_method(self.node, "StopBatches", self._stop_batches)
+
+        storage_node = snapshot.child(self.node, "Storage")
+        for storage_unit in self._create_storage_units(storage_node):
+            storage_unit.bind(snapshot)
+        self._logger.info(f"Bound enterprise node: {self.name} from {snapshot}")
+
+    def _create_storage_units(self, storage_node: Node) -> list[Storage]:
+        """Create the storage unit objects declared for the enterprise"""
+        storage_idx = self._idx + 1000
+        for spec in self._storage:
+            storage_type = self.storage_types[spec["type"]]
+            kwargs = {"name": spec["name"]} if "name" in spec else {}
+            self._storage_units.append(
+                storage_type(self._logger, storage_node, storage_idx, **kwargs)
+            )
+
+        # The first unit of each type is exposed as the enterprise's tank/storage
+        self._milk_storage = next(
+            (u for u in self._storage_units if isinstance(u, MilkStorageTank)), None
+        )
+        self._cold_storage = next(
+            (u for u in self._storage_units if isinstance(u, ColdStorage)), None
+        )
+        return self._storage_units
+
     async def _initialize_storage(self):
         """Initialize storage units"""
         # Create storage folder node
         storage_idx = self._idx + 1000
-        storage_node = await self.node.add_object(storage_idx, "Storage")
-        await self.node.add_reference(storage_node, ua.ObjectIds.Organizes)
+        builder = NodeBuilder(self.node.session)
+        storage_node = builder.add_object(self.node, storage_idx, "Storage")
+        builder.add_reference(self.node, storage_node, ua.ObjectIds.Organizes)
 
-        # Initialize milk storage tank
-        self._milk_storage = MilkStorageTank(
-            self._logger,
-            storage_node,
-            storage_idx,
-        )
-        await self._milk_storage.initialize()
-
-        # Initialize cold storage
-        self._cold_storage = ColdStorage(
-            self._logger,
-            storage_node,
-            storage_idx,
-        )
-        await self._cold_storage.initialize()
+        for storage_unit in self._create_storage_units(storage_node):
+            await storage_unit.initialize(builder)
 
+        await builder.commit()
         self._logger.info("Storage units initialized")
 
+    async def _initialize_quality_controls(self):
+        """Initialize the quality control systems"""
+        quality_control_idx = (
+            self._idx + 2000
+        )  # Using 2000 to avoid conflicts with storage (1000)
+        builder = NodeBuilder(self.node.session)
+        for quality_control_name in self._quality_control_names:
+            quality_control = await get_milk_quality_control(
+                self.node,
+                quality_control_idx,
+                self._logger,
+                name=quality_control_name,
+                builder=builder,
+            )
+            builder.add_reference(
+                self.node, quality_control.node, ua.ObjectIds.Organizes
+            )
+            self._quality_controls.append(quality_control)
+        self._quality_control = next(iter(self._quality_controls), None)
+
+        await builder.commit()
+        self._logger.info("Quality control system initialized")
+
     async def _initialize(self):
         """Add the enterprise node to the OPC UA server"""
 
         objects = self._server.get_objects_node()
-        model_view = await objects.add_folder(self._idx, "ModelView")
-        self.node = await model_view.add_object(self._idx, self.name)
-        # Add a child reference
-        await model_view.delete_reference(self.node, ua.ObjectIds.Organizes)
-        await model_view.add_reference(self.node, ua.ObjectIds.HasChild)
-        self._logger.info(f"Created enterprise node: {self.name}")
-
-        # Initialize quality control
-        quality_control_idx = (
-            self._idx + 2000
-        )  # Using 2000 to avoid conflicts with storage (1000)
-        self._quality_control = await get_milk_quality_control(
-            self.node,
-            quality_control_idx,
-            self._logger,
+        builder = NodeBuilder(objects.session)
+        model_view = builder.add_folder(objects, self._idx, "ModelView")
+        # Add the enterprise as a child of the model view
+        self.node = builder.add_object(
+            model_view, self._idx, self.name, reference_type=ua.ObjectIds.HasChild
         )
-        await self.node.add_reference(
-            self._quality_control.node, ua.ObjectIds.Organizes
-        )
-        self._logger.info("Quality control system initialized")
 
         for production_line in self._production_lines:
-            await self.node.add_reference(production_line.node, ua.ObjectIds.Organizes)
+            builder.add_reference(
+                self.node, production_line.node, ua.ObjectIds.Organizes
+            )
+
+        total_milk_processed = builder.add_variable(
+            self.node, self._idx, "TotalMilkProcessed", 0.0, ua.VariantType.Double
+        )
+        self._total_milk_processed = SimulatedVariable(
+            total_milk_processed,
+            ua.VariantType.Double,
+            0.0,
+            self._next_total_milk_processed,
+        )
 
-        self._total_milk_processed = await self.node.add_variable(
-            self._idx, "TotalMilkProcessed", 0.0, ua.VariantType.Double
+        self._production_status = builder.add_variable(
+            self.node, self._idx, "ProductionStatus", False, ua.VariantType.Boolean
         )
 
-        self._production_status = await self.node.add_variable(
-            self._idx, "ProductionStatus", False, ua.VariantType.Boolean
+        builder.add_method(
+            self.node, self._idx, "StartProduction", self._start_production
+        )
+        builder.add_method(
+            self.node, self._idx, "StopProduction", self._stop_production
+        )
+        lines = argument(ua.VariantType.String, "Lines", array=True)
+        results = argument(ua.VariantType.StatusCode, "Results", array=True)
+        builder.add_method(
+            self.node,
+            self._idx,
+            "StartBatches",
+            self._start_batches,
+            [lines, argument(ua.VariantType.String, "BatchIds", array=True)],
+            [results],
+        )
+        builder.add_method(
+            self.node, self._idx, "StopBatches", self._stop_batches, [lines], [results]
         )
 
-        await self.node.add_method(self._idx, "StartProduction", self._start_production)
-        await self.node.add_method(self._idx, "StopProduction", self._stop_production)
+        await builder.commit()
+        self._logger.info(f"Created enterprise node: {self.name}")
 
     @uamethod
-    async def _start_production(self):
+    async def _start_production(self, parent):
         """Start the production"""
         await self._production_status.write_value(True)
         self._logger.info(f"Production started for {self.name}")
 
     @uamethod
-    async def _stop_production(self):
+    async def _stop_production(self, parent):
         """Stop the production"""
         await self._production_status.write_value(False)
         self._logger.info(f"Production stopped for {self.name}")
 
+    @uamethod
+    async def _start_batches(self, parent, lines: list[str], batch_ids: list[str]):
+        """
+        Start a batch on every given line, return a status code per line
+
+        No lines means every production line, a single batch id is used
+        for all lines.
+        """
+        lines = lines or [line.name for line in self._production_lines]
+        batch_ids = batch_ids or []
+        if len(batch_ids) == 1:
+            batch_ids = batch_ids * len(lines)
+        if len(batch_ids) != len(lines):
+            self._logger.warning(
+                f"StartBatches got {len(batch_ids)} batch ids for {len(lines)} lines"
+            )
+            return ua.StatusCode(ua.StatusCodes.BadInvalidArgument)
+        return await self._apply_batches(
+            lines, lambda line, number: line.begin_batch(batch_ids[number])
+        )
+
+    @uamethod
+    async def _stop_batches(self, parent, lines: list[str]):
+        """Stop the batches of the given lines (all without lines), return their status"""
+        lines = lines or [line.name for line in self._production_lines]
+        return await self._apply_batches(lines, lambda line, number: line.end_batch())
+
+    async def _apply_batches(
+        self,
+        names: list[str],
+        change: Callable[[ProductionLine, int], list[SimulatedVariable]],
+    ) -> ua.Variant:
+        """Change the batches of the named lines and write them in one request"""
+        by_name = {line.name: line for line in self._production_lines}
+        results = []
+        variables: list[SimulatedVariable] = []
+        owners: list[int] = []
+        for number, name in enumerate(names):
+            line = by_name.get(name)
+            if line is None:
+                results.append(ua.StatusCode(ua.StatusCodes.BadNotFound))
+                continue
+            results.append(ua.StatusCode())
+            changed = change(line, number)
+            variables += changed
+            owners += [number] * len(changed)
+
+        if self._writer is None:
+            # Not simulated, e.g. while replaying a recording
+            self._writer = BatchWriter(self._server, self._logger)
+        written = await self._writer.write(variables)
+        for number, result in zip(owners, written):
+            if results[number].is_good() and not result.is_good():
+                results[number] = result
+        failed = sum(not result.is_good() for result in results)
+        self._logger.info(
+            f"Changed the batches of {len(names) - failed} of {len(names)} lines"
+        )
+        return ua.Variant(results, ua.VariantType.StatusCode)
+
     def __str__(self):
         """String representation of the enterprise"""
         return f"Enterprise(name={self.name})"
 
+    def check_simulation(
+        self,
+        added: Iterable[tuple[Equipment, bool]] = (),
+        removed: Iterable[SimulatedVariable] = (),
+    ):
+        """
+        Raise a RuntimeError unless equipment can be simulated and variables dropped
+
+        `added` are pairs of an equipment and whether its line is coupled.
+        The slots of the signal banks a simulation worker steps are fixed,
+        so changes touching them are refused before anything is changed.
+        """
+        if self._scheduler is None:
+            return
+        for equipment, coupled in added:
+            for signal in equipment.simulated_signals(coupled).values():
+                if self._scheduler.offloaded_signal(
+                    equipment.simulation_period, signal
+                ):
+                    raise RuntimeError(
+                        f"{signal} of {equipment.name} is stepped by the simulation worker"
+                    )
+        if self._scheduler.offloaded(removed):
+            raise RuntimeError("The variables are stepped by the simulation worker")
+
     async def add_production_line(self, production_line: ProductionLine):
-        """Add a production line to the enterprise"""
+        """
+        Add a production line to the enterprise
+
+        A line added while the plant is simulated is simulated right away,
+        delivering into the storage units and sampled by quality control.
+        """
         self._production_lines.append(production_line)
-        await self.node.add_reference(production_line.node, ua.ObjectIds.Organizes)
+        # Lines created under the enterprise node are already its components
+        if production_line.parent_node != self.node:
+            await self.node.add_reference(production_line.node, ua.ObjectIds.Organizes)
+        if self._scheduler is None:
+            return
+        for quality_control in self._quality_controls:
+            quality_control.add_line(production_line.name)
+        if production_line.simulated:
+            await production_line.run_simulation(self._scheduler)
+            self._connect_storage(production_line)
+            await self._notify(list(production_line.simulated_variables.values()), [])
+
+    def production_line(self, name: str) -> Optional[ProductionLine]:
+        """Get a production line by name"""
+        return next(
+            (line for line in self._production_lines if line.name == name), None
+        )
+
+    async def remove_production_line(self, name: str) -> Optional[ProductionLine]:
+        """
+        Stop simulating a production line and delete its nodes
+
+        Return the removed line, None when there is no line of that name.
+        """
+        production_line = self.production_line(name)
+        if production_line is None:
+            return None
+        variables = list(production_line.simulated_variables.values())
+        self.check_simulation(removed=variables)
+        production_line.stop_simulation()
+        rate = production_line.simulated_variables["ProductionRate"]
+        for storage_unit in self._storage_units:
+            storage_unit.disconnect(rate)
+        for quality_control in self._quality_controls:
+            quality_control.remove_line(name)
+        self._production_lines.remove(production_line)
+        await self._notify([], variables)
+        await self._delete_nodes([production_line.node])
+        self._logger.info(f"Removed {production_line} from {self.name}")
+        return production_line
+
+    async def add_equipment(
+        self, production_line: ProductionLine, equipment: Equipment
+    ):
+        """Add an initialized equipment to a line, simulated if the line is"""
+        production_line.add_simulated_equipment(equipment)
+        if production_line.simulated and self._scheduler is not None:
+            await self._notify(list(equipment.simulated_variables.values()), [])
+
+    async def remove_equipment(
+        self, production_line: ProductionLine, name: str
+    ) -> Optional[Equipment]:
+        """Stop simulating an equipment of a line and delete its nodes"""
+        equipment = next((e for e in production_line.equipment if e.name == name), None)
+        if equipment is None:
+            return None
+        self.check_simulation(removed=equipment.simulated_variables.values())
+        production_line.remove_simulated_equipment(name)
+        await self._notify([], list(equipment.simulated_variables.values()))
+        await self._delete_nodes([equipment.node])
+        self._logger.info(f"Removed {name} from {production_line}")
+        return equipment
+
+    async def _notify(
+        self, added: list[SimulatedVariable], removed: list[SimulatedVariable]
+    ):
+        for listener in self.variable_listeners:
+            try:
+                await listener(added, removed)
+            except Exception:
+                self._logger.exception(f"Failed to notify {listener} of {self}")
+
+    async def _delete_nodes(self, nodes: list[Node]):
+        """Delete nodes with everything below them"""
+        _, results = await self._server.delete_nodes(nodes, recursive=True)
+        failed = [result for result in results if not result.is_good()]
+        if failed:
+            self._logger.warning(f"Failed to delete {len(failed)} nodes: {failed[0]}")
 
     @property
     def production_lines(self) -> list[ProductionLine]:
@@ -156,30 +441,83 @@ class Enterprise:
         """Get the cold storage unit"""
         return self._cold_storage
 
+    @property
+    def storage_units(self) -> list[Storage]:
+        """Get all storage units"""
+        return self._storage_units
+
     @property
     def quality_control(self):
         """Get the quality control system"""
         return self._quality_control
 
-    async def run_simulation(self) -> list[Task]:
-        """Run the simulation"""
-        tasks = [
-            asyncio.create_task(self._set_total_milk_processed()),
-            asyncio.create_task(self._set_production_status()),
-        ]
-        return tasks
-
-    async def _set_total_milk_processed(self):
-        """Set the total milk processed"""
-        while True:
-            total_milk_processed = await self._total_milk_processed.read_value()
-            await self._total_milk_processed.set_value(
-                round(total_milk_processed + random.uniform(0, 1.5), 2)
-            )
-            self._logger.info(
-                f"Total milk processed: {total_milk_processed} for {self.name}"
-            )
-            await asyncio.sleep(1)
+    @property
+    def quality_controls(self) -> list:
+        """Get all quality control systems"""
+        return self._quality_controls
+
+    @property
+    def simulated_variables(self) -> dict[str, SimulatedVariable]:
+        """Get the simulated variables by path below the enterprise"""
+        variables = {"TotalMilkProcessed": self._total_milk_processed}
+        for production_line in self._production_lines:
+            for name, variable in production_line.simulated_variables.items():
+                variables[f"{production_line.name}/{name}"] = variable
+        for storage_unit in self._storage_units:
+            for name, variable in storage_unit.simulated_variables.items():
+                variables[f"Storage/{storage_unit.name}/{name}"] = variable
+        return variables
+
+    def add_alarms(self, engine: AlarmEngine):
+        """Add the limit alarms of the storage units and quality controls"""
+        for source in (*self._storage_units, *self._quality_controls):
+            for name, (variable, low, high) in source.alarm_limits.items():
+                if low is not None or high is not None:
+                    engine.add(source.node, source.name, name, variable, low, high)
+
+    async def run_simulation(self, scheduler: Scheduler):
+        """Register the enterprise variables with the simulation scheduler"""
+        await self._set_production_status()
+        self._random = scheduler.random(self.node)
+        self._writer = scheduler.writer
+        self._scheduler = scheduler
+        self._total_milk_processed.priority = CRITICAL
+        scheduler.add(1.0, self._total_milk_processed)
+        lines = [line.name for line in self._production_lines]
+        for quality_control in self._quality_controls:
+            quality_control.run_simulation(scheduler, lines)
+        self._run_storage_simulation(scheduler)
+
+    def _run_storage_simulation(self, scheduler: Scheduler):
+        """Simulate the storage units, filled by the simulated production lines"""
+        for storage_type in self.storage_types.values():
+            for storage_unit in self._storage_units:
+                if type(storage_unit) is storage_type:
+                    storage_unit.run_simulation(scheduler)
+        for line in self._production_lines:
+            if line.simulated:
+                self._connect_storage(line)
+
+    def _connect_storage(self, production_line: ProductionLine):
+        """
+        Deliver the production of a line into one unit of each storage type
+
+        The lines are spread over the units of a type in turn.
+        """
+        rate = production_line.simulated_variables["ProductionRate"]
+        for storage_type in self.storage_types.values():
+            units = [u for u in self._storage_units if type(u) is storage_type]
+            if units:
+                units[self._storage_connections % len(units)].connect(rate)
+        self._storage_connections += 1
+
+    def _next_total_milk_processed(self, total_milk_processed: float) -> float:
+        """Compute the next total milk processed"""
+        total_milk_processed = round(
+            total_milk_processed + self._random.uniform(0, 1.5), 2
+        )
+        self._summary.record(self.name, "TotalMilkProcessed", total_milk_processed)
+        return total_milk_processed
 
     async def _set_production_status(self):
         """Set the production status"""
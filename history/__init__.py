@@ -0,0 +1,5 @@
+from .ring import NodeHistory
+from .segments import SegmentStore
+from .historian import Historian, HistorianManager
+
+__all__ = ["NodeHistory", "SegmentStore", "Historian", "HistorianManager"]
@@ -0,0 +1,373 @@
+from datetime import datetime, timezone
+import itertools
+import logging
+from pathlib import Path
+import time
+from typing import Iterable, Optional
+import numpy as np
+from asyncua import Server, ua
+from asyncua.server.history import HistoryManager, HistoryStorageInterface
+from simulation import SimulatedVariable, SimulationClock
+from .ring import NodeHistory
+from .segments import SAMPLE, SegmentStore
+
+_EPOCH = ua.get_win_epoch()
+
+# Aggregates answered by ReadProcessed, computed per interval over the samples
+AGGREGATES = {
+    ua.ObjectIds.AggregateFunction_Minimum: "minimum",
+    ua.ObjectIds.AggregateFunction_Maximum: "maximum",
+    ua.ObjectIds.AggregateFunction_Average: "average",
+    ua.ObjectIds.AggregateFunction_Count: "count",
+    ua.ObjectIds.AggregateFunction_Start: "start",
+    ua.ObjectIds.AggregateFunction_End: "end",
+}
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    """POSIX seconds of a request time, None when it is not specified"""
+    if value is None or value == _EPOCH:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+class Historian(HistoryStorageInterface):
+    """
+    History of the simulated variables, recorded from the batch writer
+
+    Every historized variable keeps its last `samples` values in memory.
+    With a `spill_directory` the samples pushed out of memory are kept in
+    memory-mapped segment files until they are older than `retention`
+    seconds, otherwise they are dropped. Raw reads return the samples as
+    DataValues, processed reads compute min/max/avg/count/start/end per
+    interval with NumPy. A value held since before an interval counts as a
+    sample at its start, except for the count of raw samples. The retention
+    counts in the simulated time of `clock`, which stamps the recorded
+    samples.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        samples: int = 1000,
+        retention: float = 24 * 3600.0,
+        spill_directory: Optional[Path] = None,
+        max_history_data_response_size: int = 10000,
+        clock: Optional[SimulationClock] = None,
+    ):
+        super().__init__(max_history_data_response_size)
+        self._logger = logger
+        self._clock = clock if clock is not None else SimulationClock()
+        self._samples = samples
+        self.retention = retention
+        self._by_variable: dict[SimulatedVariable, NodeHistory] = {}
+        self._by_node: dict[ua.NodeId, NodeHistory] = {}
+        # Indices of removed variables are not reused, spilled samples keep them
+        self._indices = itertools.count()
+        self._segments = (
+            None if spill_directory is None else SegmentStore(spill_directory, logger)
+        )
+        self._expired = time.monotonic()
+
+    def __str__(self):
+        return f"Historian(nodes={len(self._by_node)}, samples={self._samples})"
+
+    def __len__(self):
+        return len(self._by_node)
+
+    def install(self, server: Server):
+        """Answer the HistoryRead requests of the server from this historian"""
+        manager = HistorianManager(server.iserver)
+        manager.set_storage(self)
+        server.iserver.history_manager = manager
+
+    async def historize(self, variables: Iterable[SimulatedVariable]):
+        """Record the values of the variables and flag their nodes as historized"""
+        added = []
+        for variable in variables:
+            if variable in self._by_variable:
+                continue
+            history = NodeHistory(
+                next(self._indices), variable.variant_type, self._samples
+            )
+            self._by_variable[variable] = history
+            self._by_node[variable.node.nodeid] = history
+            added.append(variable)
+        if not added:
+            return
+
+        # Add the HistoryRead bit to the access levels in one read and one write
+        session = added[0].node.session
+        attributes = (ua.AttributeIds.AccessLevel, ua.AttributeIds.UserAccessLevel)
+        read = ua.ReadParameters()
+        read.NodesToRead = [
+            ua.ReadValueId(NodeId_=variable.node.nodeid, AttributeId=attribute)
+            for variable in added
+            for attribute in attributes
+        ]
+        access_levels = await session.read(read)
+        write = ua.WriteParameters()
+        for node_to_read, access_level in zip(read.NodesToRead, access_levels):
+            level = access_level.Value.Value | (1 << ua.AccessLevel.HistoryRead)
+            write.NodesToWrite.append(
+                ua.WriteValue(
+                    NodeId_=node_to_read.NodeId,
+                    AttributeId=node_to_read.AttributeId,
+                    Value=ua.DataValue(ua.Variant(level, ua.VariantType.Byte)),
+                )
+            )
+        write.NodesToWrite += [
+            ua.WriteValue(
+                NodeId_=variable.node.nodeid,
+                AttributeId=ua.AttributeIds.Historizing,
+                Value=ua.DataValue(ua.Variant(True, ua.VariantType.Boolean)),
+            )
+            for variable in added
+        ]
+        for result in await session.write(write):
+            result.check()
+        self._logger.info(f"Historizing {len(self)} variables")
+
+    def forget(self, variables: Iterable[SimulatedVariable]):
+        """Stop recording the values of the variables and drop their history"""
+        for variable in variables:
+            if self._by_variable.pop(variable, None) is not None:
+                self._by_node.pop(variable.node.nodeid, None)
+
+    async def update(
+        self, added: list[SimulatedVariable], removed: list[SimulatedVariable]
+    ):
+        """Follow the variables added to and removed from the running plant"""
+        self.forget(removed)
+        await self.historize(added)
+
+    def record(self, variables: list[SimulatedVariable], timestamp: datetime):
+        """Store the published values of the variables written at `timestamp`"""
+        seconds = timestamp.timestamp()
+        spilled = []
+        for variable in variables:
+            history = self._by_variable.get(variable)
+            if history is None:
+                continue
+            evicted = history.append(seconds, history.encode(variable.published))
+            if evicted is not None and self._segments is not None:
+                spilled.append((history.index, *evicted))
+        if spilled:
+            self._segments.append(np.array(spilled, dtype=SAMPLE))
+        # Expire the segments once a minute, not on every tick
+        if self._segments is not None and time.monotonic() - self._expired > 60:
+            self._expired = time.monotonic()
+            self._segments.expire(seconds - self.retention)
+
+    def _samples_between(
+        self, history: NodeHistory, start: float, end: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Timestamps and encoded values within [start, end] in order"""
+        start = max(start, self._clock.time() - self.retention)
+        times, values = history.samples()
+        first = int(np.searchsorted(times, start, side="left"))
+        last = int(np.searchsorted(times, end, side="right"))
+        times, values = times[first:last], values[first:last]
+        oldest = history.oldest
+        if self._segments is not None and (oldest is None or start < oldest):
+            spilled_times, spilled_values = self._segments.read(
+                history.index,
+                start,
+                end if oldest is None else min(end, np.nextafter(oldest, -np.inf)),
+            )
+            times = np.concatenate((spilled_times, times))
+            values = np.concatenate((spilled_values, values))
+        return times, values
+
+    def _sample_before(
+        self, history: NodeHistory, time: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Timestamp and encoded value of the last sample before `time`, if any"""
+        times, values = history.samples()
+        last = int(np.searchsorted(times, time, side="left"))
+        if last:
+            return times[last - 1 : last], values[last - 1 : last]
+        start = self._clock.time() - self.retention
+        if self._segments is None or start >= time:
+            return times[:0], values[:0]
+        times, values = self._segments.read(
+            history.index, start, np.nextafter(time, -np.inf)
+        )
+        return times[-1:], values[-1:]
+
+    def _data_value(self, history: NodeHistory, timestamp: float, value: float):
+        when = _datetime(timestamp)
+        return ua.DataValue(
+            ua.Variant(history.decode(value), history.variant_type),
+            SourceTimestamp=when,
+            ServerTimestamp=when,
+        )
+
+    async def init(self):
+        pass
+
+    async def new_historized_node(self, node_id, period, count=0):
+        raise ua.UaStatusCodeError(ua.StatusCodes.BadNotSupported)
+
+    async def save_node_value(self, node_id, datavalue):
+        pass
+
+    async def read_node_history(self, node_id, start, end, nb_values):
+        """Raw samples in [start, end], newest first when start > end"""
+        history = self._by_node.get(node_id)
+        if history is None:
+            return [], None
+        start, end = _timestamp(start), _timestamp(end)
+        backwards = (start is None and end is not None) or (
+            start is not None and end is not None and start > end
+        )
+        low, high = (end, start) if backwards else (start, end)
+        times, values = self._samples_between(
+            history,
+            -np.inf if low is None else low,
+            np.inf if high is None else high,
+        )
+        if backwards:
+            times, values = times[::-1], values[::-1]
+
+        limit = self.max_history_data_response_size
+        if nb_values:
+            limit = min(limit, nb_values)
+        continuation = None
+        if len(times) > limit:
+            if not nb_values or nb_values > limit:
+                continuation = _datetime(float(times[limit]))
+            times, values = times[:limit], values[:limit]
+        return [
+            self._data_value(history, timestamp, value)
+            for timestamp, value in zip(times.tolist(), values.tolist())
+        ], continuation
+
+    def read_processed(
+        self,
+        node_id: ua.NodeId,
+        aggregate: ua.NodeId,
+        start: datetime,
+        end: datetime,
+        interval: float,
+    ) -> ua.HistoryReadResult:
+        """One aggregate value per `interval` milliseconds in [start, end)"""
+        result = ua.HistoryReadResult()
+        history = self._by_node.get(node_id)
+        kind = (
+            AGGREGATES.get(aggregate.Identifier)
+            if aggregate.NamespaceIndex == 0
+            else None
+        )
+        if history is None:
+            result.StatusCode = ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
+            return result
+        if kind is None:
+            result.StatusCode = ua.StatusCode(ua.StatusCodes.BadAggregateNotSupported)
+            return result
+        first, last = _timestamp(start), _timestamp(end)
+        if first is None or last is None or last <= first:
+            result.StatusCode = ua.StatusCode(
+                ua.StatusCodes.BadInvalidTimestampArgument
+            )
+            return result
+
+        width = interval / 1000 if interval > 0 else last - first
+        bounds = np.arange(first, last, width)
+        times, values = self._samples_between(history, first, last)
+        before_times, before_values = self._sample_before(history, first)
+        times = np.concatenate((before_times, times))
+        values = np.concatenate((before_values, values))
+        # Raw samples of interval i are values[edges[i]:edges[i + 1]]
+        edges = np.searchsorted(times, np.append(bounds, last), side="left")
+        counts = np.diff(edges)
+        if kind != "count":
+            # A value held (e.g. within its deadband) since before an interval
+            # is its bounding value, counted as a sample at the interval start
+            starts = edges[:-1]
+            held = (starts > 0) & (np.append(times, np.inf)[starts] > bounds)
+            values = np.insert(values, starts[held], values[starts[held] - 1])
+            edges = edges + np.concatenate(([0], np.cumsum(held)))
+            counts = np.diff(edges)
+        aggregated = np.full(len(bounds), np.nan)
+        filled = counts > 0
+        starts = edges[:-1][filled]
+        if len(starts):
+            if kind == "minimum":
+                aggregated[filled] = np.minimum.reduceat(values, starts)
+            elif kind == "maximum":
+                aggregated[filled] = np.maximum.reduceat(values, starts)
+            elif kind == "average":
+                aggregated[filled] = np.add.reduceat(values, starts) / counts[filled]
+            elif kind == "start":
+                aggregated[filled] = values[starts]
+            elif kind == "end":
+                aggregated[filled] = values[edges[1:][filled] - 1]
+        if kind == "count":
+            aggregated = counts.astype(np.float64)
+
+        result.HistoryData = ua.HistoryData()
+        for bound, value, count in zip(bounds.tolist(), aggregated.tolist(), counts):
+            when = _datetime(bound)
+            if kind != "count" and not count:
+                variant = None
+                status = ua.StatusCode(ua.StatusCodes.BadNoData)
+            else:
+                status = ua.StatusCode()
+                if kind == "average":
+                    variant = ua.Variant(value, ua.VariantType.Double)
+                elif kind == "count":
+                    variant = ua.Variant(int(value), ua.VariantType.Int32)
+                else:
+                    variant = ua.Variant(history.decode(value), history.variant_type)
+            data_value = ua.DataValue(
+                variant, status, SourceTimestamp=when, ServerTimestamp=when
+            )
+            result.HistoryData.DataValues.append(data_value)
+        return result
+
+    async def new_historized_event(self, source_id, evtypes, period, count=0):
+        raise ua.UaStatusCodeError(ua.StatusCodes.BadNotSupported)
+
+    async def save_event(self, event):
+        pass
+
+    async def read_event_history(self, source_id, start, end, nb_values, evfilter):
+        return [], None
+
+    async def stop(self):
+        if self._segments is not None:
+            self._segments.close(remove=True)
+
+
+class HistorianManager(HistoryManager):
+    """History manager that also answers ReadProcessed requests"""
+
+    async def read_history(self, params: ua.HistoryReadParameters):
+        details = params.HistoryReadDetails
+        if not isinstance(details, ua.ReadProcessedDetails):
+            return await super().read_history(params)
+        results = []
+        # The i-th aggregate is computed for the i-th node
+        for number, rv in enumerate(params.NodesToRead):
+            if number >= len(details.AggregateType):
+                result = ua.HistoryReadResult()
+                result.StatusCode = ua.StatusCode(
+                    ua.StatusCodes.BadAggregateListMismatch
+                )
+            else:
+                result = self.storage.read_processed(
+                    rv.NodeId,
+                    details.AggregateType[number],
+                    details.StartTime,
+                    details.EndTime,
+                    details.ProcessingInterval,
+                )
+            results.append(result)
+        return results
@@ -0,0 +1,263 @@
+"""
+Ground-truth recording of every value the simulator writes
+
+A recording is a directory with two files:
+- values.bin: the samples as raw records of the SAMPLE dtype (node index,
+  source timestamp in POSIX seconds and value), appended in write order;
+  read it with np.fromfile(path, dtype=SAMPLE) or np.memmap
+- nodes.json: per node index the node id, the variant type and, for
+  non-numeric values such as Status strings, the labels the values index
+
+Export a recording as CSV (time, node id and value per sample):
+    python -m history.recorder recording/ values.csv
+"""
+
+import argparse
+import asyncio
+import csv
+from datetime import datetime
+import json
+import logging
+import os
+from pathlib import Path
+import queue
+import threading
+from typing import Any, Optional
+import numpy as np
+from asyncua import ua
+from simulation import SimulatedVariable
+from simulation.signals import _INTEGER_TYPES
+from .historian import _datetime
+from .segments import SAMPLE
+
+VALUES_FILE = "values.bin"
+NODES_FILE = "nodes.json"
+
+
+class ValueRecorder:
+    """
+    Records every value written by the batch writer to a local directory
+
+    `record` is a listener of the batch writer: it only copies the node
+    index, source timestamp and encoded value of every written variable
+    into a preallocated buffer of `buffer_rows` samples. Full buffers, and
+    the filled part every `period` seconds, are appended to the recording
+    by a background thread, so the event loop never waits for the disk.
+    At most `max_buffers` buffers wait for the thread; when the disk falls
+    further behind, the samples of a buffer are dropped and counted, so
+    memory stays bounded.
+
+    Nodes are numbered as they are first written, so variables added while
+    the plant runs are recorded without registering them.
+
+    Attributes:
+    - directory: Path (directory of the recording)
+    - recorded: int (number of samples handed to the thread)
+    - dropped: int (number of samples dropped while the thread fell behind)
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        logger: logging.Logger,
+        buffer_rows: int = 65536,
+        max_buffers: int = 16,
+    ):
+        self.directory = directory
+        self._logger = logger
+        self._buffer_rows = buffer_rows
+        self._buffer = np.empty(buffer_rows, dtype=SAMPLE)
+        self._size = 0
+        self.recorded = 0
+        self.dropped = 0
+        self._indices: dict[SimulatedVariable, int] = {}
+        self._nodes: list[dict[str, Any]] = []
+        self._codes: dict[int, dict[Any, int]] = {}
+        self._nodes_changed = False
+        self._queue: queue.Queue = queue.Queue(maxsize=max_buffers)
+        self._thread: Optional[threading.Thread] = None
+
+    def __str__(self):
+        return f"ValueRecorder(directory={self.directory}, nodes={len(self._nodes)})"
+
+    def start(self):
+        """Start a new recording, replacing the one in the directory"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Node indices are only valid for one run
+        (self.directory / VALUES_FILE).write_bytes(b"")
+        self._thread = threading.Thread(
+            target=self._drain, name="ValueRecorder", daemon=True
+        )
+        self._thread.start()
+
+    def _index(self, variable: SimulatedVariable) -> int:
+        """Number of the node of a variable, assigned when first written"""
+        index = self._indices.get(variable)
+        if index is None:
+            index = self._indices[variable] = len(self._nodes)
+            self._nodes.append(
+                {
+                    "node_id": variable.node.nodeid.to_string(),
+                    "type": variable.variant_type.name,
+                }
+            )
+            self._nodes_changed = True
+        return index
+
+    def _encode(self, index: int, value: Any) -> float:
+        """The number recorded for a value, a label index if not numeric"""
+        if isinstance(value, (int, float)):
+            return float(value)
+        codes = self._codes.get(index)
+        if codes is None:
+            codes = self._codes[index] = {}
+            self._nodes[index]["labels"] = []
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self._nodes[index]["labels"].append(value)
+            self._nodes_changed = True
+        return float(code)
+
+    def record(self, variables: list[SimulatedVariable], timestamp: datetime):
+        """
+        Buffer the published values of the variables written at `timestamp`
+
+        Values written before `start` or after `close` are not recorded.
+        """
+        if self._thread is None:
+            return
+        seconds = timestamp.timestamp()
+        for start in range(0, len(variables), self._buffer_rows):
+            batch = variables[start : start + self._buffer_rows]
+            if self._size + len(batch) > self._buffer_rows:
+                self.flush()
+            indices = [self._index(variable) for variable in batch]
+            rows = self._buffer[self._size : self._size + len(batch)]
+            rows["node"] = indices
+            rows["time"] = seconds
+            rows["value"] = [
+                self._encode(index, variable.published)
+                for index, variable in zip(indices, batch)
+            ]
+            self._size += len(batch)
+
+    def flush(self):
+        """Hand the buffered samples, and the nodes if they changed, to the thread"""
+        if self._thread is None or not (self._size or self._nodes_changed):
+            return
+        nodes = json.dumps(self._nodes) if self._nodes_changed else None
+        try:
+            self._queue.put_nowait((self._buffer[: self._size], nodes))
+        except queue.Full:
+            self.dropped += self._size
+            self._logger.warning(
+                f"{self} fell behind, dropped {self._size} samples "
+                f"({self.dropped} in total)"
+            )
+        else:
+            self.recorded += self._size
+            self._nodes_changed = False
+            # The thread owns the handed over buffer
+            self._buffer = np.empty(self._buffer_rows, dtype=SAMPLE)
+        self._size = 0
+
+    def _drain(self):
+        """Append the handed over samples to the recording until closed"""
+        with open(self.directory / VALUES_FILE, "ab") as values:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                samples, nodes = item
+                try:
+                    values.write(samples.tobytes())
+                    values.flush()
+                    if nodes is not None:
+                        # Replace the file at once so readers never see a partial one
+                        temporary = self.directory / f".{NODES_FILE}.tmp"
+                        temporary.write_text(nodes)
+                        os.replace(temporary, self.directory / NODES_FILE)
+                except OSError:
+                    self._logger.exception(f"Failed to write to {self}")
+
+    async def run(self, period: float = 1.0):
+        """Hand the buffered samples to the thread every `period` seconds"""
+        while True:
+            await asyncio.sleep(period)
+            self.flush()
+
+    def close(self):
+        """Write the remaining samples and wait for the thread"""
+        if self._thread is None:
+            return
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._logger.info(
+            f"Recorded {self.recorded} samples of {len(self._nodes)} nodes to "
+            f"{self.directory} ({self.dropped} dropped)"
+        )
+
+
+def read_recording(directory: Path) -> tuple[list[dict[str, Any]], np.ndarray]:
+    """
+    The nodes and the memory-mapped samples of a recording
+
+    A sample cut off by a crash at the end of the file is ignored, and a
+    recording nothing was written to has no nodes.
+    """
+    path = directory / NODES_FILE
+    nodes = json.loads(path.read_text()) if path.exists() else []
+    path = directory / VALUES_FILE
+    rows = path.stat().st_size // SAMPLE.itemsize
+    if not rows:
+        return nodes, np.empty(0, dtype=SAMPLE)
+    return nodes, np.memmap(path, dtype=SAMPLE, mode="r", shape=(rows,))
+
+
+def _decoder(node: dict[str, Any]):
+    """The function turning a recorded number into the value of a node"""
+    labels = node.get("labels")
+    if labels is not None:
+        return lambda value: labels[int(value)]
+    variant_type = ua.VariantType[node["type"]]
+    if variant_type == ua.VariantType.Boolean:
+        return bool
+    if variant_type in _INTEGER_TYPES:
+        return int
+    return float
+
+
+def export_csv(directory: Path, csv_path: Path, chunk: int = 1_000_000) -> int:
+    """
+    Write a recording as CSV with a time, node_id and value column
+
+    Times are ISO 8601 in UTC. The samples are converted `chunk` rows at a
+    time, so the recording is never held in memory as a whole. Returns the
+    number of rows.
+    """
+    nodes, samples = read_recording(directory)
+    node_ids = [node["node_id"] for node in nodes]
+    decoders = [_decoder(node) for node in nodes]
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["time", "node_id", "value"])
+        for start in range(0, len(samples), chunk):
+            part = samples[start : start + chunk]
+            writer.writerows(
+                (_datetime(seconds).isoformat(), node_ids[node], decoders[node](value))
+                for node, seconds, value in zip(
+                    part["node"].tolist(), part["time"].tolist(), part["value"].tolist()
+                )
+            )
+    return len(samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a value recording as CSV")
+    parser.add_argument("recording", type=Path)
+    parser.add_argument("csv", type=Path)
+    args = parser.parse_args()
+    print(f"Exported {export_csv(args.recording, args.csv)} rows to {args.csv}")
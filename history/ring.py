@@ -0,0 +1,112 @@
+from typing import Any, Optional
+import numpy as np
+from asyncua import ua
+
+# Types stored as their numeric value, the others as codes into a label table
+_NUMERIC_TYPES = {
+    ua.VariantType.Boolean,
+    ua.VariantType.SByte,
+    ua.VariantType.Byte,
+    ua.VariantType.Int16,
+    ua.VariantType.UInt16,
+    ua.VariantType.Int32,
+    ua.VariantType.UInt32,
+    ua.VariantType.Int64,
+    ua.VariantType.UInt64,
+    ua.VariantType.Float,
+    ua.VariantType.Double,
+}
+
+
+class NodeHistory:
+    """
+    Samples of one variable in a fixed-size ring buffer
+
+    Timestamps (POSIX seconds) and values are kept in two float64 arrays,
+    not as DataValue objects. Values of non-numeric variables (strings such
+    as "On"/"Off") are stored as indices into a per-node label table.
+
+    Attributes:
+    - index: int (number of the node in the historian, used on disk)
+    - variant_type: ua.VariantType (type of the values returned by reads)
+    """
+
+    __slots__ = (
+        "index",
+        "variant_type",
+        "_times",
+        "_values",
+        "_start",
+        "_size",
+        "_labels",
+        "_codes",
+    )
+
+    def __init__(self, index: int, variant_type: ua.VariantType, capacity: int):
+        self.index = index
+        self.variant_type = variant_type
+        self._times = np.zeros(capacity)
+        self._values = np.zeros(capacity)
+        self._start = 0
+        self._size = 0
+        self._labels: Optional[list[Any]] = (
+            None if variant_type in _NUMERIC_TYPES else []
+        )
+        self._codes: dict[Any, int] = {}
+
+    def __len__(self):
+        return self._size
+
+    def __str__(self):
+        return f"NodeHistory(index={self.index}, samples={self._size})"
+
+    def encode(self, value: Any) -> float:
+        """The number stored for a value"""
+        if self._labels is None:
+            return float(value)
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._labels)
+            self._labels.append(value)
+        return float(code)
+
+    def decode(self, value: float) -> Any:
+        """The value of a stored number"""
+        if self._labels is not None:
+            return self._labels[int(value)]
+        if self.variant_type == ua.VariantType.Boolean:
+            return bool(value)
+        if self.variant_type in (ua.VariantType.Float, ua.VariantType.Double):
+            return float(value)
+        return int(value)
+
+    def append(self, timestamp: float, value: float) -> Optional[tuple[float, float]]:
+        """Add an encoded sample, return the sample it evicted if the buffer is full"""
+        capacity = len(self._times)
+        if self._size < capacity:
+            slot = (self._start + self._size) % capacity
+            self._size += 1
+            evicted = None
+        else:
+            slot = self._start
+            self._start = (self._start + 1) % capacity
+            evicted = (self._times[slot], self._values[slot])
+        self._times[slot] = timestamp
+        self._values[slot] = value
+        return evicted
+
+    @property
+    def oldest(self) -> Optional[float]:
+        """Timestamp of the oldest sample in memory"""
+        return self._times[self._start] if self._size else None
+
+    def samples(self) -> tuple[np.ndarray, np.ndarray]:
+        """Timestamps and encoded values in chronological order"""
+        end = self._start + self._size
+        if end <= len(self._times):
+            return self._times[self._start : end], self._values[self._start : end]
+        end -= len(self._times)
+        return (
+            np.concatenate((self._times[self._start :], self._times[:end])),
+            np.concatenate((self._values[self._start :], self._values[:end])),
+        )
@@ -0,0 +1,122 @@
+import logging
+from pathlib import Path
+import numpy as np
+
+# One sample spilled to disk: node index, timestamp and encoded value
+SAMPLE = np.dtype([("node", "<u4"), ("time", "<f8"), ("value", "<f8")])
+
+
+class Segment:
+    """A memory-mapped .npy file of samples, filled in order"""
+
+    def __init__(self, path: Path, rows: int):
+        self.path = path
+        self.data = np.lib.format.open_memmap(
+            path, mode="w+", dtype=SAMPLE, shape=(rows,)
+        )
+        self.size = 0
+        self.first = float("inf")
+        self.last = float("-inf")
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def full(self) -> bool:
+        return self.size == len(self.data)
+
+    def append(self, samples: np.ndarray) -> int:
+        """Copy as many samples as fit, return how many were copied"""
+        count = min(len(samples), len(self.data) - self.size)
+        if count:
+            self.data[self.size : self.size + count] = samples[:count]
+            self.size += count
+            self.first = min(self.first, float(samples["time"][:count].min()))
+            self.last = max(self.last, float(samples["time"][:count].max()))
+        return count
+
+    def read(self, node: int, start: float, end: float) -> np.ndarray:
+        """Samples of a node within [start, end]"""
+        data = self.data[: self.size]
+        mask = data["node"] == node
+        mask &= data["time"] >= start
+        mask &= data["time"] <= end
+        return data[mask]
+
+
+class SegmentStore:
+    """
+    Samples evicted from memory, spilled to memory-mapped segment files
+
+    Segments of `rows` samples are written one after the other in
+    `directory`; a segment whose newest sample is older than the retention
+    is deleted. Reads only scan the segments overlapping the requested
+    time range, and the OS pages in only the parts of a file being read.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        logger: logging.Logger,
+        rows: int = 1_000_000,
+    ):
+        self.directory = directory
+        self._logger = logger
+        self._rows = rows
+        self._segments: list[Segment] = []
+        self._number = 0
+        directory.mkdir(parents=True, exist_ok=True)
+        # Node indices are only valid for one run
+        for stale in directory.glob("segment-*.npy"):
+            stale.unlink()
+
+    def __str__(self):
+        return (
+            f"SegmentStore(directory={self.directory}, segments={len(self._segments)})"
+        )
+
+    def _current(self) -> Segment:
+        if not self._segments or self._segments[-1].full:
+            if self._segments:
+                self._segments[-1].data.flush()
+            path = self.directory / f"segment-{self._number:06d}.npy"
+            self._number += 1
+            self._segments.append(Segment(path, self._rows))
+        return self._segments[-1]
+
+    def append(self, samples: np.ndarray):
+        """Spill samples (of dtype SAMPLE)"""
+        while len(samples):
+            samples = samples[self._current().append(samples) :]
+
+    def expire(self, before: float):
+        """Delete the segments with only samples older than `before`"""
+        while len(self._segments) > 1 and self._segments[0].last < before:
+            segment = self._segments.pop(0)
+            del segment.data
+            segment.path.unlink(missing_ok=True)
+            self._logger.debug(f"Deleted history segment {segment.path}")
+
+    def read(
+        self, node: int, start: float, end: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Timestamps and encoded values of a node within [start, end], in order"""
+        parts = [
+            segment.read(node, start, end)
+            for segment in self._segments
+            if segment.size and segment.first <= end and segment.last >= start
+        ]
+        if not parts:
+            return np.empty(0), np.empty(0)
+        samples = np.concatenate(parts)
+        return samples["time"], samples["value"]
+
+    def close(self, remove: bool = False):
+        """Flush the segments, and delete them when `remove` is set"""
+        for segment in self._segments:
+            segment.data.flush()
+            if remove:
+                del segment.data
+                segment.path.unlink(missing_ok=True)
+        if remove:
+            self._segments.clear()
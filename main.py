@@ -1,91 +1,549 @@
+import argparse
 import asyncio
+import contextlib
+from datetime import datetime, timezone
+import functools
 import logging
+from pathlib import Path
 
-from asyncio import Task
 from asyncua import Server
-from enterprise import Enterprise
-from asyncua.common.methods import uamethod
-from milk_processor import get_milk_processing_line
-from production_line.production_line import ProductionLine
+from address_space import AddressSpaceSnapshot, file_digest
+from diagnostics import (
+    Diagnostics,
+    LoopLagMonitor,
+    Profiler,
+    RuntimeMetrics,
+    log_summary,
+    queued_logging,
+)
+from alarms import AlarmEngine
+from history import Historian
+from history.recorder import ValueRecorder
+from sharding import Shard, Supervisor
+from simulation import (
+    BatchWriter,
+    LoadShedder,
+    ObservedNodes,
+    Scheduler,
+    SimulationClock,
+    SimulationWorker,
+)
+from simulation.replay import Replay
+from topology import PlantEditor, PlantTopology, build_plant
 
+DEFAULT_TOPOLOGY = Path(__file__).parent / "topologies" / "dairy_enterprise.toml"
+ENDPOINT = "opc.tcp://0.0.0.0:4840/freeopcua/server"
+NAMESPACE = "https://kanapuli.github.io/dairy-enterprise"
+PROFILE_DIR = Path("profiles")
 
-async def main():
+
+async def load_snapshot(
+    server: Server, snapshot_path: Path, topology_digest: str, logger: logging.Logger
+) -> AddressSpaceSnapshot | None:
+    """Install a snapshot of the plant if one matches the topology"""
+    if not snapshot_path.exists():
+        return None
+    snapshot = AddressSpaceSnapshot.load(snapshot_path)
+    if snapshot is None or not await snapshot.is_compatible(server, topology_digest):
+        logger.warning(f"Ignoring outdated snapshot {snapshot_path}")
+        return None
+    snapshot.install(server)
+    logger.info(f"Loaded {snapshot} from {snapshot_path}")
+    return snapshot
+
+
+async def main(
+    topology_path: Path = DEFAULT_TOPOLOGY,
+    snapshot_path: Path | None = None,
+    shard: Shard | None = None,
+    discovery_endpoint: str | None = None,
+    simulation_worker: bool = False,
+    endpoint: str = ENDPOINT,
+    diagnostics_dump: Path | None = None,
+    profile_dir: Path = PROFILE_DIR,
+    log_interval: float = 10.0,
+    seed: int | None = None,
+    replay_path: Path | None = None,
+    replay_speed: float = 1.0,
+    history_samples: int = 300,
+    history_retention: float = 24 * 3600.0,
+    history_spill: Path | None = None,
+    record_path: Path | None = None,
+    lazy: bool = False,
+    speed: float | None = 1.0,
+    clock_start: datetime | None = None,
+    alarm_rate: float = 1000.0,
+    lag_target: float = 100.0,
+):
     _logger = logging.getLogger(__name__)
+    topology = PlantTopology.load(topology_path)
+    topology_digest = file_digest(topology_path)
+
     server = Server()
     await server.init()
-    server.set_endpoint("opc.tcp://0.0.0.0:4840/freeopcua/server")
+    if shard is None:
+        server.set_endpoint(endpoint)
+        uri = NAMESPACE
+    else:
+        # Serve only the production lines of the shard
+        topology = topology.shard(shard.index, shard.count)
+        topology_digest = f"{topology_digest}:{shard.index}/{shard.count}"
+        server.set_endpoint(shard.endpoint)
+        server.set_server_name(f"Dairy Enterprise {shard.name}")
+        await server.set_application_uri(shard.application_uri)
+        uri = shard.namespace
 
-    uri = "https://kanapuli.github.io/dairy-enterprise"
     idx = await server.register_namespace(uri)
 
-    simulation_tasks: list[Task] = []
+    snapshot = None
+    if snapshot_path is not None:
+        snapshot = await load_snapshot(server, snapshot_path, topology_digest, _logger)
+
+    # Simulated time, in real time, accelerated or as fast as possible
+    clock = SimulationClock(speed, clock_start)
+    if not clock.realtime:
+        _logger.info(f"Simulating on {clock}")
+    writer = BatchWriter(server, _logger, clock)
+    # Optionally simulate only what clients monitor or read
+    observed = ObservedNodes(server) if lazy else None
+    loop_lag = LoopLagMonitor()
+    shedder = None
+    if lag_target:
+        # Hold back low-priority writes while the loop or the ticks lag behind
+        shedder = LoadShedder(
+            lag_target / 1e3, lambda: loop_lag.percentiles()["p95"] / 1e3
+        )
+    scheduler = Scheduler(
+        _logger, writer, seed, observed, shedder=shedder, namespace=uri
+    )
     async with server:
         _logger.info("Starting OPC UA server...")
-        dairy_enterprise = await Enterprise.create(
-            name="Dairy Enterprise",
-            logger=_logger,
-            server=server,
-            idx=idx,
-            production_lines=[],
-        )
-        _logger.info(f"Created {dairy_enterprise}")
-        # Start the simulation for enterprise variables
-        simulation_tasks.extend(await dairy_enterprise.run_simulation())
+        dairy_enterprise = await build_plant(topology, server, idx, _logger, snapshot)
+        _logger.info(f"Created {dairy_enterprise} from {topology}")
 
-        milk_processing_line = await get_milk_processing_line(
-            dairy_enterprise.node, idx, _logger
-        )
-        # Collect tasks from milk processing line
-        milk_line_tasks = await milk_processing_line.run_simulation()
-        simulation_tasks.extend(milk_line_tasks)
-
-        # Initialize other production lines...
-        icecrean_production_line = ProductionLine(
-            name="Icecrean Production Line",
-            logger=_logger,
-            parent_node=dairy_enterprise.node,
-            idx=idx,
-        )
-        await icecrean_production_line.initialize()
+        if discovery_endpoint is not None:
+            try:
+                await server.register_to_discovery(discovery_endpoint, period=60)
+            except Exception as e:
+                _logger.warning(f"Could not register to {discovery_endpoint}: {e}")
 
-        cheese_production_line = ProductionLine(
-            name="Cheese Production Line",
-            logger=_logger,
-            parent_node=dairy_enterprise.node,
-            idx=idx,
-        )
-        await cheese_production_line.initialize()
-        cheese_line_tasks = await cheese_production_line.run_simulation()
-        simulation_tasks.extend(cheese_line_tasks)
-
-        yogurt_production_line = ProductionLine(
-            name="Yogurt Production Line",
-            logger=_logger,
-            parent_node=dairy_enterprise.node,
-            idx=idx,
-        )
-        await yogurt_production_line.initialize()
+        if snapshot_path is not None and snapshot is None:
+            # Save the freshly built plant for the next (warm) start
+            snapshot = await AddressSpaceSnapshot.capture(server, topology_digest)
+            snapshot.save(snapshot_path)
+            _logger.info(f"Saved {snapshot} to {snapshot_path}")
+
+        historian = None
+        if history_samples:
+            # HistoryRead of every simulated variable, recorded as it is written
+            historian = Historian(
+                _logger,
+                history_samples,
+                history_retention,
+                history_spill,
+                clock=clock,
+            )
+            historian.install(server)
+            await historian.historize(dairy_enterprise.simulated_variables.values())
+            writer.listeners.append(historian.record)
+            # Also the lines and equipment added while running
+            dairy_enterprise.variable_listeners.append(historian.update)
+
+        recorder = None
+        if record_path is not None:
+            # Every written value with its source timestamp, for validation
+            recorder = ValueRecorder(record_path, _logger)
+            recorder.start()
+            writer.listeners.append(recorder.record)
+            _logger.info(f"Recording to {recorder}")
 
-        await dairy_enterprise.add_production_line(cheese_production_line)
-        await dairy_enterprise.add_production_line(yogurt_production_line)
-        await dairy_enterprise.add_production_line(icecrean_production_line)
+        alarms = None
+        if alarm_rate:
+            # Limit alarms of the storage units and quality controls
+            alarms = AlarmEngine(server, _logger, clock, alarm_rate)
+            alarms.install()
+            dairy_enterprise.add_alarms(alarms)
+            _logger.info(f"Created {alarms}")
 
-        # Ensure all tasks are valid before gathering
-        valid_tasks = [
-            task for task in simulation_tasks if isinstance(task, asyncio.Task)
+        replay = None
+        if replay_path is not None:
+            # The recording drives the variables instead of the simulation
+            replay = Replay(
+                replay_path,
+                dairy_enterprise.simulated_variables,
+                writer,
+                _logger,
+                replay_speed,
+            )
+            _logger.info(f"Replaying {replay}")
+        else:
+            # Register the enterprise, production lines and equipment
+            await dairy_enterprise.run_simulation(scheduler)
+            for production_line in dairy_enterprise.production_lines:
+                if production_line.simulated:
+                    await production_line.run_simulation(scheduler)
+
+        # Live runtime metrics under the enterprise node (not in the snapshot)
+        diagnostics = Diagnostics(
+            _logger,
+            dairy_enterprise.node,
+            idx,
+            server,
+            RuntimeMetrics(server, scheduler, writer, loop_lag),
+        )
+        await diagnostics.initialize()
+        # Profiling methods on the enterprise node
+        await Profiler(_logger, dairy_enterprise.node, idx, profile_dir).initialize()
+        # Methods adding and removing lines and equipment while running
+        await PlantEditor(_logger, dairy_enterprise, idx, topology).initialize()
+
+        # A single task services every simulated variable, the signal banks
+        # are optionally stepped by a worker process
+        worker = None
+        simulation_tasks = [
+            asyncio.create_task(scheduler.run()),
+            asyncio.create_task(loop_lag.run()),
+            asyncio.create_task(diagnostics.run(dump_path=diagnostics_dump)),
+            # The simulated values are logged as one summary per interval
+            asyncio.create_task(log_summary(_logger).run(log_interval)),
         ]
+        if replay is not None:
+            simulation_tasks.append(asyncio.create_task(replay.run()))
+        if observed is not None:
+            simulation_tasks.append(asyncio.create_task(observed.run()))
+        if alarms is not None:
+            simulation_tasks.append(asyncio.create_task(alarms.run()))
+        if recorder is not None:
+            simulation_tasks.append(asyncio.create_task(recorder.run()))
+        if simulation_worker:
+            worker = SimulationWorker(scheduler, _logger)
+            worker.start()
+            simulation_tasks.append(asyncio.create_task(worker.join()))
 
         try:
-            # Then gather them
-            await asyncio.gather(*valid_tasks)
+            await asyncio.gather(*simulation_tasks)
         except Exception as e:
             _logger.error(f"Error during simulation: {e}")
-            # Cancel any remaining tasks
-            for task in valid_tasks:
-                if not task.done():
-                    task.cancel()
+        finally:
+            for simulation_task in simulation_tasks:
+                simulation_task.cancel()
+            if worker is not None:
+                worker.stop()
+            if recorder is not None:
+                recorder.close()
+
+
+def parse_speed(value: str) -> float | None:
+    """Simulation speed of the command line, None for as fast as possible"""
+    if value == "max":
+        return None
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError(f"speed must be positive or 'max': {value}")
+    return speed
+
+
+def parse_replay_speed(value: str) -> float:
+    """Replay speed of the command line"""
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError(f"replay speed must be positive: {value}")
+    return speed
+
+
+def parse_datetime(value: str) -> datetime:
+    """ISO 8601 time of the command line, UTC unless it has an offset"""
+    moment = datetime.fromisoformat(value)
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def run_shard(
+    topology_path: Path,
+    snapshot_path: Path | None,
+    diagnostics_dump: Path | None,
+    profile_dir: Path,
+    debug: bool,
+    options: dict,
+    shard: Shard,
+    discovery_endpoint: str | None,
+):
+    """
+    Entry point of a shard process started by the supervisor
+
+    `options` are passed on to `main` as they are.
+    """
+    logging.basicConfig(
+        level=logging.INFO, format=f"{shard.name}:%(levelname)s:%(name)s:%(message)s"
+    )
+    if snapshot_path is not None:
+        # Every shard keeps its own snapshot next to the given one
+        snapshot_path = snapshot_path.with_name(f"{snapshot_path.name}.{shard.name}")
+    if diagnostics_dump is not None:
+        diagnostics_dump = diagnostics_dump.with_stem(
+            f"{diagnostics_dump.stem}.{shard.name}"
+        )
+    if options.get("history_spill") is not None:
+        options = {**options, "history_spill": options["history_spill"] / shard.name}
+    if options.get("record_path") is not None:
+        options = {**options, "record_path": options["record_path"] / shard.name}
+    # The supervisor stops the shards, Ctrl+C in a terminal reaches all of them
+    with contextlib.suppress(KeyboardInterrupt), queued_logging():
+        asyncio.run(
+            main(
+                topology_path,
+                snapshot_path,
+                shard,
+                discovery_endpoint,
+                diagnostics_dump=diagnostics_dump,
+                profile_dir=profile_dir / shard.name,
+                **options,
+            ),
+            debug=debug,
+        )
+
+
+async def supervise(
+    topology_path: Path,
+    snapshot_path: Path | None,
+    shards: int,
+    host: str,
+    base_port: int,
+    discovery_endpoint: str | None,
+    diagnostics_dump: Path | None = None,
+    profile_dir: Path = PROFILE_DIR,
+    debug: bool = False,
+    **options,
+):
+    """
+    Run the plant as `shards` server processes
+
+    The keyword `options` are passed on to `main` in every shard.
+    """
+    _logger = logging.getLogger(__name__)
+    supervisor = Supervisor(
+        Shard.plan(shards, host, base_port, NAMESPACE),
+        functools.partial(
+            run_shard,
+            topology_path,
+            snapshot_path,
+            diagnostics_dump,
+            profile_dir,
+            debug,
+            options,
+        ),
+        _logger,
+        discovery_endpoint=discovery_endpoint,
+    )
+    await supervisor.run()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dairy enterprise OPC UA simulator")
+    parser.add_argument(
+        "--topology",
+        type=Path,
+        default=DEFAULT_TOPOLOGY,
+        help="Plant topology file (.toml, .json, .yaml)",
+    )
+    parser.add_argument(
+        "--snapshot",
+        type=Path,
+        default=None,
+        help="Address-space snapshot file: loaded when it matches the topology, "
+        "otherwise written after the plant is built",
+    )
+    parser.add_argument(
+        "--endpoint",
+        default=ENDPOINT,
+        help="Endpoint URL of the server (discovery endpoint in sharded mode)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Split the production lines over this many server processes",
+    )
+    parser.add_argument(
+        "--base-port",
+        type=int,
+        default=4841,
+        help="Port of the first shard, the others use the following ports",
+    )
+    parser.add_argument(
+        "--no-discovery",
+        action="store_true",
+        help="Do not serve the discovery endpoint listing the shards on --endpoint",
+    )
+    parser.add_argument(
+        "--simulation-worker",
+        action="store_true",
+        help="Step the signal models in a separate process that shares the "
+        "values through shared memory",
+    )
+    parser.add_argument(
+        "--diagnostics-dump",
+        type=Path,
+        default=None,
+        help="Also write the diagnostics every second to this file "
+        "(JSON for .json, one metric per line otherwise)",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=Path,
+        default=PROFILE_DIR,
+        help="Directory of the stats written by the StartProfiling, StopProfiling "
+        "and SnapshotMemory methods",
+    )
+    parser.add_argument(
+        "--debug",
+        action="store_true",
+        help="Run the event loop in asyncio debug mode (slow callback warnings, "
+        "with a noticeable overhead)",
+    )
+    parser.add_argument(
+        "--log-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between the summaries of the simulated values in the log",
+    )
+    parser.add_argument(
+        "--history-samples",
+        type=int,
+        default=300,
+        help="Values of every simulated variable kept in memory for HistoryRead "
+        "(0 disables the historian)",
+    )
+    parser.add_argument(
+        "--history-retention",
+        type=float,
+        default=24 * 3600.0,
+        help="Seconds of history kept in the --history-spill files",
+    )
+    parser.add_argument(
+        "--history-spill",
+        type=Path,
+        default=None,
+        help="Directory of memory-mapped files keeping the values pushed out "
+        "of memory until they are older than --history-retention",
+    )
+    parser.add_argument(
+        "--record",
+        type=Path,
+        default=None,
+        help="Directory recording every simulated value written, with its "
+        "source timestamp and node id (export with python -m history.recorder)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Make the simulated values reproducible: every node and signal "
+        "bank draws from its own generator derived from this seed (bank values "
+        "repeat for the same topology and shard layout)",
+    )
+    parser.add_argument(
+        "--replay",
+        type=Path,
+        default=None,
+        help="Replay a recording (.npy, see simulation/replay.py) into the "
+        "variables instead of simulating them",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=parse_replay_speed,
+        default=1.0,
+        help="Replay speed, 2 replays the recording twice as fast",
+    )
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="Only simulate the variables clients monitor or read, the others "
+        "are brought up to date when they are read",
+    )
+    parser.add_argument(
+        "--speed",
+        type=parse_speed,
+        default=1.0,
+        help="Simulation speed: 1 is real time, 60 simulates a minute per "
+        "second, 'max' simulates as fast as possible",
+    )
+    parser.add_argument(
+        "--clock-start",
+        type=parse_datetime,
+        default=None,
+        help="Simulated time at startup (ISO 8601, UTC unless given), the "
+        "current time by default",
+    )
+    parser.add_argument(
+        "--alarm-rate",
+        type=float,
+        default=1000.0,
+        help="Maximum alarm events per second sent to subscribers, the others "
+        "are coalesced (0 disables the alarms)",
+    )
+    parser.add_argument(
+        "--lag-target",
+        type=float,
+        default=100.0,
+        help="Event-loop and tick lag in milliseconds above which the writes of "
+        "low-priority variables are held back and coalesced (0 disables it)",
+    )
+    args = parser.parse_args()
+    if args.speed is None and args.simulation_worker:
+        parser.error("--simulation-worker steps in real time, not with --speed max")
+
     logging.basicConfig(level=logging.INFO)
-    asyncio.run(main(), debug=True)
+    if args.shards > 1:
+        asyncio.run(
+            supervise(
+                args.topology,
+                args.snapshot,
+                args.shards,
+                "0.0.0.0",
+                args.base_port,
+                None if args.no_discovery else args.endpoint,
+                args.diagnostics_dump,
+                args.profile_dir,
+                args.debug,
+                simulation_worker=args.simulation_worker,
+                log_interval=args.log_interval,
+                seed=args.seed,
+                replay_path=args.replay,
+                replay_speed=args.replay_speed,
+                history_samples=args.history_samples,
+                history_retention=args.history_retention,
+                history_spill=args.history_spill,
+                record_path=args.record,
+                lazy=args.lazy,
+                speed=args.speed,
+                clock_start=args.clock_start,
+                alarm_rate=args.alarm_rate,
+                lag_target=args.lag_target,
+            )
+        )
+    else:
+        with queued_logging():
+            asyncio.run(
+                main(
+                    args.topology,
+                    args.snapshot,
+                    simulation_worker=args.simulation_worker,
+                    endpoint=args.endpoint,
+                    diagnostics_dump=args.diagnostics_dump,
+                    profile_dir=args.profile_dir,
+                    log_interval=args.log_interval,
+                    seed=args.seed,
+                    replay_path=args.replay,
+                    replay_speed=args.replay_speed,
+                    history_samples=args.history_samples,
+                    history_retention=args.history_retention,
+                    history_spill=args.history_spill,
+                    record_path=args.record,
+                    lazy=args.lazy,
+                    speed=args.speed,
+                    clock_start=args.clock_start,
+                    alarm_rate=args.alarm_rate,
+                    lag_target=args.lag_target,
+                ),
+                debug=args.debug,
+            )
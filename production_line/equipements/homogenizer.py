@@ -1,9 +1,25 @@
+from typing import Optional
 from asyncua import Node
 import logging
+from address_space import NodeBuilder
 from production_line.equipment import Equipment
+from production_line.process_model import ProcessLine
+from simulation import Deadband, FirstOrderLag, MarkovChain, Signal
 
 
 class Homogenizer(Equipment):
+    # Homogenization pressure in bar (without a process model)
+    signals = {
+        "Pressure": Signal(
+            FirstOrderLag, setpoint=180.0, time_constant=15.0, noise=1.5
+        ),
+        "Status": Signal(MarkovChain, ("Off", "On"), ((0.9, 0.1), (0.02, 0.98))),
+    }
+    # Pressure changes below the sensor noise are not published
+    deadbands = {"Pressure": Deadband(absolute=1.0)}
+    # Published by the process model of a milk processing line
+    process_outputs = {"Pressure": "Pressure", "Status": "HomogenizerStatus"}
+
     def __init__(
         self,
         logger: logging.Logger,
@@ -12,10 +28,27 @@ class Homogenizer(Equipment):
         variables: list[dict],
         properties: list[dict],
         methods: list[dict],
+        name: str = "Homogenizer",
+        signals: dict[str, Signal] | None = None,
+        deadbands: dict[str, Deadband] | None = None,
     ):
         super().__init__(
-            "Homogenizer", logger, parent_node, idx, variables, properties, methods
+            name,
+            logger,
+            parent_node,
+            idx,
+            variables,
+            properties,
+            methods,
+            signals,
+            deadbands,
         )
 
-    async def initialize(self):
-        await super().initialize()
+    async def initialize(self, builder: Optional[NodeBuilder] = None):
+        await super().initialize(builder)
+
+    def add_to_process(self, line: ProcessLine) -> int:
+        return line.model.add_homogenizer(line.index)
+
+    def remove_from_process(self, line: ProcessLine, entity: int):
+        line.model.remove_homogenizer(entity)
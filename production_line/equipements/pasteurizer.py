@@ -1,10 +1,35 @@
-from typing import Callable
+from typing import Callable, Optional
 from asyncua import Node
 import logging
+from address_space import NodeBuilder
 from production_line.equipment import Equipment
+from production_line.process_model import ProcessLine
+from simulation import Deadband, FirstOrderLag, MarkovChain, Signal, SineWave
 
 
 class Pasteurizer(Equipment):
+    # HTST pasteurization holds the milk at about 72 °C (without a process model)
+    signals = {
+        "Temperature": Signal(
+            SineWave, offset=72.0, amplitude=0.8, period=120.0, noise=0.15
+        ),
+        "FlowRate": Signal(
+            FirstOrderLag, setpoint=10.0, time_constant=20.0, noise=0.05
+        ),
+        "Status": Signal(MarkovChain, ("Off", "On"), ((0.9, 0.1), (0.02, 0.98))),
+    }
+    # Changes below the sensor noise are not published
+    deadbands = {
+        "Temperature": Deadband(absolute=0.1),
+        "FlowRate": Deadband(percent=1.0),
+    }
+    # Published by the process model of a milk processing line
+    process_outputs = {
+        "Temperature": "Temperature",
+        "FlowRate": "FlowRate",
+        "Status": "PasteurizerStatus",
+    }
+
     def __init__(
         self,
         logger: logging.Logger,
@@ -13,10 +38,27 @@ class Pasteurizer(Equipment):
         variables: list[dict[str, any]],
         properties: list[dict[str, any]],
         methods: list[dict[str, Callable[[], any]]],
+        name: str = "Pasteurizer",
+        signals: dict[str, Signal] | None = None,
+        deadbands: dict[str, Deadband] | None = None,
     ):
         super().__init__(
-            "Pasteurizer", logger, parent_node, idx, variables, properties, methods
+            name,
+            logger,
+            parent_node,
+            idx,
+            variables,
+            properties,
+            methods,
+            signals,
+            deadbands,
         )
 
-    async def initialize(self):
-        await super().initialize()
+    async def initialize(self, builder: Optional[NodeBuilder] = None):
+        await super().initialize(builder)
+
+    def add_to_process(self, line: ProcessLine) -> int:
+        return line.model.add_pasteurizer(line.index)
+
+    def remove_from_process(self, line: ProcessLine, entity: int):
+        line.model.remove_pasteurizer(entity)
@@ -1,15 +1,50 @@
-import asyncio
-from asyncio import Task
+import functools
 import logging
-from typing import Callable
+from typing import Any, Callable, Optional
 from asyncua import Node, ua
 import random
+from address_space import AddressSpaceSnapshot, NodeBuilder
+from simulation import LOW, Deadband, Scheduler, Signal, SimulatedVariable
+from production_line.process_model import ProcessLine
+
+# Random value generators per data type, chosen once when the node is created
+RANDOM_GENERATORS: dict[ua.VariantType, Callable[[random.Random, Any], Any]] = {
+    ua.VariantType.Float: lambda rng, _: round(rng.uniform(0, 100), 4),
+    ua.VariantType.Double: lambda rng, _: round(rng.uniform(0, 100), 4),
+    ua.VariantType.Boolean: lambda rng, _: rng.choice([True, False]),
+    ua.VariantType.Int32: lambda rng, _: rng.randint(50, 100),
+    ua.VariantType.Int64: lambda rng, _: rng.randint(0, 50),
+    ua.VariantType.Int16: lambda rng, _: rng.randint(0, 25),
+    ua.VariantType.String: lambda rng, _: rng.choice(["On", "Off"]),
+}
+
+
+def random_generator(
+    variant_type: ua.VariantType, rng: random.Random
+) -> Optional[Callable[[Any], Any]]:
+    """Random value generator of a data type drawing from `rng`"""
+    generator = RANDOM_GENERATORS.get(variant_type)
+    return None if generator is None else functools.partial(generator, rng)
 
 
 class Equipment:
-    """Equipment for a production line"""
+    """
+    Equipment for a production line
 
-    _variable_nodes: list[Node] = []
+    Variables listed in `process_outputs` are published by the process
+    model of the line when the line has one, variables listed in `signals`
+    are driven by vectorized signal banks, the others fall back to random
+    values per data type. Variables listed in `deadbands` are only written
+    when they move past their deadband, the others whenever they change.
+    While the simulator sheds load the writes of the variables are held
+    back according to `priority`.
+    """
+
+    simulation_period = 2.0
+    priority = LOW
+    signals: dict[str, Signal] = {}
+    deadbands: dict[str, Deadband] = {}
+    process_outputs: dict[str, str] = {}
 
     def __init__(
         self,
@@ -20,6 +55,8 @@ class Equipment:
         variables: list[dict[str, any]] | None = None,
         properties: list[dict[str, any]] | None = None,
         methods: list[dict[str, Callable[[], any]]] | None = None,
+        signals: dict[str, Signal] | None = None,
+        deadbands: dict[str, Deadband] | None = None,
     ):
         self.name = name
         self.logger = logger
@@ -29,51 +66,111 @@ class Equipment:
         self.variables = variables
         self.properties = properties
         self.methods = methods
+        self.signals = {**type(self).signals, **(signals or {})}
+        self.deadbands = {**type(self).deadbands, **(deadbands or {})}
+        self._variables: dict[str, SimulatedVariable] = {}
+        self._process: Optional[tuple[ProcessLine, int]] = None
 
-    async def initialize(self):
-        """Initialize the equipment"""
-        self.node = await self.parent_node.add_object(self.idx, self.name)
-        self.logger.info(f"Created equipment node: {self.name}")
+    async def initialize(self, builder: Optional[NodeBuilder] = None):
+        """
+        Initialize the equipment
+
+        The nodes are queued on `builder` when one is given and created when
+        the caller commits it, otherwise they are created right away.
+        """
+        own_builder = builder is None
+        if own_builder:
+            builder = NodeBuilder(self.parent_node.session)
+        self.node = builder.add_object(self.parent_node, self.idx, self.name)
 
         for variable in self.variables:
             for var_name, var_value in variable.items():
-                var = await self.node.add_variable(self.idx, var_name, var_value)
-                await var.set_writable()
-                self._variable_nodes.append(var)
+                variant = ua.Variant(var_value)
+                var = builder.add_variable(
+                    self.node, self.idx, var_name, variant, writable=True
+                )
+                self._variables[var_name] = SimulatedVariable(
+                    var,
+                    variant.VariantType,
+                    var_value,
+                    random_generator(variant.VariantType, random),
+                    self.deadbands.get(var_name),
+                )
 
         for property in self.properties:
             for prop_name, prop_value in property.items():
-                prop = await self.node.add_property(self.idx, prop_name, prop_value)
-                await prop.set_writable()
+                builder.add_property(
+                    self.node, self.idx, prop_name, prop_value, writable=True
+                )
+
+        for method in self.methods:
+            for method_name, method_func in method.items():
+                builder.add_method(self.node, self.idx, method_name, method_func)
+
+        if own_builder:
+            await builder.commit()
+        self.logger.info(f"Created equipment node: {self.name}")
+
+    def bind(self, snapshot: AddressSpaceSnapshot):
+        """Bind the equipment to its nodes in an address-space snapshot"""
+        self.node = snapshot.child(self.parent_node, self.name)
+
+        for variable in self.variables:
+            for var_name in variable:
+                var = snapshot.variable(self.node, var_name)
+                var.generator = random_generator(var.variant_type, random)
+                var.deadband = self.deadbands.get(var_name)
+                self._variables[var_name] = var
 
         for method in self.methods:
             for method_name, method_func in method.items():
-                await self.node.add_method(self.idx, method_name, method_func)
-
-    def run_simulation(self) -> list[Task]:
-        """Run the simulation"""
-        tasks = []
-        for node in self._variable_nodes:
-            task = asyncio.create_task(self._set_random_values(node))
-            tasks.append(task)
-        return tasks
-
-    async def _set_random_values(self, node: Node):
-        """Set random values for the variables"""
-        while True:
-            data_type = await node.read_data_type_as_variant_type()
-            if data_type == ua.VariantType.Float:
-                await node.write_value(round(random.uniform(0, 100), 4))
-            elif data_type == ua.VariantType.Double:
-                await node.write_value(round(random.uniform(0, 100), 4))
-            elif data_type == ua.VariantType.Boolean:
-                await node.write_value(random.choice([True, False]))
-            elif data_type == ua.VariantType.Int32:
-                await node.write_value(random.randint(50, 100))
-            elif data_type == ua.VariantType.Int64:
-                await node.write_value(random.randint(0, 50))
-            elif data_type == ua.VariantType.Int16:
-                await node.write_value(random.randint(0, 25))
-            elif data_type == ua.VariantType.String:
-                await node.write_value(random.choice(["On", "Off"]))
-            await asyncio.sleep(2)
+                snapshot.link_method(self.node, method_name, method_func)
+
+    @property
+    def simulated_variables(self) -> dict[str, SimulatedVariable]:
+        """Get the simulated variables by name"""
+        return dict(self._variables)
+
+    def simulated_signals(self, coupled: bool) -> dict[str, Signal]:
+        """Get the signals driving variables once simulated, on a coupled line or not"""
+        names = {name for variable in self.variables for name in variable}
+        return {
+            name: signal
+            for name, signal in self.signals.items()
+            if name in names and not (coupled and name in self.process_outputs)
+        }
+
+    def add_to_process(self, line: ProcessLine) -> Optional[int]:
+        """Add the equipment to the process model of its line, return its entity"""
+        return None
+
+    def remove_from_process(self, line: ProcessLine, entity: int):
+        """Take the entity of the equipment out of the process model of its line"""
+
+    def run_simulation(self, scheduler: Scheduler, line: Optional[ProcessLine] = None):
+        """Register the equipment variables with the simulation scheduler"""
+        entity = None if line is None else self.add_to_process(line)
+        if entity is not None:
+            self._process = (line, entity)
+        for var_name, variable in self._variables.items():
+            variable.priority = self.priority
+            output = None if entity is None else self.process_outputs.get(var_name)
+            signal = self.signals.get(var_name)
+            if output is not None:
+                line.attach(variable, output, entity)
+            elif signal is not None:
+                scheduler.add_signal(self.simulation_period, variable, signal)
+            else:
+                if variable.generator is not None:
+                    # Draw from the random source of the node
+                    variable.generator = random_generator(
+                        variable.variant_type, scheduler.random(variable.node)
+                    )
+                scheduler.add(self.simulation_period, variable)
+
+    def stop_simulation(self, scheduler: Scheduler):
+        """Remove the equipment variables from the simulation scheduler"""
+        scheduler.remove(self._variables.values())
+        if self._process is not None:
+            self.remove_from_process(*self._process)
+            self._process = None
@@ -0,0 +1,279 @@
+from typing import Any, Optional
+import numpy as np
+from asyncua import ua
+from diagnostics import LogSummary
+from simulation import EntityModel, Scheduler, Signal, SimulatedVariable
+
+# Temperature of a pasteurizer without heating, °C
+AMBIENT_TEMPERATURE = 20.0
+# Below this temperature the milk is diverted instead of forwarded (HTST)
+DIVERT_TEMPERATURE = 71.7
+# Homogenizer pressures within this fraction of the setpoint count as good
+PRESSURE_TOLERANCE = 0.1
+
+# Time constants of the lags in seconds
+HEATING_TIME_CONSTANT = 30.0
+FLOW_TIME_CONSTANT = 10.0
+PRESSURE_TIME_CONSTANT = 5.0
+RATE_TIME_CONSTANT = 5.0
+
+# Standard deviation of the measurement noise per tick
+TEMPERATURE_NOISE = 0.05
+FLOW_NOISE = 0.05
+PRESSURE_NOISE = 1.0
+
+
+def _lag(values: np.ndarray, target: np.ndarray, dt: float, time_constant: float):
+    values += (target - values) * (1.0 - np.exp(-dt / time_constant))
+
+
+class MilkProcessModel(EntityModel):
+    """
+    Coupled process model of every milk processing line of a rate group
+
+    Lines, pasteurizers and homogenizers are rows of per-entity state
+    arrays, and a tick advances all of them in one vectorized step:
+    - a running line heats its pasteurizers toward their temperature
+      setpoint and ramps their flow toward the flow setpoint, a stopped
+      line lets them cool down and stops the flow
+    - milk below DIVERT_TEMPERATURE is diverted (interlock) and does not
+      count as production
+    - homogenizer pressure follows the share of the nominal flow of the line
+    - ProductionRate is the forwarded share of the nominal flow of the
+      line, Efficiency the forwarded share of the actual flow times the
+      share of homogenizers at pressure
+
+    Lines and equipment removed at runtime keep their rows, idle, so the
+    indices of the others do not change; removed equipment is inactive and
+    no longer counts toward its line. The published values of the
+    variables given to `summarize` are accounted in a log summary.
+    """
+
+    entities = {
+        "line": ("running", "nominal_flow", "production_rate", "efficiency"),
+        "pasteurizer": (
+            "line",
+            "temperature_setpoint",
+            "flow_setpoint",
+            "temperature",
+            "flow_rate",
+            "on",
+            "active",
+        ),
+        "homogenizer": ("line", "pressure_setpoint", "pressure", "on", "active"),
+    }
+    outputs = {
+        "ProductionRate": ("line", "production_rate"),
+        "Efficiency": ("line", "efficiency"),
+        "Temperature": ("pasteurizer", "temperature"),
+        "FlowRate": ("pasteurizer", "flow_rate"),
+        "PasteurizerStatus": ("pasteurizer", "on"),
+        "Pressure": ("homogenizer", "pressure"),
+        "HomogenizerStatus": ("homogenizer", "on"),
+    }
+
+    def __init__(self, rng: Optional[np.random.Generator] = None, decimals: int = 4):
+        super().__init__(rng, decimals)
+        self._summarized: dict[SimulatedVariable, tuple[LogSummary, str, str]] = {}
+
+    def summarize(
+        self,
+        variable: SimulatedVariable,
+        summary: LogSummary,
+        component: str,
+        name: str,
+    ):
+        """Account the values published into a variable as `name` of `component`"""
+        self._summarized[variable] = (summary, component, name)
+
+    def apply(
+        self, published: np.ndarray, slots: Optional[np.ndarray] = None
+    ) -> list[SimulatedVariable]:
+        changed = super().apply(published, slots)
+        if self._summarized:
+            for variable in changed:
+                summarized = self._summarized.get(variable)
+                if summarized is not None:
+                    summary, component, name = summarized
+                    summary.record(component, name, variable.value)
+        return changed
+
+    def _remove(self, keep: np.ndarray):
+        super()._remove(keep)
+        kept = set(self.variables)
+        self._summarized = {
+            variable: summarized
+            for variable, summarized in self._summarized.items()
+            if variable in kept
+        }
+
+    def add_line(self, running: bool = True) -> int:
+        """Add a production line, starting at its steady state, return its index"""
+        return self.add(
+            "line",
+            running=float(running),
+            production_rate=float(running),
+            efficiency=float(running),
+        )
+
+    def add_pasteurizer(
+        self,
+        line: int,
+        temperature_setpoint: float = 72.5,
+        flow_setpoint: float = 10.0,
+    ) -> int:
+        """Add a pasteurizer of a line, starting at its steady state"""
+        running = bool(self.state["line"]["running"][line])
+        self.state["line"]["nominal_flow"][line] += flow_setpoint
+        return self.add(
+            "pasteurizer",
+            line=line,
+            temperature_setpoint=temperature_setpoint,
+            flow_setpoint=flow_setpoint,
+            temperature=temperature_setpoint if running else AMBIENT_TEMPERATURE,
+            flow_rate=flow_setpoint if running else 0.0,
+            on=float(running),
+            active=1.0,
+        )
+
+    def add_homogenizer(self, line: int, pressure_setpoint: float = 180.0) -> int:
+        """Add a homogenizer of a line, starting at its steady state"""
+        running = bool(self.state["line"]["running"][line])
+        return self.add(
+            "homogenizer",
+            line=line,
+            pressure_setpoint=pressure_setpoint,
+            pressure=pressure_setpoint if running else 0.0,
+            on=float(running),
+            active=1.0,
+        )
+
+    def set_running(self, line: int, running: bool):
+        """Start or stop a line, its equipment follows on the next ticks"""
+        self.state["line"]["running"][line] = float(running)
+
+    def remove_pasteurizer(self, pasteurizer: int):
+        """Take a pasteurizer out of its line, its row stays inactive"""
+        pasteurizers = self.state["pasteurizer"]
+        line = int(pasteurizers["line"][pasteurizer])
+        self.state["line"]["nominal_flow"][line] -= pasteurizers["flow_setpoint"][
+            pasteurizer
+        ]
+        pasteurizers["flow_setpoint"][pasteurizer] = 0.0
+        pasteurizers["flow_rate"][pasteurizer] = 0.0
+        pasteurizers["active"][pasteurizer] = 0.0
+
+    def remove_homogenizer(self, homogenizer: int):
+        """Take a homogenizer out of its line, its row stays inactive"""
+        homogenizers = self.state["homogenizer"]
+        homogenizers["pressure_setpoint"][homogenizer] = 0.0
+        homogenizers["pressure"][homogenizer] = 0.0
+        homogenizers["active"][homogenizer] = 0.0
+
+    def step(self, dt: float):
+        lines = self.state["line"]
+        pasteurizers = self.state["pasteurizer"]
+        homogenizers = self.state["homogenizer"]
+        count = len(lines["running"])
+        rng = self._rng
+
+        # Active pasteurizers heat and pump while their line runs
+        line = pasteurizers["line"].astype(np.intp)
+        on = lines["running"][line] * pasteurizers["active"]
+        pasteurizers["on"][:] = on
+        temperature = pasteurizers["temperature"]
+        _lag(
+            temperature,
+            np.where(on > 0, pasteurizers["temperature_setpoint"], AMBIENT_TEMPERATURE),
+            dt,
+            HEATING_TIME_CONSTANT,
+        )
+        temperature += TEMPERATURE_NOISE * rng.standard_normal(len(temperature))
+        flow = pasteurizers["flow_rate"]
+        _lag(flow, pasteurizers["flow_setpoint"] * on, dt, FLOW_TIME_CONSTANT)
+        flow += FLOW_NOISE * on * rng.standard_normal(len(flow))
+        np.maximum(flow, 0.0, out=flow)
+
+        # Interlock: milk that is not hot enough is diverted
+        forward = np.where(temperature >= DIVERT_TEMPERATURE, flow, 0.0)
+        total_flow = np.bincount(line, flow, minlength=count)
+        forward_flow = np.bincount(line, forward, minlength=count)
+        nominal = lines["nominal_flow"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            flow_share = np.where(nominal > 0, total_flow / nominal, 0.0)
+            forward_share = np.where(nominal > 0, forward_flow / nominal, 0.0)
+            forwarded = np.where(total_flow > 0, forward_flow / total_flow, 0.0)
+
+        # Homogenizer pressure follows the flow through the line
+        line = homogenizers["line"].astype(np.intp)
+        active = homogenizers["active"]
+        homogenizers["on"][:] = lines["running"][line] * active
+        setpoint = homogenizers["pressure_setpoint"]
+        pressure = homogenizers["pressure"]
+        _lag(
+            pressure,
+            setpoint * np.minimum(flow_share[line], 1.0),
+            dt,
+            PRESSURE_TIME_CONSTANT,
+        )
+        pressure += (
+            PRESSURE_NOISE * homogenizers["on"] * rng.standard_normal(len(pressure))
+        )
+        np.maximum(pressure, 0.0, out=pressure)
+        at_pressure = np.abs(pressure - setpoint) <= PRESSURE_TOLERANCE * setpoint
+        homogenizer_count = np.bincount(line, active, minlength=count)
+        good = np.bincount(line, at_pressure * active, minlength=count)
+        at_pressure_share = np.where(
+            homogenizer_count > 0, good / np.maximum(homogenizer_count, 1), 1.0
+        )
+
+        _lag(lines["production_rate"], forward_share, dt, RATE_TIME_CONSTANT)
+        _lag(lines["efficiency"], forwarded * at_pressure_share, dt, RATE_TIME_CONSTANT)
+
+    def _to_python(self, value: Any, variable: SimulatedVariable) -> Any:
+        if variable.variant_type == ua.VariantType.String:
+            return "On" if value else "Off"
+        return super()._to_python(value, variable)
+
+
+class ProcessLine:
+    """
+    A production line in the process model of its rate group
+
+    All lines simulated with the same period share one MilkProcessModel,
+    which the scheduler steps as one signal bank.
+    """
+
+    def __init__(self, scheduler: Scheduler, period: float, running: bool = False):
+        self.period = period
+        self.model: MilkProcessModel = scheduler.signal_bank(period, MilkProcessModel)
+        self.index = self.model.add_line(running)
+        self._scheduler = scheduler
+
+    def __str__(self):
+        return f"ProcessLine(index={self.index}, model={self.model})"
+
+    def attach(
+        self, variable: SimulatedVariable, output: str, entity: Optional[int] = None
+    ):
+        """Publish an output of the line, or of one of its equipment, into a variable"""
+        signal = Signal(
+            MilkProcessModel,
+            output=output,
+            entity=self.index if entity is None else entity,
+        )
+        self._scheduler.add_signal(self.period, variable, signal)
+
+    def summarize(
+        self,
+        variable: SimulatedVariable,
+        summary: LogSummary,
+        component: str,
+        name: str,
+    ):
+        """Account the values published into a variable in a log summary"""
+        self.model.summarize(variable, summary, component, name)
+
+    def set_running(self, running: bool):
+        """Start or stop the line"""
+        self.model.set_running(self.index, running)
@@ -2,9 +2,11 @@ import logging
 from typing import Optional
 from production_line.equipment import Equipment
 from asyncua import Node, ua, Client
-import asyncio
-from asyncio import Task
 import random
+from address_space import AddressSpaceSnapshot, NodeBuilder
+from production_line.process_model import ProcessLine
+from simulation import CRITICAL, BatchWriter, Scheduler, SimulatedVariable
+from diagnostics import log_summary
 
 
 class ProductionLine:
@@ -16,15 +18,17 @@ class ProductionLine:
     - Yogurt processing line
 
     Attributes:
-    - _batch_id: str (unique identifier for the batch)
-    - _production_rate: float (production rate in units per second)
-    - _efficiency: float (efficiency percentage of the production line)
+    - _batch_id: SimulatedVariable (identifier of the running batch, empty when stopped)
+    - _production_rate: SimulatedVariable (forwarded share of the nominal flow)
+    - _efficiency: SimulatedVariable (forwarded share of the flow times the share of homogenizers at pressure)
+    - priority: int (write priority of the rates while the simulator sheds load)
     """
 
-    _batch_id: Optional[Node] = None
-    _production_rate: Optional[Node] = None
-    _efficiency: Optional[Node] = None
-    _simulation_tasks: list[Task] = []
+    _batch_id: Optional[SimulatedVariable] = None
+    _production_rate: Optional[SimulatedVariable] = None
+    _efficiency: Optional[SimulatedVariable] = None
+    simulation_period = 1.0
+    priority = CRITICAL
     instance = None
 
     def __init__(
@@ -33,94 +37,228 @@ class ProductionLine:
         logger: logging.Logger,
         parent_node: Node,
         idx: int,
+        simulated: bool = True,
+        coupled: bool = True,
     ):
         self.name = name
         self._logger = logger
+        self._summary = log_summary(logger)
+        self._random = random
         self._parent_node = parent_node
         self._idx = idx
         self.node: Node = None
+        self.simulated = simulated
+        self.coupled = coupled
+        self._process: Optional[ProcessLine] = None
+        self._writer: Optional[BatchWriter] = None
+        self._scheduler: Optional[Scheduler] = None
+        self._equipment: list[Equipment] = []
 
     def __str__(self):
         return f"ProductionLine(name={self.name})"
 
-    async def initialize(self):
-        """Create a node object for the production line"""
-        self.node = await self._parent_node.add_object(self._idx, self.name)
-        self._logger.info(f"Created production line node: {self.name}")
+    @property
+    def parent_node(self) -> Node:
+        """Get the node the production line was created under"""
+        return self._parent_node
+
+    async def initialize(self, builder: Optional[NodeBuilder] = None):
+        """
+        Create a node object for the production line
+
+        The nodes are queued on `builder` when one is given and created when
+        the caller commits it, otherwise they are created right away.
+        """
+        own_builder = builder is None
+        if own_builder:
+            builder = NodeBuilder(self._parent_node.session)
+        self.node = builder.add_object(self._parent_node, self._idx, self.name)
 
         # Create ProductionRate variable
-        self._production_rate = await self.node.add_variable(
-            self._idx, "ProductionRate", 0.0, ua.VariantType.Double
+        production_rate = builder.add_variable(
+            self.node,
+            self._idx,
+            "ProductionRate",
+            0.0,
+            ua.VariantType.Double,
+            writable=True,
+        )
+        self._production_rate = SimulatedVariable(
+            production_rate, ua.VariantType.Double, 0.0
         )
-        await self._production_rate.set_writable()
 
         # Create Efficiency variable
-        self._efficiency = await self.node.add_variable(
-            self._idx, "Efficiency", 0.0, ua.VariantType.Double
+        efficiency = builder.add_variable(
+            self.node,
+            self._idx,
+            "Efficiency",
+            0.0,
+            ua.VariantType.Double,
+            writable=True,
         )
-        await self._efficiency.set_writable()
+        self._efficiency = SimulatedVariable(efficiency, ua.VariantType.Double, 0.0)
 
         # Create BatchId property
-        self._batch_id = await self.node.add_property(
-            self._idx, "BatchId", "", ua.VariantType.String
+        batch_id = builder.add_property(
+            self.node, self._idx, "BatchId", "", ua.VariantType.String, writable=True
         )
-        await self._batch_id.set_writable()
+        self._batch_id = SimulatedVariable(batch_id, ua.VariantType.String, "")
+
+        if own_builder:
+            await builder.commit()
+        self._logger.info(f"Created production line node: {self.name}")
+        return self.node
 
+    def bind(self, snapshot: AddressSpaceSnapshot) -> Node:
+        """Bind the production line to its nodes in an address-space snapshot"""
+        self.node = snapshot.child(self._parent_node, self.name)
+        self._production_rate = snapshot.variable(self.node, "ProductionRate")
+        self._efficiency = snapshot.variable(self.node, "Efficiency")
+        self._batch_id = snapshot.variable(self.node, "BatchId")
         return self.node
 
     async def add_equipment(self, equipment: Equipment):
         """Add equipment to the production line"""
         await self.node.add_reference(equipment.node, ua.ObjectIds.HasComponent)
 
+    @property
+    def batch_id(self) -> str:
+        """Get the id of the running batch, empty while no batch runs"""
+        return self._batch_id.value
+
+    def begin_batch(self, batch_id: str) -> list[SimulatedVariable]:
+        """
+        Start a batch without writing to the address space
+
+        Return the variables whose new values are to be written, so the
+        batches of many lines can be written in a single request.
+        """
+        self._batch_id.value = self._batch_id.published = batch_id
+        if self._process is not None:
+            self._process.set_running(True)
+            return [self._batch_id]
+        return [self._batch_id, *self._set_rates(0.7, 0.5)]
+
+    def end_batch(self) -> list[SimulatedVariable]:
+        """Stop the batch without writing, return the variables to write"""
+        self._batch_id.value = self._batch_id.published = ""
+        if self._process is not None:
+            self._process.set_running(False)
+            return [self._batch_id]
+        return [self._batch_id, *self._set_rates(0.0, 0.0)]
+
+    def _set_rates(self, production_rate: float, efficiency: float):
+        for variable, value in (
+            (self._production_rate, production_rate),
+            (self._efficiency, efficiency),
+        ):
+            variable.value = variable.published = value
+        return [self._production_rate, self._efficiency]
+
     async def start_batch(self, batch_id: str):
-        await self._batch_id.write_value(batch_id)
-        await self._production_rate.write_value(0.7)
-        await self._efficiency.write_value(0.5)
+        """Start a batch on the line"""
+        await self._write(self.begin_batch(batch_id))
 
     async def stop_batch(self):
-        await self._batch_id.write_value("")
-        await self._production_rate.write_value(0.0)
-        await self._efficiency.write_value(0.0)
+        """Stop the batch running on the line"""
+        await self._write(self.end_batch())
 
-    async def run_simulation(self) -> list[Task]:
+    async def _write(self, variables: list[SimulatedVariable]):
+        """Write the values in one request once simulated, one by one before"""
+        if self._writer is not None:
+            await self._writer.write(variables)
+            return
+        for variable in variables:
+            await variable.write(variable.value)
+
+    async def run_simulation(self, scheduler: Scheduler):
+        """
+        Register the production line and its equipment with the scheduler
+
+        A coupled line and its pasteurizers and homogenizers are published
+        by the process model shared by all lines of the same period, the
+        other variables are simulated independently. The rates are logged
+        in the interval summaries either way.
+        """
+        self._random = scheduler.random(self.node)
+        self._writer = scheduler.writer
+        self._scheduler = scheduler
+        self._production_rate.priority = self._efficiency.priority = self.priority
+        if self.coupled:
+            self._process = ProcessLine(scheduler, self.simulation_period, True)
+            for variable, name in (
+                (self._production_rate, "ProductionRate"),
+                (self._efficiency, "Efficiency"),
+            ):
+                self._process.attach(variable, name)
+                self._process.summarize(variable, self._summary, self.name, name)
+        else:
+            # Random rates, logged by their generators
+            self._production_rate.generator = self._next_production_rate
+            self._efficiency.generator = self._next_efficiency
+            scheduler.add(self.simulation_period, self._production_rate)
+            scheduler.add(self.simulation_period, self._efficiency)
         await self.start_batch("batch-12")
-        """Run the simulation of the production line"""
-        self._simulation_tasks.extend(
-            [
-                asyncio.create_task(self._set_production_rate()),
-                asyncio.create_task(self._set_efficiency()),
-            ]
-        )
-        return self._simulation_tasks
-
-    async def _set_production_rate(self):
-        """Set the production rate of the production line"""
-        while True:
-            production_rate = await self._production_rate.read_value()
-            await self._production_rate.set_value(
-                round(production_rate * random.uniform(0.5, 1.0), 4)
-            )
-            self._logger.info(
-                f"Production rate set to {production_rate} for {self.name}"
-            )
-            await asyncio.sleep(1)
-
-    async def _set_efficiency(self):
-        """Set the efficiency of the production line"""
-        while True:
-            efficiency = await self._efficiency.read_value()
-            await self._efficiency.set_value(
-                round(efficiency * random.uniform(0.5, 1.0), 4)
-            )
-            self._logger.info(f"Efficiency set to {efficiency} for {self.name}")
-            await asyncio.sleep(1)
-
-    def add_simulation_task(self, task: list[Task]):
-        """Add an equipment task to the production line"""
-        if self._simulation_tasks is None:
-            self._simulation_tasks = []
-        self._simulation_tasks.extend(task)
-
-    def get_simulation_tasks(self) -> list[Task]:
-        """Get the simulation tasks"""
-        return self._simulation_tasks
+        for equipment in self._equipment:
+            equipment.run_simulation(scheduler, self._process)
+
+    def _next_production_rate(self, production_rate: float) -> float:
+        """Compute the next production rate of the production line"""
+        production_rate = round(production_rate * self._random.uniform(0.5, 1.0), 4)
+        self._summary.record(self.name, "ProductionRate", production_rate)
+        return production_rate
+
+    def _next_efficiency(self, efficiency: float) -> float:
+        """Compute the next efficiency of the production line"""
+        efficiency = round(efficiency * self._random.uniform(0.5, 1.0), 4)
+        self._summary.record(self.name, "Efficiency", efficiency)
+        return efficiency
+
+    def stop_simulation(self):
+        """Remove the production line and its equipment from the scheduler"""
+        if self._scheduler is None:
+            return
+        for equipment in self._equipment:
+            equipment.stop_simulation(self._scheduler)
+        self._scheduler.remove([self._production_rate, self._efficiency])
+        if self._process is not None:
+            # The line stays in the process model, stopped
+            self._process.set_running(False)
+        self._scheduler = self._writer = self._process = None
+
+    def add_simulated_equipment(self, equipment: Equipment):
+        """
+        Simulate the equipment together with the production line
+
+        Equipment added while the line is simulated is simulated right away.
+        """
+        self._equipment.append(equipment)
+        if self._scheduler is not None:
+            equipment.run_simulation(self._scheduler, self._process)
+
+    def remove_simulated_equipment(self, name: str) -> Optional[Equipment]:
+        """Stop simulating the named equipment and remove it from the line"""
+        equipment = next((e for e in self._equipment if e.name == name), None)
+        if equipment is None:
+            return None
+        self._equipment.remove(equipment)
+        if self._scheduler is not None:
+            equipment.stop_simulation(self._scheduler)
+        return equipment
+
+    @property
+    def equipment(self) -> list[Equipment]:
+        """Get the simulated equipment"""
+        return self._equipment
+
+    @property
+    def simulated_variables(self) -> dict[str, SimulatedVariable]:
+        """Get the simulated variables by path below the production line"""
+        variables = {
+            "ProductionRate": self._production_rate,
+            "Efficiency": self._efficiency,
+        }
+        for equipment in self._equipment:
+            for name, variable in equipment.simulated_variables.items():
+                variables[f"{equipment.name}/{name}"] = variable
+        return variables
@@ -1,5 +1,7 @@
 from asyncua import Node
 import logging
+from typing import Optional
+from address_space import AddressSpaceSnapshot, NodeBuilder
 from .quality_control import QualityControl
 
 
@@ -7,15 +9,23 @@ async def get_milk_quality_control(
     parent_node: Node,
     idx: int,
     logger: logging.Logger,
+    name: str = "Milk Quality Control",
+    snapshot: Optional[AddressSpaceSnapshot] = None,
+    builder: Optional[NodeBuilder] = None,
 ) -> QualityControl:
     """
-    Creates a milk quality control system
+    Creates a milk quality control system, or binds it to a snapshot
+
+    With a builder the nodes are only queued until the builder is committed.
     """
     quality_control = QualityControl(
-        name="Milk Quality Control",
+        name=name,
         logger=logger,
         parent_node=parent_node,
         idx=idx,
     )
-    await quality_control.initialize()
+    if snapshot is not None:
+        quality_control.bind(snapshot)
+    else:
+        await quality_control.initialize(builder)
     return quality_control
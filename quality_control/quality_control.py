@@ -1,10 +1,25 @@
 from asyncua import Node, ua
+from asyncua.common.methods import uamethod
 import logging
-import random
-from typing import Optional
+from typing import Any, Optional
+from address_space import AddressSpaceSnapshot, NodeBuilder
+from simulation import Scheduler, Signal, SimulatedVariable
+from .sampling import ACCEPTANCE, BACTERIA_LIMIT, FAT_LIMITS, PH_LIMITS, QualitySampler
 
 
 class QualityControl:
+    """
+    Milk quality control system sampling the production lines
+
+    RunTest draws `samples_per_test` samples of every production line at
+    once in the QualitySampler of the plant, GenerateReport formats the
+    results and rolling statistics of the lines and keeps the report until
+    the next test.
+    """
+
+    simulation_period = 1.0
+    samples_per_test = 100
+
     def __init__(
         self,
         name: str,
@@ -17,41 +32,47 @@ class QualityControl:
         self.parent_node = parent_node
         self.idx = idx
         self.node: Optional[Node] = None
-
-    async def initialize(self) -> Node:
-        """Initialize the quality control system with its variables and methods"""
-        self.node = await self.parent_node.add_object(
-            self.idx, self.name, objecttype=None
-        )
+        self._lines: list[str] = []
+        self._sampler: Optional[QualitySampler] = None
+        self._station: Optional[int] = None
+        self._report: Optional[str] = None
+        self._report_tests = 0
+
+    async def initialize(self, builder: Optional[NodeBuilder] = None) -> Node:
+        """
+        Initialize the quality control system with its variables and methods
+
+        The nodes are queued on `builder` when one is given and created when
+        the caller commits it, otherwise they are created right away.
+        """
+        own_builder = builder is None
+        if own_builder:
+            builder = NodeBuilder(self.parent_node.session)
+        self.node = builder.add_object(self.parent_node, self.idx, self.name)
 
         # Add variables with correct variant types
-        self.ph_level = await self.node.add_variable(
-            self.idx,
-            "pH Level",
-            ua.Variant(6.5, ua.VariantType.Double),  # Use Double for floating point
-        )
-        await self.ph_level.set_writable()
-
-        self.fat_content = await self.node.add_variable(
-            self.idx,
-            "Fat Content",
-            ua.Variant(3.0, ua.VariantType.Double),  # Use Double for floating point
-        )
-        await self.fat_content.set_writable()
-
-        self.bacterial_count = await self.node.add_variable(
-            self.idx,
-            "Bacterial Count",
-            ua.Variant(1000, ua.VariantType.Int64),  # Use Int64 for integers
-        )
-        await self.bacterial_count.set_writable()
+        for attribute, name, value, variant_type in (
+            ("ph_level", "pH Level", 6.5, ua.VariantType.Double),
+            ("fat_content", "Fat Content", 3.0, ua.VariantType.Double),
+            ("bacterial_count", "Bacterial Count", 1000, ua.VariantType.Int64),
+            ("pass_rate", "Pass Rate", 100.0, ua.VariantType.Double),
+        ):
+            node = builder.add_variable(
+                self.node,
+                self.idx,
+                name,
+                ua.Variant(value, variant_type),
+                writable=True,
+            )
+            setattr(self, attribute, SimulatedVariable(node, variant_type, value))
 
         # Add methods
-        await self.node.add_method(
-            self.idx, "RunTest", self.run_test, [], [ua.VariantType.Boolean]
+        builder.add_method(
+            self.node, self.idx, "RunTest", self.run_test, [], [ua.VariantType.Boolean]
         )
 
-        await self.node.add_method(
+        builder.add_method(
+            self.node,
             self.idx,
             "GenerateReport",
             self.generate_report,
@@ -59,47 +80,141 @@ class QualityControl:
             [ua.VariantType.String],
         )
 
+        if own_builder:
+            await builder.commit()
         self.logger.info(f"Initialized {self.name}")
         return self.node
 
-    async def run_test(self, parent: Node) -> bool:
-        """Run quality control tests and update variables"""
-        # Simulate random test values with correct variant types
-        await self.ph_level.write_value(
-            ua.Variant(random.uniform(6.5, 6.8), ua.VariantType.Double)
-        )
-        await self.fat_content.write_value(
-            ua.Variant(random.uniform(3.0, 5.0), ua.VariantType.Double)
-        )
-
-        # Simulate bacterial count decrease
-        current_count = await self.bacterial_count.read_value()
-        new_count = max(0, int(current_count * 0.8))  # Decrease by 20%
-        await self.bacterial_count.write_value(
-            ua.Variant(new_count, ua.VariantType.Int64)
-        )
+    def bind(self, snapshot: AddressSpaceSnapshot) -> Node:
+        """Bind the quality control system to its nodes in a snapshot"""
+        self.node = snapshot.child(self.parent_node, self.name)
+        self.ph_level = snapshot.variable(self.node, "pH Level")
+        self.fat_content = snapshot.variable(self.node, "Fat Content")
+        self.bacterial_count = snapshot.variable(self.node, "Bacterial Count")
+        self.pass_rate = snapshot.variable(self.node, "Pass Rate")
+        snapshot.link_method(self.node, "RunTest", self.run_test)
+        snapshot.link_method(self.node, "GenerateReport", self.generate_report)
+        return self.node
 
-        self.logger.info(f"Quality control test run completed for {self.name}")
-        return True
-
-    async def generate_report(self, parent: Node) -> str:
-        """Generate a quality control report"""
-        ph = await self.ph_level.read_value()
-        fat = await self.fat_content.read_value()
-        bacteria = await self.bacterial_count.read_value()
-
-        report = (
-            f"Quality Control Report\n"
-            f"-------------------\n"
-            f"pH Level: {ph:.2f}\n"
-            f"Fat Content: {fat:.1f}%\n"
-            f"Bacterial Count: {bacteria}\n"
-            f"Status: {'PASS' if self.is_quality_acceptable(ph, fat, bacteria) else 'FAIL'}"
+    def run_simulation(self, scheduler: Scheduler, lines: Optional[list[str]] = None):
+        """
+        Sample the production lines in the quality sampler of the scheduler
+
+        Without production lines the system samples a single product line
+        named like itself.
+        """
+        self._lines = list(lines) if lines else [self.name]
+        self._sampler = scheduler.signal_bank(self.simulation_period, QualitySampler)
+        self._station = self._sampler.add_station(
+            self.ph_level.value,
+            self.fat_content.value,
+            self.bacterial_count.value,
+            self.pass_rate.value,
         )
-
-        self.logger.info(f"Generated quality report for {self.name}")
-        return report
+        for _ in self._lines:
+            self._sampler.add_line(self._station)
+        for name, variable in self.simulated_variables.items():
+            signal = Signal(QualitySampler, output=name, entity=self._station)
+            scheduler.add_signal(self.simulation_period, variable, signal)
+
+    def add_line(self, name: str):
+        """Sample one more production line (after run_simulation)"""
+        if self._sampler is None or name in self._lines:
+            return
+        self._lines.append(name)
+        self._sampler.add_line(self._station)
+        self._report = None
+
+    def remove_line(self, name: str):
+        """Stop sampling a production line"""
+        if self._sampler is None or name not in self._lines:
+            return
+        number = self._lines.index(name)
+        self._sampler.remove_line(int(self._sampler.lines(self._station)[number]))
+        del self._lines[number]
+        self._report = None
+
+    @property
+    def simulated_variables(self) -> dict[str, SimulatedVariable]:
+        """Get the simulated variables by name"""
+        return {
+            "pH Level": self.ph_level,
+            "Fat Content": self.fat_content,
+            "Bacterial Count": self.bacterial_count,
+            "Pass Rate": self.pass_rate,
+        }
+
+    @property
+    def alarm_limits(self) -> dict[str, tuple[SimulatedVariable, Any, Any]]:
+        """Get the (variable, low, high) limits of the alarms by name"""
+        return {
+            "pH Level": (self.ph_level, *PH_LIMITS),
+            "Fat Content": (self.fat_content, *FAT_LIMITS),
+            "Bacterial Count": (self.bacterial_count, None, BACTERIA_LIMIT),
+        }
+
+    # Neither method awaits node I/O: concurrent calls do not wait for each
+    # other, and the results of all tests of a tick are written in one batch
+    @uamethod
+    async def run_test(self, parent: Node):
+        """Test a batch of samples of every line, return whether it passed"""
+        if self._sampler is None or not self._lines:
+            self.logger.warning(f"{self.name} has no production line to sample")
+            return ua.StatusCode(ua.StatusCodes.BadInvalidState)
+        passed = self._sampler.sample(self._station, self.samples_per_test)
+        self.logger.debug(f"Quality control test run completed for {self.name}")
+        return ua.Variant(passed, ua.VariantType.Boolean)
+
+    @uamethod
+    async def generate_report(self, parent: Node):
+        """Generate a quality control report, cached until the next test"""
+        if self._sampler is None:
+            self.logger.warning(f"{self.name} is not simulated")
+            return ua.StatusCode(ua.StatusCodes.BadInvalidState)
+        tests = self._sampler.tests(self._station)
+        if self._report is None or self._report_tests != tests:
+            self._report = self._format_report()
+            self._report_tests = tests
+            self.logger.info(f"Generated quality report for {self.name}")
+        return ua.Variant(self._report, ua.VariantType.String)
+
+    def _format_report(self) -> str:
+        station = self._sampler.state["station"]
+        ph = station["ph"][self._station]
+        fat = station["fat"][self._station]
+        bacteria = int(round(station["bacteria"][self._station]))
+        pass_rate = station["pass_rate"][self._station]
+        rows = [
+            "Quality Control Report",
+            "-------------------",
+            f"pH Level: {ph:.2f}",
+            f"Fat Content: {fat:.1f}%",
+            f"Bacterial Count: {bacteria}",
+            f"Pass Rate: {pass_rate:.1f}%",
+            f"Status: {'PASS' if pass_rate >= 100.0 * ACCEPTANCE else 'FAIL'}",
+        ]
+        statistics = self._sampler.statistics(self._station)
+        if statistics["samples"].any():
+            rows += ["", "Rolling statistics per line (mean ± sd)"]
+        for number, name in enumerate(self._lines):
+            if not statistics["samples"][number]:
+                continue
+            rows.append(
+                f"{name}: "
+                f"pH {statistics['ph_mean'][number]:.2f} ± "
+                f"{statistics['ph_sd'][number]:.2f}, "
+                f"fat {statistics['fat_mean'][number]:.2f} ± "
+                f"{statistics['fat_sd'][number]:.2f}%, "
+                f"bacteria {statistics['bacteria_mean'][number]:.0f} ± "
+                f"{statistics['bacteria_sd'][number]:.0f}, "
+                f"pass rate {statistics['pass_rate'][number]:.1f}%"
+            )
+        return "\n".join(rows)
 
     def is_quality_acceptable(self, ph: float, fat: float, bacteria: int) -> bool:
         """Check if quality parameters are within acceptable ranges"""
-        return 6.5 <= ph <= 6.8 and 3.0 <= fat <= 5.0 and bacteria < 1000
+        return (
+            PH_LIMITS[0] <= ph <= PH_LIMITS[1]
+            and FAT_LIMITS[0] <= fat <= FAT_LIMITS[1]
+            and bacteria < BACTERIA_LIMIT
+        )
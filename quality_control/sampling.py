@@ -0,0 +1,174 @@
+from typing import Optional
+import numpy as np
+from simulation import EntityModel
+
+# Limits of an acceptable sample (see QualityControl.is_quality_acceptable)
+PH_LIMITS = (6.5, 6.8)
+FAT_LIMITS = (3.0, 5.0)
+BACTERIA_LIMIT = 1000
+# A test passes when at least this share of its samples is acceptable
+ACCEPTANCE = 0.95
+
+# The last ROLLING_SAMPLES samples of a line weigh as much in its statistics
+# as all older samples together (exponential half-life)
+ROLLING_SAMPLES = 10000.0
+
+# Spread of the line means around the plant means, and within a line
+PH_MEAN, PH_LINE_SPREAD, PH_SPREAD = 6.65, 0.02, 0.04
+FAT_MEAN, FAT_LINE_SPREAD, FAT_SPREAD = 4.0, 0.2, 0.25
+# Bacterial counts are log-normal around a median per line
+BACTERIA_MEDIANS = (200.0, 450.0)
+BACTERIA_SIGMA = 0.45
+
+MEASUREMENTS = ("ph", "fat", "bacteria")
+
+
+class QualitySampler(EntityModel):
+    """
+    Milk samples of every quality control station, drawn in batches
+
+    A station samples every production line it is responsible for. Each
+    line has its own pH, fat and bacterial count distributions, and a test
+    draws all samples of all its lines with a few array operations. The
+    lines keep exponentially weighted sums of the samples, so the rolling
+    mean, standard deviation and pass rate of a line are available without
+    storing the samples.
+
+    Tests run as soon as a station asks for them; the station outputs (the
+    means and pass rate of its last test) are written on the next tick of
+    the bank, together with those of every other test in between.
+    """
+
+    entities = {
+        "station": ("ph", "fat", "bacteria", "pass_rate", "tests"),
+        "line": (
+            "station",
+            "ph_mean",
+            "ph_sd",
+            "fat_mean",
+            "fat_sd",
+            "bacteria_log_median",
+            "bacteria_sigma",
+            "samples",
+            "passed",
+            *(f"{name}_{total}" for name in MEASUREMENTS for total in ("sum", "sq")),
+        ),
+    }
+    outputs = {
+        "pH Level": ("station", "ph"),
+        "Fat Content": ("station", "fat"),
+        "Bacterial Count": ("station", "bacteria"),
+        "Pass Rate": ("station", "pass_rate"),
+    }
+
+    def __init__(self, rng: Optional[np.random.Generator] = None, decimals: int = 4):
+        super().__init__(rng, decimals)
+        self._lines: dict[int, np.ndarray] = {}
+
+    def add_station(
+        self, ph: float, fat: float, bacteria: float, pass_rate: float = 100.0
+    ) -> int:
+        """Add a quality control station with its last results, return its index"""
+        return self.add(
+            "station", ph=ph, fat=fat, bacteria=bacteria, pass_rate=pass_rate
+        )
+
+    def add_line(self, station: int) -> int:
+        """Add a production line sampled by a station, with its own distributions"""
+        rng = self._rng
+        self._lines.pop(station, None)
+        return self.add(
+            "line",
+            station=station,
+            ph_mean=rng.normal(PH_MEAN, PH_LINE_SPREAD),
+            ph_sd=PH_SPREAD,
+            fat_mean=rng.normal(FAT_MEAN, FAT_LINE_SPREAD),
+            fat_sd=FAT_SPREAD,
+            bacteria_log_median=np.log(rng.uniform(*BACTERIA_MEDIANS)),
+            bacteria_sigma=BACTERIA_SIGMA,
+        )
+
+    def remove_line(self, line: int):
+        """Stop sampling a line, its row stays without a station"""
+        station = int(self.state["line"]["station"][line])
+        self.state["line"]["station"][line] = -1
+        self._lines.pop(station, None)
+
+    def lines(self, station: int) -> np.ndarray:
+        """Indices of the lines sampled by a station, in the order they were added"""
+        lines = self._lines.get(station)
+        if lines is None:
+            lines = np.flatnonzero(self.state["line"]["station"] == station)
+            self._lines[station] = lines
+        return lines
+
+    def sample(self, station: int, count: int) -> bool:
+        """Draw `count` samples of every line of a station, return whether it passed"""
+        lines = self.lines(station)
+        if not len(lines) or count < 1:
+            raise ValueError(f"Station {station} of {self} has nothing to sample")
+        state = self.state["line"]
+        rng = self._rng
+        shape = (len(lines), count)
+        ph = rng.normal(
+            state["ph_mean"][lines, None], state["ph_sd"][lines, None], shape
+        )
+        fat = rng.normal(
+            state["fat_mean"][lines, None], state["fat_sd"][lines, None], shape
+        )
+        bacteria = np.rint(
+            rng.lognormal(
+                state["bacteria_log_median"][lines, None],
+                state["bacteria_sigma"][lines, None],
+                shape,
+            )
+        )
+        acceptable = (
+            (ph >= PH_LIMITS[0])
+            & (ph <= PH_LIMITS[1])
+            & (fat >= FAT_LIMITS[0])
+            & (fat <= FAT_LIMITS[1])
+            & (bacteria < BACTERIA_LIMIT)
+        )
+
+        # Fade the older samples out, then add the new ones
+        weight = 0.5 ** (count / ROLLING_SAMPLES)
+        state["samples"][lines] = state["samples"][lines] * weight + count
+        state["passed"][lines] = state["passed"][lines] * weight + acceptable.sum(1)
+        for name, values in zip(MEASUREMENTS, (ph, fat, bacteria)):
+            for total, summed in (("sum", values), ("sq", values * values)):
+                column = state[f"{name}_{total}"]
+                column[lines] = column[lines] * weight + summed.sum(1)
+
+        stations = self.state["station"]
+        pass_rate = acceptable.mean()
+        for name, values in zip(MEASUREMENTS, (ph, fat, bacteria)):
+            stations[name][station] = values.mean()
+        stations["pass_rate"][station] = 100.0 * pass_rate
+        stations["tests"][station] += 1
+        return bool(pass_rate >= ACCEPTANCE)
+
+    def statistics(self, station: int) -> dict[str, np.ndarray]:
+        """Rolling sample count, pass rate (%), means and deviations per line"""
+        state = self.state["line"]
+        lines = self.lines(station)
+        samples = state["samples"][lines]
+        weights = np.maximum(samples, 1e-12)
+        statistics = {
+            "samples": samples,
+            "pass_rate": 100.0 * state["passed"][lines] / weights,
+        }
+        for name in MEASUREMENTS:
+            mean = state[f"{name}_sum"][lines] / weights
+            variance = state[f"{name}_sq"][lines] / weights - mean * mean
+            statistics[f"{name}_mean"] = mean
+            statistics[f"{name}_sd"] = np.sqrt(np.maximum(variance, 0.0))
+        return statistics
+
+    def tests(self, station: int) -> int:
+        """Number of tests a station ran, e.g. to tell whether its report changed"""
+        return int(self.state["station"]["tests"][station])
+
+    def step(self, dt: float):
+        # Samples are drawn when tests run, the ticks only publish the results
+        pass
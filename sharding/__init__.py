@@ -0,0 +1,4 @@
+from .shard import Shard
+from .supervisor import Supervisor
+
+__all__ = ["Shard", "Supervisor"]
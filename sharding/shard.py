@@ -0,0 +1,51 @@
+class Shard:
+    """
+    One server process of a sharded plant
+
+    Every shard serves its own endpoint and namespace and owns the
+    production lines of the topology dealt to it (see PlantTopology.shard).
+
+    Attributes:
+    - index: int (0-based position of the shard)
+    - count: int (number of shards of the plant)
+    - port: int (TCP port of the shard endpoint)
+    - namespace: str (namespace URI of the shard nodes)
+    """
+
+    def __init__(
+        self, index: int, count: int, host: str, port: int, namespace: str
+    ) -> None:
+        self.index = index
+        self.count = count
+        self.host = host
+        self.port = port
+        self.namespace = namespace
+
+    def __str__(self):
+        return f"Shard({self.index + 1}/{self.count}, endpoint={self.endpoint})"
+
+    @property
+    def endpoint(self) -> str:
+        """The OPC UA endpoint URL of the shard"""
+        return f"opc.tcp://{self.host}:{self.port}/freeopcua/server"
+
+    @property
+    def application_uri(self) -> str:
+        """Application URI the shard registers with the discovery server"""
+        return f"{self.namespace}/application"
+
+    @property
+    def name(self) -> str:
+        return f"shard{self.index}"
+
+    @classmethod
+    def plan(
+        cls, count: int, host: str, base_port: int, namespace: str
+    ) -> list["Shard"]:
+        """Shards on consecutive ports, each with a namespace below `namespace`"""
+        if count < 1:
+            raise ValueError(f"A plant needs at least one shard, got {count}")
+        return [
+            cls(index, count, host, base_port + index, f"{namespace}/shard{index}")
+            for index in range(count)
+        ]
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from multiprocessing.process import BaseProcess
+from typing import Callable, Optional
+from asyncua import Server
+from .shard import Shard
+
+ShardTarget = Callable[[Shard, Optional[str]], None]
+
+
+class Supervisor:
+    """
+    Runs every shard of a plant in its own process and keeps them running
+
+    Each shard process runs `target(shard, discovery_endpoint)`. When a
+    discovery endpoint is given, the supervisor serves it with a discovery
+    server the shards register to, so that clients can list all of them
+    with a FindServers request on a single endpoint.
+
+    A shard that exits unexpectedly is started again after `restart_delay`
+    seconds; the delay doubles while the shard keeps crashing soon after
+    it was started.
+
+    Example:
+        shards = Shard.plan(4, "0.0.0.0", 4841, namespace)
+        supervisor = Supervisor(shards, run_shard, logger, discovery_endpoint)
+        await supervisor.run()
+    """
+
+    max_restart_delay = 60.0
+    stop_timeout = 10.0
+
+    def __init__(
+        self,
+        shards: list[Shard],
+        target: ShardTarget,
+        logger: logging.Logger,
+        discovery_endpoint: Optional[str] = None,
+        restart_delay: float = 1.0,
+    ):
+        self.shards = shards
+        self._target = target
+        self._logger = logger
+        self._discovery_endpoint = discovery_endpoint
+        self._restart_delay = restart_delay
+        # Processes are spawned so that no event loop state leaks into them
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: dict[int, BaseProcess] = {}
+        self._started: dict[int, float] = {}
+        self._discovery_ready = asyncio.Event()
+        self.restarts = 0
+
+    def __str__(self):
+        return f"Supervisor(shards={len(self.shards)})"
+
+    def _start(self, shard: Shard):
+        """Start the process of a shard"""
+        process = self._context.Process(
+            target=self._target,
+            args=(shard, self._discovery_endpoint),
+            name=f"dairy-enterprise-{shard.name}",
+            daemon=False,
+        )
+        process.start()
+        self._processes[shard.index] = process
+        self._started[shard.index] = time.monotonic()
+        self._logger.info(f"Started {shard} in process {process.pid}")
+
+    def _stop(self):
+        """Terminate every shard process, kill the ones that do not exit"""
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes.values():
+            process.join(self.stop_timeout)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self._logger.info(f"Stopped {len(self._processes)} shard processes")
+
+    async def _watch(self, shard: Shard):
+        """Restart a shard process whenever it exits"""
+        delay = self._restart_delay
+        while True:
+            process = self._processes[shard.index]
+            await asyncio.to_thread(process.join)
+            if time.monotonic() - self._started[shard.index] > self.max_restart_delay:
+                delay = self._restart_delay
+            self._logger.error(
+                f"{shard} exited with code {process.exitcode}, "
+                f"restarting in {delay:.0f}s"
+            )
+            await asyncio.sleep(delay)
+            self._start(shard)
+            self.restarts += 1
+            delay = min(delay * 2, self.max_restart_delay)
+
+    async def _serve_discovery(self):
+        """Serve the discovery endpoint until cancelled"""
+        server = Server()
+        await server.init()
+        server.set_endpoint(self._discovery_endpoint)
+        server.set_server_name("Dairy Enterprise Discovery Server")
+        async with server:
+            self._logger.info(f"Discovery server at {self._discovery_endpoint}")
+            self._discovery_ready.set()
+            await asyncio.Future()
+
+    async def run(self):
+        """Start the shards and supervise them until cancelled"""
+        tasks = []
+        try:
+            if self._discovery_endpoint is not None:
+                discovery = asyncio.create_task(self._serve_discovery())
+                tasks.append(discovery)
+                # The shards register as soon as they are up
+                ready = asyncio.create_task(self._discovery_ready.wait())
+                await asyncio.wait(
+                    [discovery, ready], return_when=asyncio.FIRST_COMPLETED
+                )
+                if discovery.done():
+                    ready.cancel()
+                    discovery.result()
+            for shard in self.shards:
+                self._start(shard)
+            tasks.extend(
+                asyncio.create_task(self._watch(shard)) for shard in self.shards
+            )
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._stop()
@@ -0,0 +1,39 @@
+from .clock import SimulationClock
+from .variable import CRITICAL, NORMAL, LOW, PRIORITIES, Deadband, SimulatedVariable
+from .writer import BatchWriter
+from .signals import (
+    Signal,
+    SignalBank,
+    RandomWalk,
+    SineWave,
+    FirstOrderLag,
+    MarkovChain,
+)
+from .entities import EntityModel
+from .observation import ObservedNodes
+from .shedding import LoadShedder
+from .scheduler import Scheduler, RateGroup
+from .worker import SimulationWorker
+
+__all__ = [
+    "SimulationClock",
+    "Deadband",
+    "SimulatedVariable",
+    "CRITICAL",
+    "NORMAL",
+    "LOW",
+    "PRIORITIES",
+    "BatchWriter",
+    "Signal",
+    "SignalBank",
+    "RandomWalk",
+    "SineWave",
+    "FirstOrderLag",
+    "MarkovChain",
+    "EntityModel",
+    "ObservedNodes",
+    "LoadShedder",
+    "Scheduler",
+    "RateGroup",
+    "SimulationWorker",
+]
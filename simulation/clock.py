@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import heapq
+import itertools
+import time
+from typing import Optional
+
+
+class SimulationClock:
+    """
+    Virtual time of the simulation
+
+    `monotonic` counts simulated seconds since the clock was created and
+    `now` is the simulated wall-clock time stamped on the values, starting
+    at `start`. The simulation runs
+    - in real time with `speed` 1,
+    - N times faster than real time with `speed` N,
+    - as fast as possible with `speed` None: time does not pass on its own
+      but jumps to the earliest deadline anyone sleeps until, as soon as
+      the event loop got to run the other ready tasks once, and on to the
+      next deadline while anyone is still asleep.
+
+    Loops pacing the simulation sleep on the clock (`sleep_until`, `sleep`)
+    instead of on asyncio, and measure durations of their own work with
+    `time.monotonic` as before.
+
+    Attributes:
+    - speed: Optional[float] (simulated seconds per real second, None for as fast as possible)
+    - start: datetime (simulated time when the clock was created)
+    """
+
+    def __init__(self, speed: Optional[float] = 1.0, start: Optional[datetime] = None):
+        if speed is not None and speed <= 0:
+            raise ValueError(f"The speed of a clock must be positive, not {speed}")
+        self.speed = speed
+        self.start = start if start is not None else datetime.now(timezone.utc)
+        self._started = time.monotonic()
+        self._elapsed = 0.0
+        self._waiters: list[tuple[float, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._advance: Optional[asyncio.Handle] = None
+
+    def __str__(self):
+        speed = "max" if self.speed is None else f"{self.speed:g}"
+        return f"SimulationClock(speed={speed}, now={self.now().isoformat()})"
+
+    @property
+    def realtime(self) -> bool:
+        """Whether simulated time passes like real time"""
+        return self.speed == 1.0
+
+    def monotonic(self) -> float:
+        """Simulated seconds since the clock was created"""
+        if self.speed is None:
+            return self._elapsed
+        return (time.monotonic() - self._started) * self.speed
+
+    def time(self) -> float:
+        """Simulated POSIX time in seconds"""
+        return self.start.timestamp() + self.monotonic()
+
+    def now(self) -> datetime:
+        """Simulated UTC time"""
+        return self.start + timedelta(seconds=self.monotonic())
+
+    def speedup(self) -> float:
+        """Simulated seconds per real second since the clock was created"""
+        elapsed = time.monotonic() - self._started
+        return self.monotonic() / elapsed if elapsed > 0 else 0.0
+
+    async def sleep_until(self, deadline: float):
+        """Sleep until the simulated monotonic time reaches `deadline`"""
+        if self.speed is not None:
+            await asyncio.sleep(max(deadline - self.monotonic(), 0.0) / self.speed)
+            return
+        if deadline <= self._elapsed:
+            await asyncio.sleep(0)
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (deadline, next(self._order), future))
+        if self._advance is None:
+            self._advance = loop.call_soon(self._jump)
+        await future
+
+    async def sleep(self, delay: float):
+        """Sleep for `delay` simulated seconds"""
+        await self.sleep_until(self.monotonic() + delay)
+
+    def _jump(self):
+        """Jump to the earliest deadline and wake up everyone waiting for it"""
+        self._advance = None
+        waiters = self._waiters
+        while waiters and waiters[0][2].done():
+            heapq.heappop(waiters)
+        if not waiters:
+            return
+        self._elapsed = max(self._elapsed, waiters[0][0])
+        while waiters and waiters[0][0] <= self._elapsed:
+            _, _, future = heapq.heappop(waiters)
+            if not future.done():
+                future.set_result(None)
+        if waiters:
+            # The woken tasks run first, and may go back to sleep earlier
+            self._advance = asyncio.get_running_loop().call_soon(self._jump)
@@ -0,0 +1,97 @@
+from typing import Any, Optional
+import numpy as np
+from .signals import SignalBank
+from .variable import SimulatedVariable
+
+
+class EntityModel(SignalBank):
+    """
+    A signal bank publishing the state of simulated entities
+
+    Subclasses declare the kinds of entities and their state (`entities`),
+    and which state is published under which output name (`outputs`). All
+    entities of a kind are rows of the same state arrays, so `step` can
+    advance every entity of the model with a few array operations. Every
+    slot publishes one output of one entity.
+
+    Models usually read inputs that change at any time (e.g. the running
+    state of a line), so they are stepped on the server loop and not by a
+    simulation worker.
+
+    Attributes:
+    - entities: dict[str, tuple[str, ...]] (state names of every kind)
+    - outputs: dict[str, tuple[str, str]] (kind and state of every output)
+    - state: dict[str, dict[str, np.ndarray]] (state arrays of every kind)
+    """
+
+    entities: dict[str, tuple[str, ...]] = {}
+    outputs: dict[str, tuple[str, str]] = {}
+    offloadable = False
+
+    def __init__(self, rng: Optional[np.random.Generator] = None, decimals: int = 4):
+        super().__init__(rng, decimals)
+        self.state: dict[str, dict[str, np.ndarray]] = {
+            kind: {name: np.empty(0) for name in names}
+            for kind, names in self.entities.items()
+        }
+        self._outputs: list[tuple[str, str, int]] = []
+        self._gather: Optional[list[tuple[np.ndarray, str, str, np.ndarray]]] = None
+
+    def __str__(self):
+        counts = ", ".join(f"{kind}s={self.count(kind)}" for kind in self.entities)
+        return f"{type(self).__name__}({counts}, signals={len(self)})"
+
+    def count(self, kind: str) -> int:
+        """Number of entities of a kind"""
+        return len(next(iter(self.state[kind].values()), ()))
+
+    def add(self, kind: str, **state: float) -> int:
+        """Add an entity of a kind with its initial state, return its index"""
+        unknown = set(state) - set(self.entities[kind])
+        if unknown:
+            raise ValueError(f"Unknown state of a {kind} in {self}: {sorted(unknown)}")
+        columns = self.state[kind]
+        for name, column in columns.items():
+            columns[name] = np.append(column, state.get(name, 0.0))
+        return self.count(kind) - 1
+
+    def attach(
+        self, variable: SimulatedVariable, output: str = "", entity: int = 0
+    ) -> int:
+        """Publish an output of an entity into a variable"""
+        if output not in self.outputs:
+            raise ValueError(f"Unknown output of {self}: {output}")
+        slot = super().attach(variable)
+        self._outputs.append((*self.outputs[output], entity))
+        self._gather = None
+        return slot
+
+    def _remove(self, keep: np.ndarray):
+        super()._remove(keep)
+        # The entities stay, only the slots publishing them are removed
+        self._outputs = [output for output, kept in zip(self._outputs, keep) if kept]
+        self._gather = None
+
+    def _initial_value(self, value: Any):
+        return float(value) if isinstance(value, (int, float)) else 0.0
+
+    def _slots_by_output(self) -> list[tuple[np.ndarray, str, str, np.ndarray]]:
+        """Slots and entity indices of every output, computed once"""
+        if self._gather is None:
+            by_output: dict[tuple[str, str], tuple[list, list]] = {}
+            for slot, (kind, name, entity) in enumerate(self._outputs):
+                slots, entities = by_output.setdefault((kind, name), ([], []))
+                slots.append(slot)
+                entities.append(entity)
+            self._gather = [
+                (np.array(slots), kind, name, np.array(entities))
+                for (kind, name), (slots, entities) in by_output.items()
+            ]
+        return self._gather
+
+    def _publish(self) -> np.ndarray:
+        """Gather the published state of every slot"""
+        values = self.values
+        for slots, kind, name, entities in self._slots_by_output():
+            values[slots] = self.state[kind][name][entities]
+        return super()._publish()
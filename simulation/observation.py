@@ -0,0 +1,80 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+from asyncua import Server, ua
+from asyncua.common.callback import CallbackType, ServerItemCallback
+
+
+class ObservedNodes:
+    """
+    Nodes whose values clients are watching
+
+    A node is observed while a monitored item samples its value, and for
+    `read_ttl` seconds after a client last read it. `version` changes
+    whenever the set of observed nodes changes, so the scheduler only has
+    to select its observed variables again then.
+
+    Read listeners are awaited with the nodes that were not observed before
+    a client reads them, so their values can be brought up to date before
+    the read is answered.
+    """
+
+    def __init__(self, server: Server, read_ttl: float = 10.0):
+        self._aspace = server.iserver.aspace
+        self.read_ttl = read_ttl
+        self.version = 0
+        self.read_listeners: list[Callable[[list[ua.NodeId]], Awaitable[None]]] = []
+        self._monitored: set[ua.NodeId] = set()
+        self._reads: dict[ua.NodeId, float] = {}
+        server.subscribe_server_callback(CallbackType.PreRead, self._pre_read)
+
+    def __str__(self):
+        return (
+            f"ObservedNodes(monitored={len(self._monitored)}, "
+            f"read={len(self._reads)})"
+        )
+
+    def __len__(self):
+        return len(self._monitored | self._reads.keys())
+
+    def __contains__(self, node_id: ua.NodeId) -> bool:
+        return node_id in self._monitored or node_id in self._reads
+
+    def refresh(self):
+        """Pick up created and deleted monitored items and expire old reads"""
+        # Every data change monitored item registers a callback on its node
+        monitored = {
+            node_id
+            for node_id, attribute in self._aspace._handle_to_attribute_map.values()
+            if attribute == ua.AttributeIds.Value
+        }
+        expired = time.monotonic() - self.read_ttl
+        reads = {
+            node_id: read for node_id, read in self._reads.items() if read > expired
+        }
+        if monitored != self._monitored or len(reads) != len(self._reads):
+            self.version += 1
+        self._monitored, self._reads = monitored, reads
+
+    async def _pre_read(self, event: ServerItemCallback, dispatcher):
+        if not event.is_external:
+            return
+        now = time.monotonic()
+        unobserved = []
+        for node_to_read in event.request_params.NodesToRead:
+            if node_to_read.AttributeId != ua.AttributeIds.Value:
+                continue
+            node_id = node_to_read.NodeId
+            if node_id not in self:
+                unobserved.append(node_id)
+            self._reads[node_id] = now
+        if unobserved:
+            self.version += 1
+            for listener in self.read_listeners:
+                await listener(unobserved)
+
+    async def run(self, period: float = 1.0):
+        """Refresh the observed nodes every `period` seconds until cancelled"""
+        while True:
+            self.refresh()
+            await asyncio.sleep(period)
@@ -0,0 +1,172 @@
+"""
+Replay of recorded time series into the address space
+
+A recording is a NumPy .npy file holding a structured array: a `time` field
+in seconds and one numeric field per variable, named by the variable path
+below the enterprise node, e.g. "Milk Processing Line/Pasteurizer/Temperature".
+The file is memory-mapped, so only the rows being replayed are paged in and
+a day of a whole plant does not have to fit into RAM.
+
+Convert a CSV file with a `time` column and one column per variable:
+    python -m simulation.replay day.csv day.npy
+"""
+
+import argparse
+import csv
+import logging
+from pathlib import Path
+from typing import Any, Callable
+import numpy as np
+from numpy.lib import recfunctions
+from asyncua import ua
+from .signals import _INTEGER_TYPES
+from .variable import SimulatedVariable
+from .writer import BatchWriter
+
+TIME_FIELD = "time"
+
+
+def _converter(variant_type: ua.VariantType) -> Callable[[float], Any] | None:
+    """Python type of the values replayed into a variable of this type"""
+    if variant_type == ua.VariantType.Boolean:
+        return bool
+    if variant_type in (ua.VariantType.Float, ua.VariantType.Double):
+        return float
+    if variant_type in _INTEGER_TYPES:
+        return int
+    return None
+
+
+class Replay:
+    """
+    Streams a recording into simulated variables at original or scaled speed
+
+    Rows are written at `time / speed` after the start of the replay, in
+    the simulated time of the clock of the writer. Rows
+    that are already due when the replay catches up are skipped, only the
+    latest one is written, and of a row only the values that changed.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        variables: dict[str, SimulatedVariable],
+        writer: BatchWriter,
+        logger: logging.Logger,
+        speed: float = 1.0,
+    ):
+        if speed <= 0:
+            raise ValueError(f"The speed of a replay must be positive, not {speed}")
+        self.path = path
+        self._writer = writer
+        self._logger = logger
+        self.speed = speed
+        self._data = np.load(path, mmap_mode="r")
+        fields = self._data.dtype.names
+        if fields is None or TIME_FIELD not in fields:
+            raise ValueError(f"{path} is not a recording with a '{TIME_FIELD}' field")
+
+        self.columns: list[str] = []
+        self._variables: list[SimulatedVariable] = []
+        self._converters: list[Callable[[float], Any]] = []
+        self.unmatched: list[str] = []
+        for field in fields:
+            if field == TIME_FIELD:
+                continue
+            variable = variables.get(field)
+            converter = None if variable is None else _converter(variable.variant_type)
+            if converter is None or self._data.dtype[field].kind not in "biuf":
+                self.unmatched.append(field)
+                continue
+            self.columns.append(field)
+            self._variables.append(variable)
+            self._converters.append(converter)
+        self._times = self._data[TIME_FIELD]
+        self._values = self._data[self.columns]
+
+    def __len__(self):
+        return len(self._data)
+
+    def __str__(self):
+        return (
+            f"Replay(path={self.path}, rows={len(self)}, "
+            f"variables={len(self.columns)}, speed={self.speed})"
+        )
+
+    def _row(self, row: int) -> np.ndarray:
+        """The values of a row as one float array"""
+        return recfunctions.structured_to_unstructured(
+            self._values[row : row + 1], dtype=np.float64
+        )[0]
+
+    async def run(self):
+        """Write the rows as they come due, return at the end of the recording"""
+        if self.unmatched:
+            self._logger.warning(
+                f"{len(self.unmatched)} columns of {self.path} do not match a "
+                f"numeric simulated variable and are skipped"
+            )
+        if not len(self) or not self.columns:
+            return
+        clock = self._writer.clock
+        first = float(self._times[0])
+        started = clock.monotonic()
+        previous = None
+        row = 0
+        while row < len(self):
+            due = started + (float(self._times[row]) - first) / self.speed
+            if due > clock.monotonic():
+                await clock.sleep_until(due)
+            # Catch up with the rows that came due in the meantime
+            now = first + (clock.monotonic() - started) * self.speed
+            row = max(row, int(np.searchsorted(self._times, now, side="right")) - 1)
+
+            values = self._row(row)
+            changed = (
+                np.arange(len(values))
+                if previous is None
+                else np.flatnonzero(values != previous)
+            )
+            for slot in changed:
+                variable = self._variables[slot]
+                value = self._converters[slot](values[slot])
+                variable.value = variable.published = value
+            await self._writer.write([self._variables[slot] for slot in changed])
+            previous = values
+            row += 1
+        self._logger.info(f"Finished {self}")
+
+
+def convert_csv(csv_path: Path, npy_path: Path, dtype: str = "f8") -> int:
+    """
+    Convert a CSV recording into a memory-mappable .npy recording
+
+    The CSV is read twice, once to count the rows, so it is never held in
+    memory as a whole. Returns the number of rows.
+    """
+    with open(csv_path, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = sum(1 for _ in reader)
+    if TIME_FIELD not in header:
+        raise ValueError(f"{csv_path} has no '{TIME_FIELD}' column")
+
+    fields = [(name, "f8" if name == TIME_FIELD else dtype) for name in header]
+    recording = np.lib.format.open_memmap(
+        npy_path, mode="w+", dtype=np.dtype(fields), shape=(rows,)
+    )
+    with open(csv_path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for number, line in enumerate(reader):
+            recording[number] = tuple(float(value) for value in line)
+    recording.flush()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a CSV recording to .npy")
+    parser.add_argument("csv", type=Path)
+    parser.add_argument("npy", type=Path)
+    args = parser.parse_args()
+    print(f"Converted {convert_csv(args.csv, args.npy)} rows to {args.npy}")
@@ -0,0 +1,362 @@
+import heapq
+import logging
+import random
+import time
+from typing import Any, Iterable, Optional
+import numpy as np
+from asyncua import Node, ua
+from .observation import ObservedNodes
+from .seeding import numpy_random, python_random
+from .shedding import LoadShedder
+from .signals import Signal, SignalBank
+from .variable import SimulatedVariable
+from .writer import BatchWriter
+
+
+class RateGroup:
+    """
+    A bucket of simulated variables that share the same update period
+
+    Attributes:
+    - period: float (update period in seconds)
+    - ticks: int (number of times the group has been serviced)
+    - overruns: int (number of ticks that took longer than the period, in real time)
+    - skipped: int (number of deadlines missed and skipped while falling behind)
+    - last_duration: float (real time in seconds spent servicing the last tick)
+    - actual_period: float (simulated time in seconds between the last two ticks)
+
+    When only observed nodes are simulated, the variables of unobserved
+    nodes are skipped and the banks only publish their observed slots.
+    Banks are still stepped as a whole, so their model state stays exact.
+    """
+
+    def __init__(self, period: float):
+        self.period = period
+        self.variables: list[SimulatedVariable] = []
+        self.banks: dict[tuple, SignalBank] = {}
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.last_duration = 0.0
+        self.actual_period = 0.0
+        self.last_started = None
+        self._version: Optional[int] = None
+        self._observed: list[SimulatedVariable] = []
+        self._slots: dict[tuple, np.ndarray] = {}
+        self._updated: dict[SimulatedVariable, int] = {}
+
+    def __str__(self):
+        return f"RateGroup(period={self.period}, variables={len(self)})"
+
+    def __len__(self):
+        return len(self.variables) + sum(len(bank) for bank in self.banks.values())
+
+    def invalidate(self):
+        """Select the observed variables again on the next tick"""
+        self._version = None
+
+    def _observe(self, observed: ObservedNodes):
+        """Select the variables and bank slots of the observed nodes"""
+        if self._version == observed.version:
+            return
+        self._version = observed.version
+        self._observed = [
+            variable for variable in self.variables if variable.node.nodeid in observed
+        ]
+        self._slots = {
+            key: np.flatnonzero(
+                [variable.node.nodeid in observed for variable in bank.variables]
+            )
+            for key, bank in self.banks.items()
+        }
+
+    async def tick(
+        self,
+        writer: BatchWriter,
+        logger: logging.Logger,
+        observed: Optional[ObservedNodes] = None,
+        shedder: Optional[LoadShedder] = None,
+    ):
+        """
+        Advance the variables of the group and write the changes at once
+
+        With a `shedder` the writes of low-priority variables may be held
+        back to a later tick while the simulator falls behind.
+        """
+        if observed is not None:
+            self._observe(observed)
+        changed = []
+        for key, bank in self.banks.items():
+            try:
+                slots = None if observed is None else self._slots[key]
+                changed.extend(bank.tick(self.period, slots))
+            except Exception:
+                logger.exception(f"Failed to step {bank} in {self}")
+        for variable in self.variables if observed is None else self._observed:
+            try:
+                if variable.update():
+                    changed.append(variable)
+            except Exception:
+                logger.exception(f"Failed to update {variable} in {self}")
+            if observed is not None:
+                self._updated[variable] = self.ticks + 1
+        if shedder is None:
+            await writer.write(changed)
+            return
+        now = writer.clock.now()
+        changed = shedder.shed(self.period, self.ticks + 1, changed, now)
+        await writer.write(changed, now)
+        for timestamp, released in shedder.release(self.period, self.ticks + 1):
+            await writer.write(released, timestamp)
+
+    def remove(self, variables: set[SimulatedVariable]) -> int:
+        """Remove variables from the group and its banks, return how many"""
+        count = sum(bank.detach(variables) for bank in self.banks.values())
+        kept = [variable for variable in self.variables if variable not in variables]
+        count += len(self.variables) - len(kept)
+        self.variables = kept
+        for variable in variables:
+            self._updated.pop(variable, None)
+        self.invalidate()
+        return count
+
+    def catch_up(self, variable: SimulatedVariable, limit: int) -> bool:
+        """
+        Replay the ticks an unobserved variable missed, at most `limit`
+
+        Return True when its value is to be written.
+        """
+        if variable.generator is None:
+            return False
+        missed = min(self.ticks - self._updated.get(variable, 0), limit)
+        self._updated[variable] = self.ticks
+        for _ in range(missed):
+            variable.value = variable.generator(variable.value)
+        return variable.publish()
+
+
+class Scheduler:
+    """
+    Drives every simulated variable from a single asyncio task.
+
+    Variables are grouped by update period into rate groups. The groups are
+    kept in a heap ordered by their next deadline, so one timer services
+    the whole plant no matter how many variables are simulated.
+
+    With `observed` only the nodes clients are watching are simulated on
+    every tick. The other variables are brought up to date when a client
+    reads them, replaying at most `catch_up` of the ticks they missed.
+
+    Deadlines are kept in the simulated time of the clock of the writer,
+    so the scheduler runs in real time, accelerated or as fast as possible
+    like its clock. Tick durations are measured in real time.
+
+    With a `shedder` the scheduler reports how late every tick starts, and
+    the shedder holds back low-priority writes while the lag is too high.
+
+    With a `seed` every node, and every signal bank of the `namespace`, gets
+    its own random generator. A bank draws one stream for all of its slots
+    in slot order, so its values only repeat for the same topology, shard
+    layout and runtime changes.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        writer: BatchWriter,
+        seed: Optional[int] = None,
+        observed: Optional[ObservedNodes] = None,
+        catch_up: int = 100,
+        shedder: Optional[LoadShedder] = None,
+        namespace: str = "",
+    ):
+        self._logger = logger
+        self._writer = writer
+        self.clock = writer.clock
+        self.seed = seed
+        self.namespace = namespace
+        self.observed = observed
+        self._catch_up = catch_up
+        self.shedder = shedder
+        self._groups: dict[float, RateGroup] = {}
+        self._deadlines: list[tuple[float, float]] = []
+        self._variables: Optional[dict[ua.NodeId, tuple]] = None
+        if observed is not None:
+            observed.read_listeners.append(self.catch_up)
+
+    def _group(self, period: float) -> RateGroup:
+        """Get the rate group for a period, creating it on first use"""
+        group = self._groups.get(period)
+        if group is None:
+            group = RateGroup(period)
+            self._groups[period] = group
+            heapq.heappush(self._deadlines, (self.clock.monotonic(), period))
+        return group
+
+    def add(self, period: float, variable: SimulatedVariable):
+        """Register a variable to be updated every `period` seconds"""
+        group = self._group(period)
+        group.variables.append(variable)
+        group.invalidate()
+        self._variables = None
+
+    def signal_bank(
+        self, period: float, bank_type: type[SignalBank], *bank_args: Any
+    ) -> SignalBank:
+        """Get the signal bank of a kind stepped every `period` seconds"""
+        group = self._group(period)
+        key = (bank_type, bank_args)
+        bank = group.banks.get(key)
+        if bank is None:
+            rng = numpy_random(
+                self.seed,
+                f"{self.namespace}:{period}:{bank_type.__name__}:{bank_args}",
+            )
+            bank = bank_type(*bank_args, rng=rng)
+            group.banks[key] = bank
+        return bank
+
+    def random(self, node: Node) -> random.Random:
+        """
+        Random source of the values simulated for a node
+
+        With a seed every node gets its own generator derived from the seed
+        and its node id, so runs with the same seed and topology draw the
+        same values. Without a seed all nodes share one unseeded generator.
+        """
+        return python_random(self.seed, node.nodeid.to_string())
+
+    def add_signal(self, period: float, variable: SimulatedVariable, signal: Signal):
+        """Drive a variable from a signal bank updated every `period` seconds"""
+        bank = self.signal_bank(period, signal.bank_type, *signal.bank_args)
+        bank.attach(variable, **signal.params)
+        self._groups[period].invalidate()
+        self._variables = None
+
+    def offloaded(self, variables: Iterable[SimulatedVariable]) -> bool:
+        """Whether any of the variables is driven by a bank a simulation worker steps"""
+        variables = set(variables)
+        return any(
+            not isinstance(bank, SignalBank)
+            and not variables.isdisjoint(bank.variables)
+            for group in self._groups.values()
+            for bank in group.banks.values()
+        )
+
+    def offloaded_signal(self, period: float, signal: Signal) -> bool:
+        """Whether a signal would be attached to a bank a simulation worker steps"""
+        group = self._groups.get(period)
+        if group is None:
+            return False
+        bank = group.banks.get((signal.bank_type, signal.bank_args))
+        return bank is not None and not isinstance(bank, SignalBank)
+
+    def remove(self, variables: Iterable[SimulatedVariable]) -> int:
+        """
+        Stop simulating some variables, return how many were registered
+
+        The variables are no longer updated from the next tick on, whether
+        they were added directly or driven by a signal bank. Nothing is
+        removed, and a RuntimeError raised, when a simulation worker steps
+        the bank of any of them.
+        """
+        removed = set(variables)
+        if self.offloaded(removed):
+            raise RuntimeError(
+                "Cannot remove variables stepped by the simulation worker"
+            )
+        count = sum(group.remove(removed) for group in self._groups.values())
+        if self.shedder is not None:
+            self.shedder.forget(removed)
+        self._variables = None
+        return count
+
+    def _index(self) -> dict[ua.NodeId, tuple]:
+        """The rate group and variable, or bank key and slot, of every node"""
+        if self._variables is None:
+            self._variables = {}
+            for group in self._groups.values():
+                for variable in group.variables:
+                    self._variables[variable.node.nodeid] = (group, variable, None)
+                for key, bank in group.banks.items():
+                    for slot, variable in enumerate(bank.variables):
+                        self._variables[variable.node.nodeid] = (group, key, slot)
+        return self._variables
+
+    async def catch_up(self, node_ids: list[ua.NodeId]):
+        """Bring the variables of unobserved nodes up to date before a read"""
+        changed = []
+        index = self._index()
+        for node_id in node_ids:
+            entry = index.get(node_id)
+            if entry is None:
+                continue
+            # A variable of the group, or the key of a bank and a slot
+            group, member, slot = entry
+            try:
+                if slot is None:
+                    if group.catch_up(member, self._catch_up):
+                        changed.append(member)
+                else:
+                    # The bank kept stepping, publish its current value
+                    changed.extend(group.banks[member].refresh(np.array([slot])))
+            except Exception:
+                self._logger.exception(f"Failed to catch up {node_id} in {group}")
+        await self._writer.write(changed)
+
+    @property
+    def writer(self) -> BatchWriter:
+        """Get the writer of the simulated values"""
+        return self._writer
+
+    @property
+    def rate_groups(self) -> list[RateGroup]:
+        """Get the rate groups ordered by period"""
+        return [self._groups[period] for period in sorted(self._groups)]
+
+    async def run(self):
+        """Service the rate groups as their deadlines come due"""
+        clock = self.clock
+        while True:
+            if not self._deadlines:
+                await clock.sleep(1)
+                continue
+
+            deadline, period = self._deadlines[0]
+            if deadline > clock.monotonic():
+                await clock.sleep_until(deadline)
+                continue
+
+            heapq.heappop(self._deadlines)
+            group = self._groups[period]
+            started = clock.monotonic()
+            if group.last_started is not None:
+                group.actual_period = started - group.last_started
+            group.last_started = started
+            if self.shedder is not None:
+                # As fast as possible every tick is late, only the loop lag counts
+                late = 0.0 if clock.speed is None else started - deadline
+                self.shedder.observe(late / (clock.speed or 1.0))
+            tick_started = time.monotonic()
+            await group.tick(self._writer, self._logger, self.observed, self.shedder)
+            group.ticks += 1
+            group.last_duration = time.monotonic() - tick_started
+
+            # A tick overruns when it takes longer than its period takes in
+            # real time, there is no such limit as fast as possible
+            if clock.speed is not None and group.last_duration > period / clock.speed:
+                group.overruns += 1
+                self._logger.warning(
+                    f"Tick overrun in {group}: took {group.last_duration:.3f}s "
+                    f"({group.overruns} overruns)"
+                )
+
+            # Skip deadlines that were missed instead of bursting to catch up,
+            # as fast as possible the clock only moved on for other sleepers
+            finished = clock.monotonic()
+            next_deadline = deadline + period
+            if clock.speed is not None and next_deadline < finished:
+                missed = int((finished - next_deadline) // period) + 1
+                next_deadline += missed * period
+                group.skipped += missed
+            heapq.heappush(self._deadlines, (next_deadline, period))
@@ -0,0 +1,34 @@
+import hashlib
+import random
+from typing import Optional
+import numpy as np
+
+# Shared by every node when the simulation is not seeded
+_unseeded = random.Random()
+
+
+def derive_seed(seed: int, key: str) -> int:
+    """
+    A 64-bit seed for `key` derived from the simulation seed
+
+    The derivation only depends on the seed and the key (e.g. a node id),
+    so a generator is the same no matter in which order or process the
+    generators are created. A node with its own generator draws the same
+    values; the slots of a signal bank share the generator of the bank.
+    """
+    digest = hashlib.blake2b(f"{seed}:{key}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def python_random(seed: Optional[int], key: str) -> random.Random:
+    """Random source for `key`, a shared unseeded one when not seeded"""
+    if seed is None:
+        return _unseeded
+    return random.Random(derive_seed(seed, key))
+
+
+def numpy_random(seed: Optional[int], key: str) -> np.random.Generator:
+    """NumPy generator for `key`, seeded from the OS when not seeded"""
+    if seed is None:
+        return np.random.default_rng()
+    return np.random.default_rng(derive_seed(seed, key))
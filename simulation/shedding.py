@@ -0,0 +1,137 @@
+from datetime import datetime
+import time
+from typing import Callable, Optional
+from .variable import CRITICAL, LOW, SimulatedVariable
+
+
+class LoadShedder:
+    """
+    Holds back the writes of low-priority variables while the simulator falls behind
+
+    The lag is the larger of how late the rate group ticks start (smoothed)
+    and the event-loop lag given by `loop_lag`, both in real seconds. Every
+    `interval` seconds the shedding level goes up by one while the lag is
+    above `target_lag`, and down by one once it is below half the target.
+
+    At level L a variable of priority p is written on every
+    2 ** (L - LOW + p)-th tick of its rate group only (when that is more
+    than one), critical variables are always written. Changes in between
+    are coalesced: the models keep stepping and the latest published value
+    is written, with the timestamp of its change, when the variable is due.
+    So fewer writes and notifications compete with client requests for the
+    event loop.
+
+    Attributes:
+    - level: int (current shedding level, 0 while keeping up)
+    - lag: float (lag in seconds at the last adjustment)
+    - coalesced: int (number of held back changes superseded before being written)
+    """
+
+    def __init__(
+        self,
+        target_lag: float = 0.05,
+        loop_lag: Optional[Callable[[], float]] = None,
+        max_level: int = 4,
+        interval: float = 1.0,
+        smoothing: float = 0.2,
+    ):
+        self.target_lag = target_lag
+        self.max_level = max_level
+        self.level = 0
+        self.lag = 0.0
+        self.coalesced = 0
+        self._loop_lag = loop_lag
+        self._interval = interval
+        self._smoothing = smoothing
+        self._tick_lag = 0.0
+        self._adjusted = time.monotonic()
+        # Timestamps of the held back changes per rate group period and priority
+        self._deferred: dict[float, dict[int, dict[SimulatedVariable, datetime]]] = {}
+
+    def __str__(self):
+        return f"LoadShedder(level={self.level}, target_lag={self.target_lag}s)"
+
+    @property
+    def deferred(self) -> int:
+        """Number of variables whose latest value is still held back"""
+        return sum(
+            len(variables)
+            for priorities in self._deferred.values()
+            for variables in priorities.values()
+        )
+
+    def stride(self, priority: int) -> int:
+        """Every how many ticks a variable of a priority is written"""
+        if priority <= CRITICAL:
+            return 1
+        return 2 ** max(0, self.level - LOW + priority)
+
+    def observe(self, tick_lag: float):
+        """Record how late a tick started, adjust the level once per interval"""
+        self._tick_lag += (tick_lag - self._tick_lag) * self._smoothing
+        now = time.monotonic()
+        if now - self._adjusted < self._interval:
+            return
+        self._adjusted = now
+        lag = self._tick_lag
+        if self._loop_lag is not None:
+            lag = max(lag, self._loop_lag())
+        self.lag = lag
+        if lag > self.target_lag and self.level < self.max_level:
+            self.level += 1
+        elif lag < self.target_lag / 2 and self.level > 0:
+            self.level -= 1
+
+    def shed(
+        self,
+        period: float,
+        ticks: int,
+        changed: list[SimulatedVariable],
+        timestamp: datetime,
+    ) -> list[SimulatedVariable]:
+        """
+        Select the changed variables to write on a tick, hold back the others
+
+        A held back variable keeps the timestamp of its latest change. It is
+        written with the value published then, so no value the deadband did
+        not pass reaches the address space.
+        """
+        deferred = self._deferred.get(period)
+        if not self.level and not deferred:
+            return changed
+        if deferred is None:
+            deferred = self._deferred[period] = {}
+        written = []
+        for variable in changed:
+            if ticks % self.stride(variable.priority):
+                held = deferred.setdefault(variable.priority, {})
+                if held.pop(variable, None) is not None:
+                    self.coalesced += 1
+                held[variable] = timestamp
+            else:
+                # Written now, also when it was held back before
+                deferred.get(variable.priority, {}).pop(variable, None)
+                written.append(variable)
+        return written
+
+    def release(
+        self, period: float, ticks: int
+    ) -> list[tuple[datetime, list[SimulatedVariable]]]:
+        """The held back variables due on a tick, by the timestamp of their change"""
+        deferred = self._deferred.get(period)
+        if not deferred:
+            return []
+        released: dict[datetime, list[SimulatedVariable]] = {}
+        for priority, held in list(deferred.items()):
+            if ticks % self.stride(priority) == 0:
+                for variable, timestamp in held.items():
+                    released.setdefault(timestamp, []).append(variable)
+                del deferred[priority]
+        return sorted(released.items(), key=lambda item: item[0])
+
+    def forget(self, variables: set[SimulatedVariable]):
+        """Drop held back writes of variables that are no longer simulated"""
+        for priorities in self._deferred.values():
+            for held in priorities.values():
+                for variable in variables & held.keys():
+                    del held[variable]
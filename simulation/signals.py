@@ -0,0 +1,329 @@
+from abc import ABC, abstractmethod
+from typing import Any, Iterable, Optional, Sequence
+import numpy as np
+from asyncua import ua
+from .variable import Deadband, SimulatedVariable
+
+_INTEGER_TYPES = {
+    ua.VariantType.SByte,
+    ua.VariantType.Byte,
+    ua.VariantType.Int16,
+    ua.VariantType.UInt16,
+    ua.VariantType.Int32,
+    ua.VariantType.UInt32,
+    ua.VariantType.Int64,
+    ua.VariantType.UInt64,
+}
+
+
+class SignalBank(ABC):
+    """
+    A set of signals of one kind advanced together in one vectorized step.
+
+    Every signal occupies a slot in contiguous NumPy arrays: the current
+    value plus one array per model parameter. Subclasses implement `step`
+    on whole arrays, so the cost of a tick does not grow with Python
+    overhead per variable. Only the slots whose published value changed
+    (by more than the deadband of their variable, if it has one) are
+    copied back into their SimulatedVariable.
+
+    Attributes:
+    - parameters: dict[str, float] (per-slot parameters and their defaults)
+    - variables: list[SimulatedVariable] (variable attached to each slot)
+    - offloadable: bool (whether a simulation worker may step the bank)
+    """
+
+    parameters: dict[str, float] = {}
+    dtype = np.float64
+    offloadable = True
+
+    def __init__(self, rng: Optional[np.random.Generator] = None, decimals: int = 4):
+        self._rng = rng if rng is not None else np.random.default_rng()
+        self._decimals = decimals
+        self._size = 0
+        self._columns: dict[str, np.ndarray] = {
+            name: np.empty(0) for name in self.parameters
+        }
+        self._values = np.empty(0, dtype=self.dtype)
+        self._published = np.empty(0, dtype=self.dtype)
+        self._absolute = np.empty(0)
+        self._percent = np.empty(0)
+        self._deadbands = 0
+        self.variables: list[SimulatedVariable] = []
+
+    def __len__(self):
+        return self._size
+
+    def __str__(self):
+        return f"{type(self).__name__}(signals={self._size})"
+
+    def attach(self, variable: SimulatedVariable, **params: Any) -> int:
+        """Attach a variable to a new slot and return the slot index"""
+        unknown = set(params) - set(self.parameters) - {"value"}
+        if unknown:
+            raise ValueError(f"Unknown parameters for {self}: {sorted(unknown)}")
+
+        slot = self._size
+        if slot == len(self._values):
+            self._grow(max(16, 2 * slot))
+        for name, default in self.parameters.items():
+            self._columns[name][slot] = params.get(name, default)
+        self._values[slot] = self._initial_value(params.get("value", variable.value))
+        self._published[slot] = self._unpublished
+        deadband = variable.deadband
+        if deadband is not None and Deadband.applies(variable.value):
+            self._absolute[slot] = deadband.absolute
+            self._percent[slot] = deadband.percent
+            self._deadbands += 1
+        else:
+            self._absolute[slot] = self._percent[slot] = 0.0
+        self.variables.append(variable)
+        self._size += 1
+        return slot
+
+    def detach(self, variables: Iterable[SimulatedVariable]) -> int:
+        """Remove the slots of some variables, return how many were removed"""
+        removed = set(variables)
+        keep = np.array(
+            [variable not in removed for variable in self.variables], dtype=bool
+        )
+        if keep.all():
+            return 0
+        self._remove(keep)
+        return len(keep) - int(np.count_nonzero(keep))
+
+    def _remove(self, keep: np.ndarray):
+        """Keep only the slots selected by `keep`, in order, at the front"""
+        size = int(np.count_nonzero(keep))
+        for column in (
+            *self._columns.values(),
+            self._values,
+            self._published,
+            self._absolute,
+            self._percent,
+        ):
+            column[:size] = column[: self._size][keep]
+        self._deadbands = int(
+            np.count_nonzero((self._absolute[:size] > 0) | (self._percent[:size] > 0))
+        )
+        self.variables = [
+            variable for variable, kept in zip(self.variables, keep) if kept
+        ]
+        self._size = size
+
+    def _grow(self, capacity: int):
+        """Reallocate the arrays, keeping them contiguous"""
+        for name, column in self._columns.items():
+            self._columns[name] = np.resize(column, capacity)
+        self._values = np.resize(self._values, capacity)
+        self._published = np.resize(self._published, capacity)
+        self._absolute = np.resize(self._absolute, capacity)
+        self._percent = np.resize(self._percent, capacity)
+
+    @property
+    def _unpublished(self):
+        """Marker that forces a slot to be written on the first tick"""
+        return np.nan
+
+    def _initial_value(self, value: Any):
+        """Convert the variable's initial value to the slot representation"""
+        return float(value)
+
+    def column(self, name: str) -> np.ndarray:
+        """Get the active part of a parameter column"""
+        return self._columns[name][: self._size]
+
+    @property
+    def values(self) -> np.ndarray:
+        """Get the current value of every slot"""
+        return self._values[: self._size]
+
+    @abstractmethod
+    def step(self, dt: float):
+        """Advance every slot by dt seconds"""
+
+    def _publish(self) -> np.ndarray:
+        """Get the values as they are written to the address space"""
+        return np.round(self.values, self._decimals)
+
+    def _to_python(self, value: Any, variable: SimulatedVariable) -> Any:
+        """Convert a published value to the variable's Python type"""
+        if variable.variant_type in _INTEGER_TYPES:
+            return int(round(value))
+        if variable.variant_type == ua.VariantType.Boolean:
+            return bool(value)
+        return value
+
+    def tick(
+        self, dt: float, slots: Optional[np.ndarray] = None
+    ) -> list[SimulatedVariable]:
+        """
+        Step the bank and return the variables whose value changed
+
+        Every slot is stepped, but with `slots` only those slots are copied
+        into their variables.
+        """
+        if not self._size:
+            return []
+        self.step(dt)
+        return self.apply(self._publish(), slots)
+
+    def refresh(self, slots: np.ndarray) -> list[SimulatedVariable]:
+        """Copy the current values of some slots into their variables"""
+        if not self._size:
+            return []
+        return self.apply(self._publish(), slots)
+
+    def apply(
+        self, published: np.ndarray, slots: Optional[np.ndarray] = None
+    ) -> list[SimulatedVariable]:
+        """Copy the changed slots of published values into their variables"""
+        if slots is None:
+            published = published[: self._size]
+            previous = self._published[: self._size]
+        else:
+            published = published[slots]
+            previous = self._published[slots]
+        moved = published != previous
+        if self._deadbands:
+            absolute, percent = self._absolute, self._percent
+            if slots is None:
+                absolute, percent = absolute[: self._size], percent[: self._size]
+            else:
+                absolute, percent = absolute[slots], percent[slots]
+            threshold = np.maximum(absolute, np.abs(previous) * percent / 100)
+            # Never published slots (NaN) compare as moved
+            moved &= ~(np.abs(published - previous) <= threshold)
+        changed = np.flatnonzero(moved) if slots is None else slots[moved]
+        if not len(changed):
+            return []
+        values = published[moved]
+        self._published[changed] = values
+
+        variables = []
+        for slot, value in zip(changed.tolist(), values.tolist()):
+            variable = self.variables[slot]
+            variable.value = variable.published = self._to_python(value, variable)
+            variables.append(variable)
+        return variables
+
+    def __getstate__(self):
+        """Pickle the numeric state only, e.g. to step the bank in another process"""
+        state = self.__dict__.copy()
+        state["variables"] = []
+        return state
+
+
+class RandomWalk(SignalBank):
+    """Gaussian random walk bounded to [low, high]"""
+
+    parameters = {"step": 1.0, "low": 0.0, "high": 100.0}
+
+    def step(self, dt: float):
+        values = self.values
+        values += self._rng.standard_normal(self._size) * self.column("step") * dt**0.5
+        np.clip(values, self.column("low"), self.column("high"), out=values)
+
+
+class SineWave(SignalBank):
+    """Sine wave around an offset with additive Gaussian noise"""
+
+    parameters = {
+        "offset": 0.0,
+        "amplitude": 1.0,
+        "period": 60.0,
+        "phase": 0.0,
+        "noise": 0.0,
+    }
+
+    def __init__(self, rng: Optional[np.random.Generator] = None, decimals: int = 4):
+        super().__init__(rng, decimals)
+        self._time = 0.0
+
+    def step(self, dt: float):
+        self._time += dt
+        angle = 2 * np.pi * self._time / self.column("period") + self.column("phase")
+        self.values[:] = (
+            self.column("offset")
+            + self.column("amplitude") * np.sin(angle)
+            + self.column("noise") * self._rng.standard_normal(self._size)
+        )
+
+
+class FirstOrderLag(SignalBank):
+    """First-order lag toward a setpoint with additive Gaussian noise"""
+
+    parameters = {"setpoint": 0.0, "time_constant": 10.0, "noise": 0.0}
+
+    def step(self, dt: float):
+        values = self.values
+        alpha = 1.0 - np.exp(-dt / self.column("time_constant"))
+        values += (self.column("setpoint") - values) * alpha
+        values += self.column("noise") * self._rng.standard_normal(self._size)
+
+
+class MarkovChain(SignalBank):
+    """
+    Discrete state machine, e.g. for Status strings.
+
+    All slots of a bank share the same states and transition matrix, where
+    transitions[i][j] is the probability of moving from state i to state j
+    in one tick.
+    """
+
+    dtype = np.int64
+
+    def __init__(
+        self,
+        states: Sequence[Any],
+        transitions: Sequence[Sequence[float]],
+        rng: Optional[np.random.Generator] = None,
+    ):
+        super().__init__(rng)
+        matrix = np.asarray(transitions, dtype=np.float64)
+        if matrix.shape != (len(states), len(states)):
+            raise ValueError("Transition matrix must be square with one row per state")
+        if not np.allclose(matrix.sum(axis=1), 1.0):
+            raise ValueError("Every row of the transition matrix must sum to 1")
+        self.states = list(states)
+        self._cumulative = np.cumsum(matrix, axis=1)
+
+    @property
+    def _unpublished(self):
+        return -1
+
+    def _initial_value(self, value: Any):
+        return self.states.index(value) if value in self.states else 0
+
+    def step(self, dt: float):
+        values = self.values
+        draws = self._rng.random(self._size)[:, None]
+        values[:] = (draws >= self._cumulative[values]).sum(axis=1)
+        np.minimum(values, len(self.states) - 1, out=values)
+
+    def _publish(self) -> np.ndarray:
+        return self.values.copy()
+
+    def _to_python(self, value: Any, variable: SimulatedVariable) -> Any:
+        return self.states[value]
+
+
+class Signal:
+    """
+    Declares which signal bank drives a variable.
+
+    Example:
+    - Signal(SineWave, offset=72.0, amplitude=0.8, noise=0.1)
+    - Signal(MarkovChain, ("Off", "On"), ((0.9, 0.1), (0.02, 0.98)))
+
+    Positional arguments are passed to the bank constructor and select a
+    distinct bank, keyword arguments are the per-slot parameters.
+    """
+
+    def __init__(self, bank_type: type[SignalBank], *bank_args: Any, **params: Any):
+        self.bank_type = bank_type
+        self.bank_args = bank_args
+        self.params = params
+
+    def __str__(self):
+        return f"Signal({self.bank_type.__name__}, {self.params})"
@@ -0,0 +1,115 @@
+from typing import Any, Callable, Optional
+from asyncua import Node, ua
+
+# Write priorities of simulated variables, the higher ones are shed first
+CRITICAL, NORMAL, LOW = 0, 1, 2
+PRIORITIES = {"critical": CRITICAL, "normal": NORMAL, "low": LOW}
+
+
+class Deadband:
+    """
+    How far a numeric value has to move before it is written again
+
+    A value is written when it differs from the last written one by more
+    than `absolute`, and by more than `percent` % of the last written value.
+    Non-numeric values (strings, booleans) are written whenever they change.
+    """
+
+    __slots__ = ("absolute", "percent")
+
+    def __init__(self, absolute: float = 0.0, percent: float = 0.0):
+        self.absolute = absolute
+        self.percent = percent
+
+    def __str__(self):
+        return f"Deadband(absolute={self.absolute}, percent={self.percent})"
+
+    @staticmethod
+    def applies(value: Any) -> bool:
+        """Whether deadbands apply to a value"""
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def threshold(self, published: float) -> float:
+        """Change of a value needed to write it again"""
+        return max(self.absolute, abs(published) * self.percent / 100)
+
+    def exceeded(self, value: Any, published: Any) -> bool:
+        """Whether a value is to be written again"""
+        if value == published:
+            return False
+        if not (self.applies(value) and self.applies(published)):
+            return True
+        return abs(value - published) > self.threshold(published)
+
+
+class SimulatedVariable:
+    """
+    An address-space variable whose value is owned by the simulation.
+
+    The variant type and current value are recorded once when the node is
+    created, so a tick never has to read them back from the address space.
+    Only changes are written, and with a deadband only changes larger than
+    the deadband: the value keeps following the model in between.
+
+    Attributes:
+    - node: Node (the OPC UA variable node)
+    - variant_type: ua.VariantType (data type used for every write)
+    - value: Any (current value of the model)
+    - generator: Callable (computes the next value from the current one)
+    - deadband: Deadband (optional, minimum change of a numeric value to write it)
+    - published: Any (last value written to the node)
+    - priority: int (write priority while the simulator sheds load, see PRIORITIES)
+    """
+
+    __slots__ = (
+        "node",
+        "variant_type",
+        "value",
+        "generator",
+        "deadband",
+        "published",
+        "priority",
+    )
+
+    def __init__(
+        self,
+        node: Node,
+        variant_type: ua.VariantType,
+        value: Any,
+        generator: Optional[Callable[[Any], Any]] = None,
+        deadband: Optional[Deadband] = None,
+        priority: int = NORMAL,
+    ):
+        self.node = node
+        self.variant_type = variant_type
+        self.value = value
+        self.generator = generator
+        self.deadband = deadband
+        self.published = value
+        self.priority = priority
+
+    def __str__(self):
+        return f"SimulatedVariable(node={self.node.nodeid}, value={self.value})"
+
+    def update(self) -> bool:
+        """Advance the value with the generator, return True when it is to be written"""
+        if self.generator is None:
+            return False
+        self.value = self.generator(self.value)
+        return self.publish()
+
+    def publish(self) -> bool:
+        """Whether the value moved enough to be written, then count it as written"""
+        if self.value == self.published:
+            return False
+        if self.deadband is not None and not self.deadband.exceeded(
+            self.value, self.published
+        ):
+            return False
+        self.published = self.value
+        return True
+
+    async def write(self, value: Any):
+        """Write a value outside of the simulation ticks (e.g. from a method)"""
+        self.value = self.published = value
+        await self.node.write_value(ua.Variant(value, self.variant_type))
@@ -0,0 +1,266 @@
+import asyncio
+import heapq
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+from multiprocessing.synchronize import Event
+import time
+from typing import Iterable, Optional
+import numpy as np
+from .scheduler import Scheduler
+from .signals import SignalBank
+from .variable import SimulatedVariable
+
+# Sequence number at the start of every ring, then the frames
+_HEADER = np.dtype(np.int64).itemsize
+
+
+class RingBuffer:
+    """
+    Frames of published values of one signal bank in shared memory.
+
+    A single writer fills the frame after the current one and then bumps the
+    sequence number, readers copy the frame of the latest sequence number
+    and check that the writer did not wrap around onto it meanwhile.
+    """
+
+    def __init__(self, buffer, offset: int, dtype: np.dtype, size: int, depth: int):
+        self.size = size
+        self.depth = depth
+        self._sequence = np.ndarray((1,), np.int64, buffer, offset)
+        self._frames = np.ndarray((depth, size), dtype, buffer, offset + _HEADER)
+
+    @staticmethod
+    def nbytes(dtype: np.dtype, size: int, depth: int) -> int:
+        """Shared memory needed by a ring"""
+        return _HEADER + depth * size * np.dtype(dtype).itemsize
+
+    @property
+    def sequence(self) -> int:
+        return int(self._sequence[0])
+
+    def write(self, values: np.ndarray):
+        """Publish a new frame"""
+        sequence = self.sequence + 1
+        self._frames[sequence % self.depth] = values
+        self._sequence[0] = sequence
+
+    def read(self, after: int) -> tuple[int, Optional[np.ndarray]]:
+        """Get the latest frame if it is newer than sequence `after`"""
+        while True:
+            sequence = self.sequence
+            if sequence == after:
+                return sequence, None
+            frame = self._frames[sequence % self.depth].copy()
+            # The frame is intact unless the writer reused its slot meanwhile
+            if self.sequence - sequence < self.depth - 1:
+                return sequence, frame
+
+
+class SharedBank:
+    """
+    Stands in for a signal bank stepped by the worker process.
+
+    A tick only copies the latest frame out of shared memory and hands the
+    changed slots to the variables of the original bank.
+    """
+
+    def __init__(self, bank: SignalBank, ring: RingBuffer):
+        self.bank = bank
+        self._ring = ring
+        self._sequence = 0
+        self._frame: Optional[np.ndarray] = None
+
+    def __len__(self):
+        return len(self.bank)
+
+    def __str__(self):
+        return f"SharedBank({self.bank})"
+
+    @property
+    def variables(self) -> list[SimulatedVariable]:
+        return self.bank.variables
+
+    def attach(self, variable: SimulatedVariable, **params):
+        raise RuntimeError(f"{self} is stepped by the simulation worker")
+
+    def detach(self, variables: Iterable[SimulatedVariable]) -> int:
+        if set(variables).intersection(self.bank.variables):
+            raise RuntimeError(f"{self} is stepped by the simulation worker")
+        return 0
+
+    def tick(
+        self, dt: float, slots: Optional[np.ndarray] = None
+    ) -> list[SimulatedVariable]:
+        """Apply the latest frame published by the worker"""
+        self._sequence, frame = self._ring.read(self._sequence)
+        if frame is None:
+            return []
+        self._frame = frame
+        return self.bank.apply(frame, slots)
+
+    def refresh(self, slots: np.ndarray) -> list[SimulatedVariable]:
+        """Apply some slots of the last frame read"""
+        if self._frame is None:
+            return []
+        return self.bank.apply(self._frame, slots)
+
+
+def _run_worker(
+    name: str,
+    groups: list[tuple[float, list[tuple[SignalBank, int, int]]]],
+    depth: int,
+    stop: Event,
+    speed: float,
+):
+    """Step the banks at their periods, `speed` times faster than real time"""
+    # The block is tracked and unlinked by the parent, whose resource
+    # tracker the spawned process shares
+    memory = shared_memory.SharedMemory(name)
+    rings = {
+        period: [
+            (bank, RingBuffer(memory.buf, offset, bank.dtype, size, depth))
+            for bank, offset, size in banks
+        ]
+        for period, banks in groups
+    }
+    # Deadlines in simulated seconds
+    deadlines = [(time.monotonic() * speed, period) for period in rings]
+    heapq.heapify(deadlines)
+    try:
+        while deadlines and not stop.is_set():
+            deadline, period = deadlines[0]
+            delay = deadline - time.monotonic() * speed
+            if delay > 0:
+                stop.wait(delay / speed)
+                continue
+            heapq.heappop(deadlines)
+            for bank, ring in rings[period]:
+                bank.step(period)
+                ring.write(bank._publish())
+            # Skip deadlines that were missed instead of bursting to catch up
+            now = time.monotonic() * speed
+            next_deadline = deadline + period
+            if next_deadline < now:
+                next_deadline += (int((now - next_deadline) // period) + 1) * period
+            heapq.heappush(deadlines, (next_deadline, period))
+    except KeyboardInterrupt:
+        # Ctrl+C in a terminal also reaches the worker, the server stops it
+        stop.wait()
+    finally:
+        # Release the views on the block before closing it
+        rings.clear()
+        memory.close()
+
+
+class SimulationWorker:
+    """
+    Steps the signal banks of a scheduler in a separate process.
+
+    `start` hands every offloadable signal bank registered so far over to
+    the worker: the worker advances them at their periods and publishes the
+    values into shared-memory ring buffers, while the scheduler on the
+    server loop only copies the changed slots into the address space.
+    Variables with a Python generator keep being updated on the server loop.
+    The worker keeps pace with an accelerated clock of the scheduler, but
+    cannot follow a clock running as fast as possible.
+
+    Example:
+        worker = SimulationWorker(scheduler, logger)
+        worker.start()
+        ...
+        worker.stop()
+    """
+
+    def __init__(self, scheduler: Scheduler, logger: logging.Logger, depth: int = 4):
+        if depth < 3:
+            raise ValueError("A ring needs at least 3 frames")
+        if scheduler.clock.speed is None:
+            raise ValueError(
+                "A simulation worker steps in real time, not as fast as possible"
+            )
+        self._scheduler = scheduler
+        self._logger = logger
+        self._depth = depth
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = self._context.Event()
+        self._process = None
+        self._memory: Optional[shared_memory.SharedMemory] = None
+        self._shared: list[tuple[dict, tuple, SharedBank]] = []
+        self._stopping = False
+
+    def __str__(self):
+        return f"SimulationWorker(pid={self._process.pid if self._process else None})"
+
+    def start(self):
+        """Hand the signal banks over to a new worker process"""
+        banks = [
+            (group, key, bank)
+            for group in self._scheduler.rate_groups
+            for key, bank in group.banks.items()
+            if isinstance(bank, SignalBank) and bank.offloadable and len(bank)
+        ]
+        if not banks:
+            self._logger.info("No signal banks to hand over to a simulation worker")
+            return
+        layout = []
+        offset = 0
+        for _, _, bank in banks:
+            layout.append(offset)
+            offset += RingBuffer.nbytes(bank.dtype, len(bank), self._depth)
+        self._memory = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+
+        groups: dict[float, list[tuple[SignalBank, int, int]]] = {}
+        for (group, key, bank), bank_offset in zip(banks, layout):
+            ring = RingBuffer(
+                self._memory.buf, bank_offset, bank.dtype, len(bank), self._depth
+            )
+            groups.setdefault(group.period, []).append((bank, bank_offset, len(bank)))
+            shared = SharedBank(bank, ring)
+            group.banks[key] = shared
+            self._shared.append((group.banks, key, shared))
+
+        self._process = self._context.Process(
+            target=_run_worker,
+            args=(
+                self._memory.name,
+                list(groups.items()),
+                self._depth,
+                self._stop,
+                self._scheduler.clock.speed,
+            ),
+            name="dairy-enterprise-simulation",
+            daemon=True,
+        )
+        self._process.start()
+        self._logger.info(
+            f"Started {self} with {len(banks)} signal banks in {offset} bytes"
+        )
+
+    async def join(self):
+        """Wait for the worker, raise if it exits before being stopped"""
+        if self._process is None:
+            await asyncio.Future()
+        await asyncio.to_thread(self._process.join)
+        if not self._stopping:
+            raise RuntimeError(
+                f"Simulation worker exited with code {self._process.exitcode}"
+            )
+
+    def stop(self):
+        """Stop the worker process and release the shared memory"""
+        self._stopping = True
+        if self._process is not None:
+            self._stop.set()
+            self._process.join(5)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join()
+        # Give the banks back to the scheduler, releasing the views on the block
+        for banks, key, shared in self._shared:
+            banks[key] = shared.bank
+        self._shared.clear()
+        if self._memory is not None:
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = None
@@ -0,0 +1,62 @@
+from datetime import datetime
+import logging
+from typing import Callable, Optional
+from asyncua import Server, ua
+from .clock import SimulationClock
+from .variable import SimulatedVariable
+
+
+class BatchWriter:
+    """
+    Commits the values changed during a tick in a single Write call.
+
+    All values are sent to the internal session as one WriteParameters
+    request instead of one awaited write_value per variable.
+
+    The published value of every variable is written, i.e. the last value
+    that passed its deadband. Listeners are called with the written
+    variables and the source timestamp of the batch, e.g. to record their
+    history. The timestamps are the simulated time of `clock`, unless a
+    write gives its own.
+    """
+
+    def __init__(
+        self,
+        server: Server,
+        logger: logging.Logger,
+        clock: Optional[SimulationClock] = None,
+    ):
+        self._server = server
+        self._logger = logger
+        self.clock = clock if clock is not None else SimulationClock()
+        self.writes = 0
+        self.listeners: list[Callable[[list[SimulatedVariable], datetime], None]] = []
+
+    async def write(
+        self, variables: list[SimulatedVariable], timestamp: Optional[datetime] = None
+    ) -> list[ua.StatusCode]:
+        """Write the published value of every variable in one request, return the results"""
+        if not variables:
+            return []
+        now = timestamp if timestamp is not None else self.clock.now()
+        params = ua.WriteParameters()
+        params.NodesToWrite = [
+            ua.WriteValue(
+                NodeId_=variable.node.nodeid,
+                AttributeId=ua.AttributeIds.Value,
+                Value=ua.DataValue(
+                    ua.Variant(variable.published, variable.variant_type),
+                    SourceTimestamp=now,
+                    ServerTimestamp=now,
+                ),
+            )
+            for variable in variables
+        ]
+        results = await self._server.iserver.isession.write(params)
+        self.writes += len(variables)
+        for listener in self.listeners:
+            listener(variables, now)
+        for variable, result in zip(variables, results):
+            if not result.is_good():
+                self._logger.warning(f"Write failed for {variable}: {result}")
+        return results
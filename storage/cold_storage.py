@@ -1,16 +1,21 @@
 from asyncua import Node
 import logging
+from typing import Optional
+from address_space import NodeBuilder
 from .storage import Storage
 
 
 class ColdStorage(Storage):
     """Cold Storage implementation"""
 
+    capacity_property = "total_capacity"
+
     def __init__(
         self,
         logger: logging.Logger,
         parent_node: Node,
         idx: int,
+        name: str = "Cold Storage",
     ):
         variables = [
             {"temperature": 2.0},  # Initial temperature in °C
@@ -23,10 +28,8 @@ class ColdStorage(Storage):
             {"total_capacity": 1000.0},  # Total storage capacity
         ]
 
-        super().__init__(
-            "Cold Storage", logger, parent_node, idx, variables, properties
-        )
+        super().__init__(name, logger, parent_node, idx, variables, properties)
 
-    async def initialize(self):
-        await super().initialize()
+    async def initialize(self, builder: Optional[NodeBuilder] = None):
+        await super().initialize(builder)
         # Add any specific initialization for cold storage
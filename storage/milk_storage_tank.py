@@ -1,5 +1,7 @@
 from asyncua import Node
 import logging
+from typing import Optional
+from address_space import NodeBuilder
 from .storage import Storage
 
 
@@ -11,6 +13,7 @@ class MilkStorageTank(Storage):
         logger: logging.Logger,
         parent_node: Node,
         idx: int,
+        name: str = "Milk Storage Tank",
     ):
         variables = [
             {"milk_volume": 0.0},  # Initial volume in liters
@@ -24,10 +27,8 @@ class MilkStorageTank(Storage):
             {"max_temperature": 6.0},  # Maximum allowed temperature
         ]
 
-        super().__init__(
-            "Milk Storage Tank", logger, parent_node, idx, variables, properties
-        )
+        super().__init__(name, logger, parent_node, idx, variables, properties)
 
-    async def initialize(self):
-        await super().initialize()
+    async def initialize(self, builder: Optional[NodeBuilder] = None):
+        await super().initialize(builder)
         # Add any specific initialization for milk storage tank
@@ -1,10 +1,22 @@
 from asyncua import Node, ua
 import logging
 from typing import Optional, Dict, Any, List
+from address_space import AddressSpaceSnapshot, NodeBuilder
+from simulation import Scheduler, Signal, SimulatedVariable
+from .storage_model import HIGH_LEVEL, StorageModel
 
 
 class Storage:
-    """Base class for storage units in the production line"""
+    """
+    Base class for storage units in the production line
+
+    Variables named like an output of the StorageModel (milk_volume,
+    temperature, status, capacity_utilization) are simulated by the model,
+    from the capacity and temperature limits in the properties.
+    """
+
+    simulation_period = 1.0
+    capacity_property = "max_capacity"
 
     def __init__(
         self,
@@ -21,22 +33,107 @@ class Storage:
         self.parent_node = parent_node
         self.variables = variables or []
         self.properties = properties or []
+        self._variables: dict[str, SimulatedVariable] = {}
+        self._model: Optional[StorageModel] = None
+        self._unit: Optional[int] = None
+
+    async def initialize(self, builder: Optional[NodeBuilder] = None):
+        """
+        Initialize the storage unit in the OPC UA server
 
-    async def initialize(self):
-        """Initialize the storage unit in the OPC UA server"""
-        self.node = await self.parent_node.add_object(self.idx, self.name)
+        The nodes are queued on `builder` when one is given and created when
+        the caller commits it, otherwise they are created right away.
+        """
+        own_builder = builder is None
+        if own_builder:
+            builder = NodeBuilder(self.parent_node.session)
+        self.node = builder.add_object(self.parent_node, self.idx, self.name)
         # Add reference to the parent node
-        await self.parent_node.add_reference(
-            self.node, ua.ObjectIds.HasChild, forward=True
-        )
-        self.logger.info(f"Created storage node: {self.name}")
+        builder.add_reference(self.parent_node, self.node, ua.ObjectIds.HasChild)
 
         for variable in self.variables:
             for var_name, var_value in variable.items():
-                var = await self.node.add_variable(self.idx, var_name, var_value)
-                await var.set_writable()
+                variant = ua.Variant(var_value)
+                var = builder.add_variable(
+                    self.node, self.idx, var_name, variant, writable=True
+                )
+                self._variables[var_name] = SimulatedVariable(
+                    var, variant.VariantType, var_value
+                )
 
         for property in self.properties:
             for prop_name, prop_value in property.items():
-                prop = await self.node.add_property(self.idx, prop_name, prop_value)
-                await prop.set_writable()
+                builder.add_property(
+                    self.node, self.idx, prop_name, prop_value, writable=True
+                )
+
+        if own_builder:
+            await builder.commit()
+        self.logger.info(f"Created storage node: {self.name}")
+
+    def bind(self, snapshot: AddressSpaceSnapshot):
+        """Bind the storage unit to its node in an address-space snapshot"""
+        self.node = snapshot.child(self.parent_node, self.name)
+        for variable in self.variables:
+            for var_name in variable:
+                self._variables[var_name] = snapshot.variable(self.node, var_name)
+
+    def property_value(self, name: str, default: Any = None) -> Any:
+        """Get the initial value of a property"""
+        for property in self.properties:
+            if name in property:
+                return property[name]
+        return default
+
+    @property
+    def simulated_variables(self) -> dict[str, SimulatedVariable]:
+        """Get the simulated variables by name"""
+        return {
+            name: variable
+            for name, variable in self._variables.items()
+            if name in StorageModel.outputs
+        }
+
+    @property
+    def alarm_limits(self) -> dict[str, tuple[SimulatedVariable, Any, Any]]:
+        """Get the (variable, low, high) limits of the alarms by name"""
+        limits = {}
+        if "temperature" in self._variables:
+            limits["Temperature"] = (
+                self._variables["temperature"],
+                self.property_value("min_temperature"),
+                self.property_value("max_temperature"),
+            )
+        capacity = self.property_value(self.capacity_property)
+        if "milk_volume" in self._variables and capacity is not None:
+            # The unit is emptied before it reaches its capacity
+            limits["Volume"] = (
+                self._variables["milk_volume"],
+                None,
+                HIGH_LEVEL * float(capacity),
+            )
+        return limits
+
+    def run_simulation(self, scheduler: Scheduler):
+        """Add the unit to the storage model and register its variables"""
+        self._model = scheduler.signal_bank(self.simulation_period, StorageModel)
+        initial = {name: variable.value for name, variable in self._variables.items()}
+        self._unit = self._model.add_unit(
+            float(self.property_value(self.capacity_property, 1000.0)),
+            float(self.property_value("min_temperature", 0.0)),
+            float(self.property_value("max_temperature", 10.0)),
+            volume=float(initial.get("milk_volume", 0.0)),
+            temperature=initial.get("temperature"),
+        )
+        for name, variable in self.simulated_variables.items():
+            signal = Signal(StorageModel, output=name, entity=self._unit)
+            scheduler.add_signal(self.simulation_period, variable, signal)
+
+    def connect(self, rate: SimulatedVariable):
+        """Fill the unit with the production of a line (after run_simulation)"""
+        self._model.connect(rate, self._unit)
+
+    def disconnect(self, rate: SimulatedVariable):
+        """Stop filling the unit with the production of a line"""
+        if self._model is not None:
+            self._model.disconnect(rate, self._unit)
@@ -0,0 +1,143 @@
+from typing import Optional
+import numpy as np
+from simulation import EntityModel, SimulatedVariable
+
+# Flow in liters per second a line delivers at a ProductionRate of 1.0
+LINE_FLOW = 10.0
+# A unit filled to this share of its capacity is full and gets emptied...
+FULL_LEVEL = 0.95
+# ...down to this share, in about DRAIN_TIME seconds
+EMPTY_LEVEL = 0.1
+DRAIN_TIME = 60.0
+# High alarm limit of the volume, below FULL_LEVEL so a filling unit reaches it
+HIGH_LEVEL = 0.9
+
+# Temperature drift in °C per second by the surroundings, plus per share
+# of the capacity flowing in per second by the incoming product
+WARMING_RATE = 0.005
+INFLOW_WARMING = 1.0
+# While it runs, the refrigeration removes this multiple of the heat load
+COOLING_FACTOR = 2.0
+TEMPERATURE_NOISE = 0.005
+# The refrigeration switches on and off at this share of the temperature
+# band away from its limits
+HYSTERESIS = 0.25
+
+
+class StorageModel(EntityModel):
+    """
+    Volume and temperature of every storage unit of the plant
+
+    Every tick, in one pass over all units:
+    - the volume integrates the production rates of the connected lines;
+      a unit that reaches FULL_LEVEL is emptied down to EMPTY_LEVEL
+    - the temperature drifts up, faster while product flows in, and a
+      refrigeration with hysteresis keeps it within the min/max
+      temperature of the unit
+    - status is True while a unit is full, until it has been emptied, and
+      capacity utilization (%) follows from the volume
+    """
+
+    entities = {
+        "unit": (
+            "capacity",
+            "min_temperature",
+            "max_temperature",
+            "volume",
+            "temperature",
+            "draining",
+            "cooling",
+            "full",
+            "utilization",
+        ),
+    }
+    outputs = {
+        "milk_volume": ("unit", "volume"),
+        "temperature": ("unit", "temperature"),
+        "status": ("unit", "full"),
+        "capacity_utilization": ("unit", "utilization"),
+    }
+
+    def __init__(self, rng: Optional[np.random.Generator] = None, decimals: int = 4):
+        super().__init__(rng, decimals)
+        self._rates: list[SimulatedVariable] = []
+        self._targets: list[int] = []
+        self._flows: list[float] = []
+
+    def add_unit(
+        self,
+        capacity: float,
+        min_temperature: float,
+        max_temperature: float,
+        volume: float = 0.0,
+        temperature: Optional[float] = None,
+    ) -> int:
+        """Add a storage unit, return its index"""
+        if temperature is None:
+            temperature = (min_temperature + max_temperature) / 2
+        return self.add(
+            "unit",
+            capacity=capacity,
+            min_temperature=min_temperature,
+            max_temperature=max_temperature,
+            volume=volume,
+            temperature=temperature,
+            utilization=100.0 * volume / capacity,
+        )
+
+    def connect(self, rate: SimulatedVariable, unit: int, flow: float = LINE_FLOW):
+        """Fill a unit with `flow` liters per second times the value of `rate`"""
+        self._rates.append(rate)
+        self._targets.append(unit)
+        self._flows.append(flow)
+
+    def disconnect(self, rate: SimulatedVariable, unit: int):
+        """Stop filling a unit with `rate`"""
+        kept = [
+            connection
+            for connection in zip(self._rates, self._targets, self._flows)
+            if connection[0] is not rate or connection[1] != unit
+        ]
+        self._rates, self._targets, self._flows = (
+            [list(column) for column in zip(*kept)] if kept else ([], [], [])
+        )
+
+    def _inflow(self) -> np.ndarray:
+        """Liters per second flowing into every unit"""
+        count = self.count("unit")
+        if not self._rates:
+            return np.zeros(count)
+        rates = np.fromiter(
+            (rate.value for rate in self._rates), np.float64, len(self._rates)
+        )
+        return np.bincount(
+            self._targets, np.maximum(rates, 0.0) * self._flows, minlength=count
+        )
+
+    def step(self, dt: float):
+        units = self.state["unit"]
+        capacity = units["capacity"]
+        volume = units["volume"]
+        inflow = self._inflow()
+
+        # Empty the full units, they take product again below EMPTY_LEVEL
+        draining = units["draining"]
+        draining[volume >= FULL_LEVEL * capacity] = 1.0
+        draining[volume <= EMPTY_LEVEL * capacity] = 0.0
+        outflow = draining * (inflow + capacity / DRAIN_TIME)
+        volume += (inflow - outflow) * dt
+        np.clip(volume, 0.0, capacity, out=volume)
+
+        # Refrigeration with hysteresis within the temperature band
+        low, high = units["min_temperature"], units["max_temperature"]
+        band = (high - low) * HYSTERESIS
+        temperature = units["temperature"]
+        cooling = units["cooling"]
+        cooling[temperature >= high - band] = 1.0
+        cooling[temperature <= low + band] = 0.0
+        warming = WARMING_RATE + INFLOW_WARMING * inflow / capacity
+        temperature += warming * (1.0 - COOLING_FACTOR * cooling) * dt
+        temperature += TEMPERATURE_NOISE * self._rng.standard_normal(len(temperature))
+
+        units["full"][:] = draining
+        units["utilization"][:] = 100.0 * volume / capacity
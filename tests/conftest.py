@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import logging
+import sys
+from pathlib import Path
+from typing import Any
+import pytest
+from asyncua import ua
+
+# The packages live at the top of the repository, next to main.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from simulation import SimulatedVariable
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeSession:
+    """Answers the access level reads and writes of Historian.historize"""
+
+    async def read(self, params):
+        return [ua.DataValue(ua.Variant(1, ua.VariantType.Byte))] * len(
+            params.NodesToRead
+        )
+
+    async def write(self, params):
+        return [ua.StatusCode()] * len(params.NodesToWrite)
+
+
+class FakeNode:
+    def __init__(self, identifier: int):
+        self.nodeid = ua.NodeId(identifier, 2)
+        self.session = FakeSession()
+
+
+class FakeClock:
+    """Simulated time starting at START that only passes when told to, or in sleeps"""
+
+    speed = 1.0
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def monotonic(self) -> float:
+        return self.seconds
+
+    def time(self) -> float:
+        return START.timestamp() + self.seconds
+
+    def now(self) -> datetime:
+        return START + timedelta(seconds=self.seconds)
+
+    async def sleep_until(self, deadline: float):
+        self.seconds = max(self.seconds, deadline)
+        await asyncio.sleep(0)
+
+    async def sleep(self, seconds: float):
+        await self.sleep_until(self.seconds + seconds)
+
+
+class FakeWriter:
+    """
+    Collects the (timestamp, node, value) of every write
+
+    The start of every write is kept in `ticks`, and each write takes
+    `duration` simulated seconds.
+    """
+
+    def __init__(self, duration: float = 0.0):
+        self.clock = FakeClock()
+        self.duration = duration
+        self.ticks: list[float] = []
+        self.written: list[tuple[datetime, int, Any]] = []
+
+    async def write(self, variables, timestamp=None):
+        now = timestamp if timestamp is not None else self.clock.now()
+        self.ticks.append(self.clock.seconds)
+        self.written += [
+            (now, variable.node.nodeid.Identifier, variable.published)
+            for variable in variables
+        ]
+        self.clock.seconds += self.duration
+
+
+def variable(identifier: int, value: Any = 0.0, **kwargs) -> SimulatedVariable:
+    """A simulated Double variable of a fake node"""
+    return SimulatedVariable(
+        FakeNode(identifier), ua.VariantType.Double, value, **kwargs
+    )
+
+
+@pytest.fixture
+def logger() -> logging.Logger:
+    return logging.getLogger("tests")
+
+
+@pytest.fixture
+def writer() -> FakeWriter:
+    return FakeWriter()
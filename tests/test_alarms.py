@@ -0,0 +1,67 @@
+import logging
+import numpy as np
+from alarms import AlarmEngine
+from alarms.engine import HIGH, LOW, NORMAL
+from storage.storage_model import FULL_LEVEL, HIGH_LEVEL, StorageModel
+from conftest import FakeNode, variable
+
+
+def engine() -> AlarmEngine:
+    return AlarmEngine(None, logging.getLogger(__name__))
+
+
+def test_high_and_low_limits_activate_and_clear_with_hysteresis():
+    alarms = engine()
+    temperature = variable(1, 5.0)
+    alarms.add(FakeNode(100), "Tank", "Temperature", temperature, 0.0, 10.0)
+    assert not len(alarms.evaluate())
+
+    temperature.value = 10.5
+    assert alarms.evaluate().tolist() == [0]
+    assert alarms._state[0] == HIGH and not alarms._acked[0]
+
+    # Inside the limit, but not by more than the deadband (1% of the span)
+    temperature.value = 9.95
+    assert not len(alarms.evaluate())
+    temperature.value = 9.8
+    assert alarms.evaluate().tolist() == [0]
+    assert alarms._state[0] == NORMAL
+
+    temperature.value = -1.0
+    alarms.evaluate()
+    assert alarms._state[0] == LOW
+    assert alarms.active == 1
+
+
+def test_changes_of_a_pending_condition_are_coalesced():
+    alarms = engine()
+    level = variable(1)
+    alarms.add(FakeNode(100), "Tank", "Volume", level, high=100.0)
+    level.value = 101.0
+    alarms.evaluate()
+    level.value = 50.0
+    alarms.evaluate()
+    assert alarms.coalesced == 1
+    assert alarms._pending[0]
+
+
+def test_storage_volume_reaches_its_high_limit_before_draining():
+    model = StorageModel(rng=np.random.default_rng(0))
+    capacity = 1000.0
+    unit = model.add_unit(capacity, 2.0, 6.0, volume=0.8 * capacity)
+    volume = variable(1)
+    model.attach(volume, output="milk_volume", entity=unit)
+    rate = variable(2, 1.0)
+    model.connect(rate, unit)
+
+    alarms = engine()
+    alarms.add(FakeNode(100), "Tank", "Volume", volume, high=HIGH_LEVEL * capacity)
+    states = []
+    for _ in range(60):
+        model.tick(1.0)
+        alarms.evaluate()
+        states.append(int(alarms._state[0]))
+    assert HIGH_LEVEL < FULL_LEVEL
+    assert HIGH in states
+    # Emptied once full, the alarm clears again
+    assert states[-1] == NORMAL
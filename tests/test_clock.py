@@ -0,0 +1,79 @@
+import asyncio
+from datetime import timedelta
+import time
+import pytest
+from simulation import SimulationClock
+from conftest import START
+
+
+def test_as_fast_as_possible_jumps_to_the_deadlines_in_order():
+    clock = SimulationClock(None, START)
+    woken = []
+
+    async def sleeper(name: str, deadline: float):
+        await clock.sleep_until(deadline)
+        woken.append((name, clock.monotonic(), clock.now()))
+
+    async def test():
+        await asyncio.gather(
+            sleeper("c", 3.0), sleeper("a", 1.0), sleeper("b", 2.0), sleeper("a2", 1.0)
+        )
+
+    started = time.monotonic()
+    asyncio.run(test())
+    assert time.monotonic() - started < 1.0
+    # Same deadline in the order the tasks went to sleep
+    assert [(name, elapsed) for name, elapsed, _ in woken] == [
+        ("a", 1.0),
+        ("a2", 1.0),
+        ("b", 2.0),
+        ("c", 3.0),
+    ]
+    assert [now for _, _, now in woken] == [
+        START + timedelta(seconds=s) for s in (1, 1, 2, 3)
+    ]
+
+
+def test_a_passed_deadline_does_not_move_the_clock():
+    clock = SimulationClock(None, START)
+
+    async def test():
+        await clock.sleep(5.0)
+        await clock.sleep_until(2.0)
+        return clock.monotonic()
+
+    assert asyncio.run(test()) == 5.0
+    assert clock.now() == START + timedelta(seconds=5)
+
+
+def test_the_last_sleeper_is_woken_when_the_others_are_done():
+    clock = SimulationClock(None, START)
+
+    async def test():
+        late = asyncio.create_task(clock.sleep_until(10.0))
+        # Wakes first and does not sleep again
+        await clock.sleep_until(1.0)
+        await late
+        return clock.monotonic()
+
+    assert asyncio.run(asyncio.wait_for(test(), 1.0)) == 10.0
+
+
+def test_accelerated_time_runs_faster_than_real_time():
+    clock = SimulationClock(100.0, START)
+
+    async def test():
+        started = time.monotonic()
+        await clock.sleep(5.0)
+        return time.monotonic() - started
+
+    real = asyncio.run(test())
+    assert 0.04 <= real < 0.5
+    assert 5.0 <= clock.monotonic() < 100.0 * 0.5
+    assert clock.now() >= START + timedelta(seconds=5)
+    assert clock.speedup() == pytest.approx(100.0, rel=0.05)
+
+
+def test_the_speed_must_be_positive():
+    with pytest.raises(ValueError):
+        SimulationClock(0)
@@ -0,0 +1,62 @@
+import asyncio
+from datetime import timedelta
+import logging
+from asyncua import ua
+from history import Historian
+from simulation import SimulatedVariable
+from conftest import START, FakeClock, variable
+
+MINIMUM = ua.NodeId(ua.ObjectIds.AggregateFunction_Minimum)
+AVERAGE = ua.NodeId(ua.ObjectIds.AggregateFunction_Average)
+COUNT = ua.NodeId(ua.ObjectIds.AggregateFunction_Count)
+START_VALUE = ua.NodeId(ua.ObjectIds.AggregateFunction_Start)
+END_VALUE = ua.NodeId(ua.ObjectIds.AggregateFunction_End)
+
+
+def historian(samples: dict[float, float]) -> tuple[Historian, SimulatedVariable]:
+    """A historian with the values of one variable written at some seconds"""
+    historian = Historian(logging.getLogger(__name__), clock=FakeClock())
+    recorded = variable(1)
+    asyncio.run(historian.historize([recorded]))
+    for seconds, value in samples.items():
+        recorded.published = value
+        historian.record([recorded], START + timedelta(seconds=seconds))
+    return historian, recorded
+
+
+def processed(historian, variable, aggregate, start, end, interval):
+    result = historian.read_processed(
+        variable.node.nodeid,
+        aggregate,
+        START + timedelta(seconds=start),
+        START + timedelta(seconds=end),
+        interval * 1000,
+    )
+    return [
+        data_value.Value.Value if data_value.StatusCode.is_good() else None
+        for data_value in result.HistoryData.DataValues
+    ]
+
+
+def test_held_value_bounds_the_intervals_without_samples():
+    history, variable = historian({5: 1.0, 25: 3.0})
+    # Nothing before the first sample, then 1.0 is held until 25 s
+    assert processed(history, variable, START_VALUE, 0, 40, 10) == [
+        1.0,
+        1.0,
+        1.0,
+        3.0,
+    ]
+    assert processed(history, variable, END_VALUE, 0, 40, 10) == [1.0, 1.0, 3.0, 3.0]
+    assert processed(history, variable, COUNT, 0, 40, 10) == [1, 0, 1, 0]
+    assert processed(history, variable, START_VALUE, -10, 0, 10) == [None]
+
+
+def test_held_value_counts_at_the_interval_start():
+    history, variable = historian({0: 4.0, 15: 2.0, 20: 6.0})
+    # [10, 20) starts with 4.0 held, [20, 30) starts with a sample of its own
+    assert processed(history, variable, MINIMUM, 10, 30, 10) == [2.0, 6.0]
+    assert processed(history, variable, AVERAGE, 10, 30, 10) == [3.0, 6.0]
+    assert processed(history, variable, COUNT, 10, 30, 10) == [1, 1]
+    # The read starts after the last sample, which still bounds it
+    assert processed(history, variable, AVERAGE, 30, 50, 10) == [6.0, 6.0]
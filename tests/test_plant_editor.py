@@ -0,0 +1,192 @@
+import asyncio
+import logging
+from pathlib import Path
+from asyncua import Server, ua
+from enterprise import Enterprise
+from history import Historian
+from simulation import BatchWriter, Scheduler, SimulationClock
+from topology import PlantEditor, PlantTopology, build_plant
+
+TOPOLOGY = (
+    Path(__file__).resolve().parent.parent / "topologies" / "dairy_enterprise.toml"
+)
+NEW_LINES = {
+    "name": "New {index}",
+    "repeat": 2,
+    "equipment": [
+        {"template": "pasteurizer", "properties": {"DeviceID": "PASTEUR-{line}"}},
+        {"template": "homogenizer"},
+    ],
+}
+
+
+class Plant:
+    """The default plant simulated on a server that is not listening"""
+
+    async def start(self, logger: logging.Logger):
+        self.server = Server()
+        await self.server.init()
+        self.idx = await self.server.register_namespace("urn:test:plant")
+        topology = PlantTopology.load(TOPOLOGY)
+        clock = SimulationClock(None)
+        writer = BatchWriter(self.server, logger, clock)
+        self.scheduler = Scheduler(logger, writer, seed=1)
+        # The enterprise is a singleton, every test builds its own
+        Enterprise._instance = None
+        self.enterprise = await build_plant(topology, self.server, self.idx, logger)
+        self.historian = Historian(logger, clock=clock)
+        await self.historian.historize(self.enterprise.simulated_variables.values())
+        self.enterprise.variable_listeners.append(self.historian.update)
+        await self.enterprise.run_simulation(self.scheduler)
+        for production_line in self.enterprise.production_lines:
+            if production_line.simulated:
+                await production_line.run_simulation(self.scheduler)
+        self.editor = PlantEditor(logger, self.enterprise, self.idx, topology)
+        return self
+
+    @property
+    def simulated(self) -> int:
+        """Number of variables the scheduler updates"""
+        return sum(len(group) for group in self.scheduler.rate_groups)
+
+    def storage_rates(self) -> list[list]:
+        return [unit._model._rates for unit in self.enterprise.storage_units]
+
+    async def device_id(self, line: str, equipment: str) -> str:
+        node = await self.enterprise.node.get_child(
+            [f"{self.idx}:{line}", f"{self.idx}:{equipment}", f"{self.idx}:DeviceID"]
+        )
+        return await node.read_value()
+
+
+def run(test):
+    """Run a test coroutine on a freshly started plant"""
+    logger = logging.getLogger("tests")
+    return asyncio.run(_run(test, logger))
+
+
+async def _run(test, logger):
+    await test(await Plant().start(logger))
+
+
+def test_added_lines_are_simulated_historized_and_connected():
+    async def test(plant: Plant):
+        simulated, historized = plant.simulated, len(plant.historian)
+        added = await plant.editor.add_production_lines(NEW_LINES)
+        assert [line.name for line in added] == ["New 1", "New 2"]
+        # The rates of the lines, 3 pasteurizer and 2 homogenizer variables
+        variables = [v for line in added for v in line.simulated_variables.values()]
+        assert len(variables) == 2 * 7
+        assert plant.simulated == simulated + 2 * 7
+        assert len(plant.historian) == historized + 2 * 7
+        assert len(plant.historian) == len(plant.enterprise.simulated_variables)
+        for line in added:
+            rate = line.simulated_variables["ProductionRate"]
+            assert all(rate in rates for rates in plant.storage_rates())
+        assert all(
+            "New 2" in quality_control._lines
+            for quality_control in plant.enterprise.quality_controls
+        )
+        # Four lines in the topology, so the new ones are the 5th and 6th
+        assert await plant.device_id("New 1", "Pasteurizer") == "PASTEUR-5"
+        assert await plant.device_id("New 2", "Pasteurizer") == "PASTEUR-6"
+
+    run(test)
+
+
+def test_removed_lines_leave_the_simulation_and_their_positions_unused():
+    async def test(plant: Plant):
+        simulated, historized = plant.simulated, len(plant.historian)
+        await plant.editor.add_production_lines(NEW_LINES)
+        line = plant.enterprise.production_line("New 1")
+        model, index = line._process.model, line._process.index
+        rate = line.simulated_variables["ProductionRate"]
+        await plant.editor.remove_production_line("New 1")
+        assert plant.enterprise.production_line("New 1") is None
+        assert plant.simulated == simulated + 7
+        assert len(plant.historian) == historized + 7
+        assert not any(rate in rates for rates in plant.storage_rates())
+        assert all(
+            "New 1" not in quality_control._lines
+            for quality_control in plant.enterprise.quality_controls
+        )
+        # The row of the line stays in the model, stopped
+        assert model.state["line"]["running"][index] == 0.0
+
+        await plant.editor.add_production_lines({**NEW_LINES, "name": "Next {index}"})
+        assert await plant.device_id("New 2", "Pasteurizer") == "PASTEUR-6"
+        assert await plant.device_id("Next 1", "Pasteurizer") == "PASTEUR-7"
+
+    run(test)
+
+
+def test_cloned_lines_copy_the_equipment_and_are_simulated():
+    async def test(plant: Plant):
+        simulated = plant.simulated
+        clone = await plant.editor.clone_production_line(
+            "Milk Processing Line", "Milk Processing Line 2"
+        )
+        original = plant.enterprise.production_line("Milk Processing Line")
+        assert [e.name for e in clone.equipment] == [e.name for e in original.equipment]
+        assert clone.node.nodeid != original.node.nodeid
+        assert plant.simulated == simulated + len(clone.simulated_variables)
+        assert await plant.device_id(clone.name, "Pasteurizer") == "1PASTEUR"
+        assert clone._process.index != original._process.index
+
+    run(test)
+
+
+def test_removed_equipment_leaves_the_simulation_and_the_model():
+    async def test(plant: Plant):
+        homogenizers = {"template": "homogenizer", "name": "Homogenizer {index}"}
+        (line,) = await plant.editor.add_production_lines(
+            {
+                "name": "New",
+                "equipment": [
+                    {"template": "pasteurizer"},
+                    {**homogenizers, "repeat": 2},
+                ],
+            }
+        )
+        simulated, historized = plant.simulated, len(plant.historian)
+        homogenizer = line.equipment[1]
+        entity = homogenizer._process[1]
+        await plant.editor.remove_equipment(line.name, "Homogenizer 1")
+        assert [e.name for e in line.equipment] == ["Pasteurizer", "Homogenizer 2"]
+        assert plant.simulated == simulated - 2
+        assert len(plant.historian) == historized - 2
+        model = line._process.model
+        assert model.state["homogenizer"]["active"][entity] == 0.0
+        # The remaining homogenizer keeps the line at full efficiency
+        for _ in range(200):
+            model.step(2.0)
+        assert model.state["line"]["efficiency"][line._process.index] > 0.95
+
+    run(test)
+
+
+def test_unknown_and_duplicate_names_are_refused():
+    async def test(plant: Plant):
+        lines = len(plant.enterprise.production_lines)
+        for change, status in (
+            (plant.editor.remove_production_line("Nope"), ua.StatusCodes.BadNotFound),
+            (
+                plant.editor.clone_production_line(
+                    "Milk Processing Line", "Cheese Production Line"
+                ),
+                ua.StatusCodes.BadInvalidArgument,
+            ),
+            (
+                plant.editor.remove_equipment("Milk Processing Line", "Nope"),
+                ua.StatusCodes.BadNotFound,
+            ),
+        ):
+            try:
+                await change
+            except (KeyError, ValueError) as e:
+                assert plant.editor._status(e).value == status
+            else:
+                raise AssertionError("The change was not refused")
+        assert len(plant.enterprise.production_lines) == lines
+
+    run(test)
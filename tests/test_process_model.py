@@ -0,0 +1,54 @@
+import numpy as np
+from production_line.process_model import MilkProcessModel
+
+
+def model_with_line(pasteurizers: int, homogenizers: int) -> MilkProcessModel:
+    model = MilkProcessModel(rng=np.random.default_rng(0))
+    line = model.add_line(running=True)
+    for _ in range(pasteurizers):
+        model.add_pasteurizer(line)
+    for _ in range(homogenizers):
+        model.add_homogenizer(line)
+    return model
+
+
+def settle(model: MilkProcessModel, ticks: int = 200) -> dict[str, float]:
+    for _ in range(ticks):
+        model.step(1.0)
+    lines = model.state["line"]
+    return {
+        "production_rate": float(lines["production_rate"][0]),
+        "efficiency": float(lines["efficiency"][0]),
+    }
+
+
+def test_a_running_line_settles_at_full_efficiency():
+    rates = settle(model_with_line(2, 2))
+    assert rates["efficiency"] > 0.95
+    assert rates["production_rate"] > 0.95
+
+
+def test_a_removed_homogenizer_no_longer_counts():
+    model = model_with_line(1, 2)
+    model.remove_homogenizer(1)
+    assert settle(model)["efficiency"] > 0.95
+    assert model.state["homogenizer"]["on"].tolist() == [1.0, 0.0]
+
+
+def test_a_removed_pasteurizer_sends_no_flow():
+    model = model_with_line(2, 1)
+    model.remove_pasteurizer(1)
+    rates = settle(model)
+    pasteurizers = model.state["pasteurizer"]
+    assert pasteurizers["flow_rate"][1] == 0.0
+    assert model.state["line"]["nominal_flow"][0] == 10.0
+    # Only the remaining pasteurizer flows, at its nominal share
+    assert 0.95 < rates["production_rate"] < 1.05
+
+
+def test_a_stopped_line_stops_its_flow():
+    model = model_with_line(1, 1)
+    model.set_running(0, False)
+    rates = settle(model, 400)
+    assert rates["production_rate"] < 0.01
+    assert model.state["pasteurizer"]["flow_rate"][0] < 1e-6
@@ -0,0 +1,114 @@
+import asyncio
+import numpy as np
+import pytest
+from asyncua import ua
+from quality_control.quality_control import QualityControl
+from quality_control.sampling import ROLLING_SAMPLES, QualitySampler
+from simulation import Scheduler
+from conftest import variable
+
+
+def sampler_with_lines(lines: int) -> tuple[QualitySampler, int]:
+    sampler = QualitySampler(rng=np.random.default_rng(0))
+    station = sampler.add_station(6.5, 3.0, 1000)
+    for _ in range(lines):
+        sampler.add_line(station)
+    return sampler, station
+
+
+def test_the_statistics_follow_the_distributions_of_the_lines():
+    sampler, station = sampler_with_lines(2)
+    for _ in range(20):
+        sampler.sample(station, 100)
+    statistics = sampler.statistics(station)
+    lines = sampler.state["line"]
+    assert statistics["samples"] == pytest.approx([2000.0, 2000.0], rel=0.1)
+    assert statistics["ph_mean"] == pytest.approx(lines["ph_mean"], abs=0.01)
+    assert statistics["ph_sd"] == pytest.approx(lines["ph_sd"], rel=0.1)
+    assert statistics["fat_mean"] == pytest.approx(lines["fat_mean"], abs=0.05)
+    assert statistics["fat_sd"] == pytest.approx(lines["fat_sd"], rel=0.1)
+    assert all(0.0 <= statistics["pass_rate"]) and all(statistics["pass_rate"] <= 100)
+    assert sampler.tests(station) == 20
+
+
+def test_the_pass_rate_of_a_line_rolls_over_the_recent_samples():
+    sampler, station = sampler_with_lines(1)
+    for _ in range(10):
+        sampler.sample(station, 1000)
+    good = sampler.statistics(station)["pass_rate"][0]
+    # The line goes bad: every pH is out of its limits from now on
+    sampler.state["line"]["ph_mean"][0] = 8.0
+    for _ in range(10):
+        sampler.sample(station, 1000)
+    statistics = sampler.statistics(station)
+    # ROLLING_SAMPLES later the older samples weigh half as much as the new ones
+    assert statistics["pass_rate"][0] == pytest.approx(good / 3, rel=0.05)
+    for _ in range(int(4 * ROLLING_SAMPLES / 1000)):
+        assert not sampler.sample(station, 1000)
+    assert sampler.statistics(station)["pass_rate"][0] < good / 10
+    assert sampler.state["station"]["pass_rate"][station] == 0.0
+
+
+def test_a_removed_line_is_no_longer_sampled():
+    sampler, station = sampler_with_lines(3)
+    other = sampler.add_station(6.5, 3.0, 1000)
+    sampler.add_line(other)
+    assert sampler.lines(station).tolist() == [0, 1, 2]
+    sampler.remove_line(1)
+    assert sampler.lines(station).tolist() == [0, 2]
+    assert sampler.lines(other).tolist() == [3]
+    sampler.sample(station, 10)
+    assert sampler.state["line"]["samples"].tolist() == [10.0, 0.0, 10.0, 0.0]
+    # Lines added later are sampled too
+    assert sampler.add_line(station) == 4
+    assert sampler.lines(station).tolist() == [0, 2, 4]
+
+
+def test_a_station_without_lines_has_nothing_to_sample():
+    sampler, station = sampler_with_lines(1)
+    sampler.remove_line(0)
+    with pytest.raises(ValueError):
+        sampler.sample(station, 10)
+
+
+def test_the_report_is_kept_until_the_next_test_or_line_change(logger, writer):
+    quality_control = QualityControl("Quality Control", logger, None, 2)
+    quality_control.ph_level = variable(1, 6.5)
+    quality_control.fat_content = variable(2, 3.0)
+    quality_control.bacterial_count = variable(3, 1000)
+    quality_control.pass_rate = variable(4, 100.0)
+    quality_control.run_simulation(Scheduler(logger, writer, seed=1), ["A", "B"])
+
+    async def call(method):
+        [result] = await method(None)
+        return result.Value
+
+    async def test():
+        assert await call(quality_control.run_test) in (True, False)
+        report = await call(quality_control.generate_report)
+        assert await call(quality_control.generate_report) is report
+        assert "A: pH" in report and "B: pH" in report
+
+        await call(quality_control.run_test)
+        tested = await call(quality_control.generate_report)
+        assert tested is not report
+
+        quality_control.add_line("C")
+        added = await call(quality_control.generate_report)
+        assert added is not tested
+        # C has not been sampled yet
+        assert "C: pH" not in added
+
+        quality_control.remove_line("A")
+        removed = await call(quality_control.generate_report)
+        assert removed is not added
+        assert "A: pH" not in removed and "B: pH" in removed
+
+    asyncio.run(test())
+    assert quality_control._sampler.lines(quality_control._station).tolist() == [1, 2]
+
+
+def test_a_station_without_simulation_reports_an_invalid_state(logger):
+    quality_control = QualityControl("Quality Control", logger, None, 2)
+    status = asyncio.run(quality_control.generate_report(None))
+    assert status == ua.StatusCode(ua.StatusCodes.BadInvalidState)
@@ -0,0 +1,96 @@
+import csv
+from datetime import timedelta
+import logging
+import threading
+import time
+import numpy as np
+from asyncua import ua
+from history.recorder import ValueRecorder, export_csv, read_recording
+from simulation import SimulatedVariable
+from conftest import START, FakeNode, variable
+
+logger = logging.getLogger("tests")
+
+
+def status(identifier: int, value: str) -> SimulatedVariable:
+    return SimulatedVariable(FakeNode(identifier), ua.VariantType.String, value)
+
+
+def test_recorded_values_are_read_back_and_exported(tmp_path):
+    recorder = ValueRecorder(tmp_path / "recording", logger, buffer_rows=3)
+    temperature, running = variable(1), status(2, "Off")
+    recorder.start()
+    for second, (value, state) in enumerate(((72.5, "On"), (72.75, "Off"))):
+        temperature.published, running.published = value, state
+        recorder.record([temperature, running], START + timedelta(seconds=second))
+    recorder.close()
+
+    nodes, samples = read_recording(tmp_path / "recording")
+    assert nodes == [
+        {"node_id": "ns=2;i=1", "type": "Double"},
+        {"node_id": "ns=2;i=2", "type": "String", "labels": ["On", "Off"]},
+    ]
+    assert samples["node"].tolist() == [0, 1, 0, 1]
+    assert samples["time"].tolist() == [START.timestamp() + s for s in (0, 0, 1, 1)]
+    assert samples["value"].tolist() == [72.5, 0.0, 72.75, 1.0]
+    assert recorder.recorded == 4 and recorder.dropped == 0
+
+    rows = export_csv(tmp_path / "recording", tmp_path / "values.csv")
+    with open(tmp_path / "values.csv", newline="") as f:
+        exported = list(csv.reader(f))
+    assert rows == 4
+    assert exported[0] == ["time", "node_id", "value"]
+    assert exported[1:3] == [
+        [START.isoformat(), "ns=2;i=1", "72.5"],
+        [START.isoformat(), "ns=2;i=2", "On"],
+    ]
+    assert exported[4] == [
+        (START + timedelta(seconds=1)).isoformat(),
+        "ns=2;i=2",
+        "Off",
+    ]
+
+
+def test_values_outside_of_a_recording_are_ignored(tmp_path):
+    recorder = ValueRecorder(tmp_path / "recording", logger)
+    recorder.record([variable(1)], START)
+    recorder.start()
+    recorder.close()
+    recorder.record([variable(1)], START)
+    assert recorder.recorded == 0
+    nodes, samples = read_recording(tmp_path / "recording")
+    assert nodes == [] and len(samples) == 0
+
+
+class StalledRecorder(ValueRecorder):
+    """A recorder whose disk does not keep up until released"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.released = threading.Event()
+
+    def _drain(self):
+        self.released.wait()
+        super()._drain()
+
+
+def test_samples_are_dropped_while_the_disk_falls_behind(tmp_path):
+    recorder = StalledRecorder(
+        tmp_path / "recording", logger, buffer_rows=2, max_buffers=1
+    )
+    recorder.start()
+    values = [variable(i) for i in range(2)]
+    for second in range(3):
+        recorder.record(values, START + timedelta(seconds=second))
+    # The first full buffer waits for the thread, the second one is dropped
+    assert recorder.recorded == 2 and recorder.dropped == 2
+    recorder.released.set()
+    while not recorder._queue.empty():
+        time.sleep(0.01)
+    recorder.close()
+    nodes, samples = read_recording(tmp_path / "recording")
+    assert recorder.recorded == 4
+    assert np.unique(samples["time"]).tolist() == [
+        START.timestamp(),
+        START.timestamp() + 2,
+    ]
@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from simulation import Scheduler
+from simulation.signals import Signal, SineWave
+from simulation.worker import SharedBank
+from conftest import FakeWriter, variable
+
+
+def test_remove_refuses_worker_stepped_variables_without_removing_any(logger):
+    scheduler = Scheduler(logger, FakeWriter(), seed=1)
+    signal = Signal(SineWave, offset=1.0, amplitude=1.0)
+    stepped, own = variable(1), variable(2)
+    scheduler.add_signal(1.0, stepped, signal)
+    scheduler.add(1.0, own)
+    (group,) = scheduler.rate_groups
+    key = (SineWave, ())
+    group.banks[key] = SharedBank(group.banks[key], ring=None)
+    assert scheduler.offloaded([stepped]) and not scheduler.offloaded([own])
+    assert scheduler.offloaded_signal(1.0, signal)
+    with pytest.raises(RuntimeError):
+        scheduler.remove([stepped, own])
+    assert group.variables == [own] and len(group) == 2
+    assert scheduler.remove([own]) == 1
+
+
+async def run_ticks(scheduler: Scheduler, ticks: int):
+    """Run the scheduler until its only rate group ticked `ticks` times"""
+    task = asyncio.create_task(scheduler.run())
+    while scheduler.rate_groups[0].ticks < ticks:
+        await asyncio.sleep(0)
+    task.cancel()
+
+
+def test_deadlines_are_kept_while_the_ticks_keep_up(logger):
+    writer = FakeWriter(duration=0.5)
+    scheduler = Scheduler(logger, writer)
+    scheduler.add(1.0, variable(1))
+    asyncio.run(run_ticks(scheduler, 3))
+    assert writer.ticks == [0.0, 1.0, 2.0]
+    assert scheduler.rate_groups[0].skipped == 0
+
+
+def test_missed_deadlines_are_skipped_instead_of_caught_up(logger):
+    writer = FakeWriter(duration=3.5)
+    scheduler = Scheduler(logger, writer)
+    scheduler.add(1.0, variable(1))
+    asyncio.run(run_ticks(scheduler, 3))
+    # Each tick ends 3.5 s after it started, past the deadlines at +1, +2 and +3
+    assert writer.ticks == [0.0, 4.0, 8.0]
+    assert scheduler.rate_groups[0].skipped == 3 * 3
+
+
+def test_signal_banks_draw_per_namespace(logger):
+    def draws(namespace: str) -> list[float]:
+        scheduler = Scheduler(logger, FakeWriter(), seed=1, namespace=namespace)
+        bank = scheduler.signal_bank(1.0, SineWave)
+        return bank._rng.random(3).tolist()
+
+    assert draws("urn:shard:0") == draws("urn:shard:0")
+    assert draws("urn:shard:0") != draws("urn:shard:1")
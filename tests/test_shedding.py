@@ -0,0 +1,84 @@
+import asyncio
+from datetime import timedelta
+from simulation import CRITICAL, LOW, NORMAL, Deadband, LoadShedder, RateGroup
+from conftest import START, variable
+
+
+def shedder(level: int) -> LoadShedder:
+    shedder = LoadShedder()
+    shedder.level = level
+    return shedder
+
+
+def test_stride_grows_with_level_and_priority():
+    assert [shedder(0).stride(p) for p in (CRITICAL, NORMAL, LOW)] == [1, 1, 1]
+    assert [shedder(1).stride(p) for p in (CRITICAL, NORMAL, LOW)] == [1, 1, 2]
+    assert [shedder(3).stride(p) for p in (CRITICAL, NORMAL, LOW)] == [1, 4, 8]
+
+
+def test_held_back_changes_are_coalesced_and_released_when_due():
+    load = shedder(2)
+    critical, normal, low = (variable(i, priority=p) for i, p in enumerate((0, 1, 2)))
+    # Every variable changes on tick 1, only the low one on tick 2 again
+    changes = {1: [critical, normal, low], 2: [critical, low], 3: [critical]}
+    written = {}
+    for ticks in range(1, 5):
+        timestamp = START + timedelta(seconds=ticks)
+        now = load.shed(1.0, ticks, changes.get(ticks, []), timestamp)
+        released = [
+            (when.second, held.priority)
+            for when, variables in load.release(1.0, ticks)
+            for held in variables
+        ]
+        written[ticks] = ([v.priority for v in now], released)
+    # Critical variables always, normal ones every 2nd tick, low ones every 4th
+    assert written == {
+        1: ([CRITICAL], []),
+        2: ([CRITICAL], [(1, NORMAL)]),
+        3: ([CRITICAL], []),
+        4: ([], [(2, LOW)]),
+    }
+    # The change of the low variable on tick 1 was superseded on tick 2
+    assert load.coalesced == 1
+    assert load.deferred == 0
+
+
+def test_release_writes_the_change_with_its_own_timestamp():
+    load = shedder(1)
+    low = variable(1, priority=LOW)
+    low.published = 5.0
+    assert load.shed(1.0, 1, [low], START) == []
+    assert load.release(1.0, 1) == []
+    assert load.release(1.0, 2) == [(START, [low])]
+
+
+def test_a_held_back_variable_is_written_with_its_published_value(logger, writer):
+    # The value keeps drifting inside the deadband after it was held back
+    values = iter([10.0, 10.05, 10.08, 10.09])
+    low = variable(
+        1,
+        priority=LOW,
+        generator=lambda _: next(values),
+        deadband=Deadband(absolute=1.0),
+    )
+    group = RateGroup(1.0)
+    group.variables.append(low)
+    load = shedder(2)
+
+    async def run(ticks: int):
+        for _ in range(ticks):
+            await group.tick(writer, logger, shedder=load)
+            group.ticks += 1
+            writer.clock.seconds += 1.0
+
+    asyncio.run(run(4))
+    assert low.value == 10.09
+    assert writer.written == [(START, 1, 10.0)]
+
+
+def test_forget_drops_held_back_variables():
+    load = shedder(2)
+    low = variable(1, priority=LOW)
+    load.shed(1.0, 1, [low], START)
+    load.forget({low})
+    assert load.deferred == 0
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from pathlib import Path
+from asyncua import Server, ua
+from address_space import snapshot as snapshots
+from address_space import AddressSpaceSnapshot, file_digest
+from enterprise import Enterprise
+from topology import PlantTopology, build_plant
+
+TOPOLOGY = (
+    Path(__file__).resolve().parent.parent / "topologies" / "dairy_enterprise.toml"
+)
+NAMESPACE = "urn:test:snapshot"
+
+
+async def server() -> tuple[Server, int]:
+    server = Server()
+    await server.init()
+    return server, await server.register_namespace(NAMESPACE)
+
+
+async def build(
+    server: Server, idx: int, snapshot: AddressSpaceSnapshot | None = None
+) -> Enterprise:
+    # The enterprise is a singleton, every build makes its own
+    Enterprise._instance = None
+    return await build_plant(
+        PlantTopology.load(TOPOLOGY), server, idx, logging.getLogger("tests"), snapshot
+    )
+
+
+def callbacks(server: Server) -> set[ua.NodeId]:
+    """The plant nodes with a method callback"""
+    return {
+        nodeid
+        for nodeid, ndata in server.iserver.aspace._nodes.items()
+        if nodeid.NamespaceIndex != 0 and ndata.call is not None
+    }
+
+
+def test_a_saved_snapshot_binds_the_plant_to_the_installed_nodes(tmp_path):
+    path = tmp_path / "plant.snapshot"
+    digest = file_digest(TOPOLOGY)
+
+    async def test():
+        built_server, idx = await server()
+        built = await build(built_server, idx)
+        snapshot = await AddressSpaceSnapshot.capture(built_server, digest)
+        snapshot.save(path)
+
+        loaded = AddressSpaceSnapshot.load(path)
+        assert len(loaded) == len(snapshot)
+        warm_server, warm_idx = await server()
+        assert await loaded.is_compatible(warm_server, digest)
+        loaded.install(warm_server)
+        bound = await build(warm_server, warm_idx, loaded)
+
+        nodes = warm_server.iserver.aspace._nodes
+        expected = built.simulated_variables
+        assert bound.simulated_variables.keys() == expected.keys()
+        for name, variable in bound.simulated_variables.items():
+            assert variable.node.nodeid == expected[name].node.nodeid
+            assert variable.node.nodeid in nodes
+            assert variable.variant_type == expected[name].variant_type
+            assert variable.value == expected[name].value
+        assert callbacks(warm_server) == callbacks(built_server)
+
+        # The bound methods run on the installed nodes
+        pasteurizer = await bound.node.get_child(
+            [f"{warm_idx}:Milk Processing Line", f"{warm_idx}:Pasteurizer"]
+        )
+        assert await pasteurizer.call_method(f"{warm_idx}:StartHeater") == "On"
+
+    asyncio.run(test())
+
+
+def test_mismatched_snapshots_are_rejected(tmp_path, monkeypatch):
+    path = tmp_path / "plant.snapshot"
+    digest = file_digest(TOPOLOGY)
+
+    async def test():
+        built_server, idx = await server()
+        await build(built_server, idx)
+        snapshot = await AddressSpaceSnapshot.capture(built_server, digest)
+        snapshot.save(path)
+
+        other_server = Server()
+        await other_server.init()
+        await other_server.register_namespace("urn:test:other")
+        assert not await snapshot.is_compatible(other_server, digest)
+        warm_server, _ = await server()
+        assert not await snapshot.is_compatible(warm_server, "changed topology")
+
+    asyncio.run(test())
+    monkeypatch.setattr(snapshots, "SNAPSHOT_VERSION", snapshots.SNAPSHOT_VERSION + 1)
+    assert AddressSpaceSnapshot.load(path) is None
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+from storage.storage_model import (
+    DRAIN_TIME,
+    EMPTY_LEVEL,
+    FULL_LEVEL,
+    HYSTERESIS,
+    LINE_FLOW,
+    StorageModel,
+)
+from conftest import variable
+
+
+def storage_model() -> StorageModel:
+    return StorageModel(rng=np.random.default_rng(0))
+
+
+def test_the_volume_integrates_the_connected_lines():
+    model = storage_model()
+    first = model.add_unit(10000.0, 2.0, 6.0)
+    second = model.add_unit(10000.0, 2.0, 6.0)
+    model.connect(variable(1, 1.0), first)
+    model.connect(variable(2, 0.5), first)
+    model.connect(variable(3, 0.5), second, flow=4.0)
+    for _ in range(10):
+        model.step(1.0)
+    units = model.state["unit"]
+    assert units["volume"].tolist() == pytest.approx([1.5 * LINE_FLOW * 10, 20.0])
+    assert units["utilization"].tolist() == pytest.approx([1.5, 0.2])
+    assert not units["full"].any()
+
+
+def test_a_negative_rate_does_not_drain_a_unit():
+    model = storage_model()
+    unit = model.add_unit(1000.0, 2.0, 6.0, volume=100.0)
+    model.connect(variable(1, -1.0), unit)
+    model.step(1.0)
+    assert model.state["unit"]["volume"][0] == 100.0
+
+
+def test_a_full_unit_drains_down_to_the_empty_level_and_fills_again():
+    model = storage_model()
+    capacity = 1000.0
+    unit = model.add_unit(capacity, 2.0, 6.0, volume=0.9 * capacity)
+    model.connect(variable(1, 1.0), unit)
+    units = model.state["unit"]
+    volumes, full = [], []
+    for _ in range(int(2 * DRAIN_TIME)):
+        model.step(1.0)
+        volumes.append(units["volume"][0])
+        full.append(units["full"][0])
+
+    # Full from the tick it reaches FULL_LEVEL...
+    filled = next(
+        tick for tick, volume in enumerate(volumes) if volume >= FULL_LEVEL * capacity
+    )
+    assert not any(full[: filled + 1])
+    assert volumes[filled] >= FULL_LEVEL * capacity
+    assert full[filled + 1]
+    # ...draining at capacity / DRAIN_TIME, the inflow runs straight through...
+    assert volumes[filled + 1] == pytest.approx(volumes[filled] - capacity / DRAIN_TIME)
+    # ...until it is down to EMPTY_LEVEL and takes product again
+    emptied = full.index(0.0, filled + 1)
+    assert volumes[emptied - 1] <= EMPTY_LEVEL * capacity
+    assert volumes[emptied] == pytest.approx(volumes[emptied - 1] + LINE_FLOW)
+    assert max(volumes) <= capacity
+
+
+def test_the_refrigeration_keeps_the_temperature_within_its_band():
+    model = storage_model()
+    low, high = 2.0, 6.0
+    unit = model.add_unit(1000.0, low, high, temperature=low)
+    model.connect(variable(1, 1.0), unit)
+    units = model.state["unit"]
+    band = (high - low) * HYSTERESIS
+    temperatures, cooling = [], []
+    # Empty the unit on every tick so the inflow keeps warming it
+    for _ in range(2000):
+        units["volume"][:] = 0.0
+        model.step(1.0)
+        temperatures.append(units["temperature"][0])
+        cooling.append(units["cooling"][0])
+
+    switches = np.flatnonzero(np.diff(cooling))
+    assert len(switches) >= 4
+    for switch in switches:
+        before = temperatures[switch]
+        if cooling[switch + 1]:
+            # Switched on near the top of the band...
+            assert before >= high - band
+        else:
+            # ...and off near the bottom, not right away again
+            assert before <= low + band
+    assert low + band - 0.1 < min(temperatures[switches[0] :])
+    assert max(temperatures) < high - band + 0.1
+
+
+def test_a_disconnected_line_no_longer_fills_its_unit():
+    model = storage_model()
+    unit = model.add_unit(1000.0, 2.0, 6.0)
+    rate = variable(1, 1.0)
+    model.connect(rate, unit)
+    model.connect(variable(2, 1.0), unit)
+    model.disconnect(rate, unit)
+    model.step(1.0)
+    assert model.state["unit"]["volume"][0] == LINE_FLOW
+    model.disconnect(model._rates[0], unit)
+    model.step(1.0)
+    assert model.state["unit"]["volume"][0] == LINE_FLOW
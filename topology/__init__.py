@@ -0,0 +1,22 @@
+from .loader import load_topology_file
+from .plant import PlantTopology, expand
+from .builder import (
+    build_plant,
+    build_production_line,
+    clone_equipment,
+    clone_production_line,
+    create_equipment,
+)
+from .runtime import PlantEditor
+
+__all__ = [
+    "load_topology_file",
+    "PlantTopology",
+    "expand",
+    "build_plant",
+    "build_production_line",
+    "create_equipment",
+    "clone_equipment",
+    "clone_production_line",
+    "PlantEditor",
+]
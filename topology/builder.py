@@ -0,0 +1,265 @@
+import asyncio
+from itertools import islice
+import logging
+from typing import Any, Optional
+from asyncua import Node, Server
+from asyncua.common.methods import uamethod
+from address_space import AddressSpaceSnapshot, NodeBuilder
+from enterprise import Enterprise
+from production_line.equipment import Equipment
+from production_line.equipements.homogenizer import Homogenizer
+from production_line.equipements.pasteurizer import Pasteurizer
+from production_line.production_line import ProductionLine
+from simulation import (
+    Deadband,
+    FirstOrderLag,
+    MarkovChain,
+    PRIORITIES,
+    RandomWalk,
+    Signal,
+    SignalBank,
+    SineWave,
+)
+from .plant import PlantTopology
+
+EQUIPMENT_TYPES: dict[str, type[Equipment]] = {
+    "Equipment": Equipment,
+    "Pasteurizer": Pasteurizer,
+    "Homogenizer": Homogenizer,
+}
+
+# Production lines built concurrently before the next ones are expanded
+LINES_PER_BATCH = 32
+
+SIGNAL_MODELS: dict[str, type[SignalBank]] = {
+    "RandomWalk": RandomWalk,
+    "SineWave": SineWave,
+    "FirstOrderLag": FirstOrderLag,
+    "MarkovChain": MarkovChain,
+}
+
+
+def parse_signal(spec: dict[str, Any]) -> Signal:
+    """
+    Create a Signal from its topology spec
+
+    Example:
+    - { model = "SineWave", offset = 72.0, amplitude = 0.8 }
+    - { model = "MarkovChain", states = ["Off", "On"], transitions = [[0.9, 0.1], [0.02, 0.98]] }
+    """
+    params = dict(spec)
+    model = SIGNAL_MODELS[params.pop("model")]
+    if model is MarkovChain:
+        states = tuple(params.pop("states"))
+        transitions = tuple(tuple(row) for row in params.pop("transitions"))
+        return Signal(model, states, transitions, **params)
+    return Signal(model, **params)
+
+
+def parse_deadband(spec: float | str | dict[str, float]) -> Deadband:
+    """
+    Create a Deadband from its topology spec
+
+    Example:
+    - 0.5 (absolute)
+    - "2%" (percent of the last written value)
+    - { absolute = 0.5, percent = 2.0 }
+    """
+    if isinstance(spec, dict):
+        return Deadband(**spec)
+    if isinstance(spec, str) and spec.endswith("%"):
+        return Deadband(percent=float(spec[:-1]))
+    return Deadband(absolute=float(spec))
+
+
+def parse_priority(spec: int | str) -> int:
+    """
+    Write priority of a topology spec while the simulator sheds load
+
+    Example:
+    - "critical", "normal" or "low"
+    - 2 (same as "low")
+    """
+    if isinstance(spec, str):
+        if spec not in PRIORITIES:
+            raise ValueError(f"Unknown priority {spec}, one of {list(PRIORITIES)}")
+        return PRIORITIES[spec]
+    if spec not in PRIORITIES.values():
+        raise ValueError(f"Unknown priority {spec}, one of {list(PRIORITIES.values())}")
+    return spec
+
+
+def _constant_method(value: Any):
+    """Method callback that always returns the same value"""
+
+    # A coroutine runs on the server loop, and uamethod returns the value
+    # as the output argument variant asyncua expects
+    @uamethod
+    async def method(parent):
+        return value
+
+    return method
+
+
+def create_equipment(
+    spec: dict[str, Any],
+    logger: logging.Logger,
+    parent_node: Node,
+    idx: int,
+) -> Equipment:
+    """Create (but do not initialize) an equipment from its topology spec"""
+    equipment_type = EQUIPMENT_TYPES[spec["type"]]
+    equipment = equipment_type(
+        name=spec.get("name", spec["type"]),
+        logger=logger,
+        parent_node=parent_node,
+        idx=idx,
+        variables=[{name: value} for name, value in spec.get("variables", {}).items()],
+        properties=[
+            {name: value} for name, value in spec.get("properties", {}).items()
+        ],
+        methods=[
+            {name: _constant_method(value)}
+            for name, value in spec.get("methods", {}).items()
+        ],
+        signals={
+            name: parse_signal(signal)
+            for name, signal in spec.get("signals", {}).items()
+        },
+        deadbands={
+            name: parse_deadband(deadband)
+            for name, deadband in spec.get("deadbands", {}).items()
+        },
+    )
+    if "period" in spec:
+        equipment.simulation_period = spec["period"]
+    if "priority" in spec:
+        equipment.priority = parse_priority(spec["priority"])
+    return equipment
+
+
+def clone_equipment(equipment: Equipment, parent_node: Node) -> Equipment:
+    """Create (but do not initialize) a copy of an equipment under another node"""
+    clone = type(equipment)(
+        name=equipment.name,
+        logger=equipment.logger,
+        parent_node=parent_node,
+        idx=equipment.idx,
+        variables=equipment.variables,
+        properties=equipment.properties,
+        methods=equipment.methods,
+        signals=equipment.signals,
+        deadbands=equipment.deadbands,
+    )
+    clone.simulation_period = equipment.simulation_period
+    clone.priority = equipment.priority
+    return clone
+
+
+async def build_production_line(
+    spec: dict[str, Any],
+    logger: logging.Logger,
+    parent_node: Node,
+    idx: int,
+    snapshot: Optional[AddressSpaceSnapshot] = None,
+) -> ProductionLine:
+    """
+    Create and initialize a production line with its equipment
+
+    The line and all of its equipment are created with a single batch of
+    AddNodes and AddReferences requests.
+    """
+    production_line = ProductionLine(
+        name=spec["name"],
+        logger=logger,
+        parent_node=parent_node,
+        idx=idx,
+        simulated=spec.get("simulate", True),
+        coupled=spec.get("coupled", True),
+    )
+    builder = None
+    if snapshot is not None:
+        production_line_node = production_line.bind(snapshot)
+    else:
+        builder = NodeBuilder(parent_node.session)
+        production_line_node = await production_line.initialize(builder)
+    for equipment_spec in spec["equipment"]:
+        equipment = create_equipment(equipment_spec, logger, production_line_node, idx)
+        if snapshot is not None:
+            equipment.bind(snapshot)
+        else:
+            await equipment.initialize(builder)
+        production_line.add_simulated_equipment(equipment)
+    if builder is not None:
+        await builder.commit()
+    return production_line
+
+
+async def clone_production_line(
+    source: ProductionLine,
+    name: str,
+    logger: logging.Logger,
+    parent_node: Node,
+    idx: int,
+) -> ProductionLine:
+    """Create and initialize a copy of a production line and its equipment"""
+    production_line = ProductionLine(
+        name=name,
+        logger=logger,
+        parent_node=parent_node,
+        idx=idx,
+        simulated=source.simulated,
+        coupled=source.coupled,
+    )
+    builder = NodeBuilder(parent_node.session)
+    production_line_node = await production_line.initialize(builder)
+    for equipment in source.equipment:
+        clone = clone_equipment(equipment, production_line_node)
+        await clone.initialize(builder)
+        production_line.add_simulated_equipment(clone)
+    await builder.commit()
+    return production_line
+
+
+async def build_plant(
+    topology: PlantTopology,
+    server: Server,
+    idx: int,
+    logger: logging.Logger,
+    snapshot: Optional[AddressSpaceSnapshot] = None,
+) -> Enterprise:
+    """
+    Build the whole plant described by a topology
+
+    Production lines are independent subtrees: they are built concurrently
+    in groups of LINES_PER_BATCH, so a large `repeat` is only expanded one
+    group at a time.
+
+    Args:
+        topology (PlantTopology): The plant layout
+        server (Server): The server to create the nodes on
+        idx (int): The namespace index of the plant nodes
+        snapshot (AddressSpaceSnapshot): Installed snapshot to bind to instead
+            of creating the nodes
+    """
+    enterprise = await Enterprise.create(
+        name=topology.name,
+        logger=logger,
+        server=server,
+        idx=idx,
+        production_lines=[],
+        storage=topology.storage,
+        quality_controls=topology.quality_controls,
+        snapshot=snapshot,
+    )
+    specs = topology.production_lines()
+    while batch := list(islice(specs, LINES_PER_BATCH)):
+        production_lines = await asyncio.gather(
+            *(
+                build_production_line(spec, logger, enterprise.node, idx, snapshot)
+                for spec in batch
+            )
+        )
+        for production_line in production_lines:
+            await enterprise.add_production_line(production_line)
+    return enterprise
@@ -0,0 +1,32 @@
+import json
+from pathlib import Path
+import tomllib
+from typing import Any
+
+try:
+    import yaml
+except ImportError:  # PyYAML is only needed for .yaml/.yml topologies
+    yaml = None
+
+
+def load_topology_file(path: str | Path) -> dict[str, Any]:
+    """
+    Read a plant topology file
+
+    Args:
+        path (str | Path): A .toml, .json, .yaml or .yml file
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".toml":
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    if suffix == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    if suffix in (".yaml", ".yml"):
+        if yaml is None:
+            raise ImportError("PyYAML is required to load YAML topologies")
+        with open(path, "r", encoding="utf-8") as f:
+            return yaml.safe_load(f)
+    raise ValueError(f"Unsupported topology format: {path}")
@@ -0,0 +1,145 @@
+import copy
+from pathlib import Path
+from typing import Any, Iterator, Optional
+from .loader import load_topology_file
+
+
+def render(value: Any, context: dict[str, Any], skip: tuple[str, ...] = ()) -> Any:
+    """Substitute {placeholders} in every string of a spec"""
+    if isinstance(value, str):
+        return value.format_map(context) if "{" in value else value
+    if isinstance(value, dict):
+        return {
+            key: item if key in skip else render(item, context)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [render(item, context) for item in value]
+    return value
+
+
+def expand(
+    items: list[dict[str, Any]],
+    context: Optional[dict[str, Any]] = None,
+    skip: tuple[str, ...] = (),
+) -> Iterator[dict[str, Any]]:
+    """
+    Expand `repeat` entries lazily
+
+    Every copy is rendered with {index} set to its 1-based repeat number,
+    on top of the placeholders of the enclosing level.
+    """
+    for item in items:
+        repeat = item.get("repeat", 1)
+        body = {key: value for key, value in item.items() if key != "repeat"}
+        for index in range(1, repeat + 1):
+            yield render(body, {**(context or {}), "index": index}, skip)
+
+
+class PlantTopology:
+    """
+    Declarative plant layout: enterprise, storage, quality control and
+    production lines with their equipment.
+
+    Production lines are expanded lazily, one at a time, so building a
+    plant keeps only the specs of the line being built in memory.
+
+    Placeholders:
+    - {index}: repeat number of the current entry
+    - {line}: position of the enclosing production line in the plant
+    - {line_name}: name of the enclosing production line
+
+    A topology can be split into shards (see `shard`), each yielding only
+    the production lines it owns.
+    """
+
+    def __init__(self, spec: dict[str, Any]):
+        enterprise = spec.get("enterprise", {})
+        self.name: str = enterprise.get("name", "Dairy Enterprise")
+        self._templates: dict[str, dict[str, Any]] = spec.get("equipment_templates", {})
+        self._production_lines: list[dict[str, Any]] = spec.get("production_lines", [])
+        self._shard_index = 0
+        self._shard_count = 1
+
+        self.storage: Optional[list[dict[str, str]]] = None
+        if "storage" in spec:
+            self.storage = list(expand(spec["storage"]))
+
+        self.quality_controls: Optional[list[str]] = None
+        if "quality_control" in spec:
+            self.quality_controls = [
+                item["name"] for item in expand(spec["quality_control"])
+            ]
+
+    @classmethod
+    def load(cls, path: str | Path) -> "PlantTopology":
+        """Load a topology from a .toml, .json, .yaml or .yml file"""
+        return cls(load_topology_file(path))
+
+    def __str__(self):
+        if self._shard_count > 1:
+            return (
+                f"PlantTopology(name={self.name}, "
+                f"shard={self._shard_index + 1}/{self._shard_count})"
+            )
+        return f"PlantTopology(name={self.name})"
+
+    def shard(self, index: int, count: int) -> "PlantTopology":
+        """
+        The part of the plant owned by shard `index` of `count`
+
+        Production lines are dealt round-robin over the shards by position,
+        placeholders keep their plant-wide values so tags stay unique. The
+        storage units and quality control systems belong to the first shard.
+        """
+        if not 0 <= index < count:
+            raise ValueError(f"Invalid shard {index} of {count}")
+        shard = copy.copy(self)
+        shard._shard_index = index
+        shard._shard_count = count
+        if index > 0:
+            shard.storage = []
+            shard.quality_controls = []
+        return shard
+
+    def _resolve_template(self, entry: dict[str, Any]) -> dict[str, Any]:
+        """Merge an equipment entry over the template it refers to"""
+        if "template" not in entry:
+            return entry
+        template = self._templates.get(entry["template"])
+        if template is None:
+            raise ValueError(f"Unknown equipment template: {entry['template']}")
+        merged = dict(template)
+        for key, value in entry.items():
+            if key == "template":
+                continue
+            if isinstance(value, dict) and isinstance(merged.get(key), dict):
+                merged[key] = {**merged[key], **value}
+            else:
+                merged[key] = value
+        return merged
+
+    def equipment(
+        self, entries: list[dict[str, Any]], context: dict[str, Any]
+    ) -> list[dict[str, Any]]:
+        """Expand equipment entries over their templates with the line placeholders"""
+        return [
+            equipment
+            for entry in entries
+            for equipment in expand([self._resolve_template(entry)], context)
+        ]
+
+    def production_line(self, line: dict[str, Any], position: int) -> dict[str, Any]:
+        """Expand the equipment of a production line spec at a position of the plant"""
+        context = {"line": position, "line_name": line["name"]}
+        line["equipment"] = self.equipment(line.get("equipment", []), context)
+        return line
+
+    def production_lines(self) -> Iterator[dict[str, Any]]:
+        """Yield every production line spec of the shard with its equipment expanded"""
+        for position, line in enumerate(
+            expand(self._production_lines, skip=("equipment",)), start=1
+        ):
+            if (position - 1) % self._shard_count != self._shard_index:
+                continue
+            yield self.production_line(line, position)
@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+from typing import Any, Iterable, Optional
+from asyncua import Node, ua
+from asyncua.common.methods import uamethod
+from address_space import NodeBuilder, argument
+from enterprise import Enterprise
+from production_line.equipment import Equipment
+from production_line.production_line import ProductionLine
+from .builder import build_production_line, clone_production_line, create_equipment
+from .plant import PlantTopology, expand
+
+
+class PlantEditor:
+    """
+    Adds, clones and removes production lines and equipment while the plant runs
+
+    Specs are JSON objects like the production lines and equipment of the
+    topology: they may use its equipment templates, `repeat` and the
+    {index}, {line} and {line_name} placeholders. New lines and equipment
+    are simulated right away, removed ones are taken out of the simulation
+    before their nodes are deleted.
+
+    Methods on the parent node:
+    - AddProductionLines(Spec) -> Names
+    - CloneProductionLine(Source, Names) -> Results
+    - RemoveProductionLines(Names) -> Results
+    - AddEquipment(Line, Spec) -> Names
+    - RemoveEquipment(Line, Names) -> Results
+
+    Changes run one at a time. With a simulation worker only lines and
+    equipment whose signals are not stepped by the worker can be changed;
+    other changes are refused with BadInvalidState before any node is
+    created or any variable taken out of the simulation.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        enterprise: Enterprise,
+        idx: int,
+        topology: Optional[PlantTopology] = None,
+    ):
+        self._logger = logger
+        self._enterprise = enterprise
+        self._idx = idx
+        self._topology = topology if topology is not None else PlantTopology({})
+        self._lock = asyncio.Lock()
+        # Positions of the lines for the {line} placeholder, never reused
+        self._positions = {
+            line.name: position
+            for position, line in enumerate(enterprise.production_lines, start=1)
+        }
+        self._last_position = len(self._positions)
+
+    def __str__(self):
+        return f"PlantEditor(lines={len(self._enterprise.production_lines)})"
+
+    async def initialize(self, builder: Optional[NodeBuilder] = None):
+        """Add the editing methods to the enterprise node"""
+        own_builder = builder is None
+        node = self._enterprise.node
+        if own_builder:
+            builder = NodeBuilder(node.session)
+        spec = argument(ua.VariantType.String, "Spec")
+        names = argument(ua.VariantType.String, "Names", array=True)
+        results = argument(ua.VariantType.StatusCode, "Results", array=True)
+        line = argument(ua.VariantType.String, "Line")
+        for name, method, inputs, outputs in (
+            ("AddProductionLines", self._add_production_lines, [spec], [names]),
+            (
+                "CloneProductionLine",
+                self._clone_production_line,
+                [argument(ua.VariantType.String, "Source"), names],
+                [results],
+            ),
+            (
+                "RemoveProductionLines",
+                self._remove_production_lines,
+                [names],
+                [results],
+            ),
+            ("AddEquipment", self._add_equipment, [line, spec], [names]),
+            ("RemoveEquipment", self._remove_equipment, [line, names], [results]),
+        ):
+            builder.add_method(node, self._idx, name, method, inputs, outputs)
+        if own_builder:
+            await builder.commit()
+
+    def _line(self, name: str) -> ProductionLine:
+        production_line = self._enterprise.production_line(name)
+        if production_line is None:
+            raise KeyError(f"No production line {name} in {self._enterprise}")
+        return production_line
+
+    def _check_new(self, names: list[str], existing: list[str]):
+        """Raise a ValueError unless the names are unique and new"""
+        duplicates = set(names) & set(existing) or {
+            name for name in names if names.count(name) > 1
+        }
+        if duplicates:
+            raise ValueError(f"Names already in use: {sorted(duplicates)}")
+
+    def _check_simulation(self, equipment: Iterable[Equipment], coupled: bool):
+        """Raise a RuntimeError unless the equipment can be simulated on a line"""
+        self._enterprise.check_simulation(
+            (equipment, coupled) for equipment in equipment
+        )
+
+    async def add_production_lines(self, spec: dict[str, Any]) -> list[ProductionLine]:
+        """Build, add and simulate the production lines of a spec"""
+        async with self._lock:
+            existing = [line.name for line in self._enterprise.production_lines]
+            specs = list(expand([spec], skip=("equipment",)))
+            self._check_new([line["name"] for line in specs], existing)
+            first = self._last_position + 1
+            specs = [
+                self._topology.production_line(line, position)
+                for position, line in enumerate(specs, start=first)
+            ]
+            for line in specs:
+                if line.get("simulate", True):
+                    self._check_simulation(
+                        (
+                            create_equipment(s, self._logger, None, self._idx)
+                            for s in line["equipment"]
+                        ),
+                        line.get("coupled", True),
+                    )
+            production_lines = []
+            for line in specs:
+                production_line = await build_production_line(
+                    line,
+                    self._logger,
+                    self._enterprise.node,
+                    self._idx,
+                )
+                await self._add(production_line, first + len(production_lines))
+                production_lines.append(production_line)
+            return production_lines
+
+    async def clone_production_line(self, source: str, name: str) -> ProductionLine:
+        """Copy a production line with its equipment, add and simulate the copy"""
+        async with self._lock:
+            original = self._line(source)
+            existing = [line.name for line in self._enterprise.production_lines]
+            self._check_new([name], existing)
+            if original.simulated:
+                self._check_simulation(original.equipment, original.coupled)
+            production_line = await clone_production_line(
+                original, name, self._logger, self._enterprise.node, self._idx
+            )
+            await self._add(production_line, self._last_position + 1)
+            return production_line
+
+    async def _add(self, production_line: ProductionLine, position: int):
+        """Add a built line at a position, delete it again if that fails"""
+        self._last_position = max(self._last_position, position)
+        try:
+            await self._enterprise.add_production_line(production_line)
+        except Exception:
+            await self._enterprise.remove_production_line(production_line.name)
+            raise
+        self._positions[production_line.name] = position
+        self._logger.info(f"Added {production_line} to {self._enterprise}")
+
+    async def remove_production_line(self, name: str) -> ProductionLine:
+        """Stop simulating a production line and delete its nodes"""
+        async with self._lock:
+            self._line(name)
+            production_line = await self._enterprise.remove_production_line(name)
+            self._positions.pop(name, None)
+            return production_line
+
+    async def add_equipment(self, line: str, spec: dict[str, Any]) -> list[Equipment]:
+        """Create, add and simulate the equipment of a spec on a line"""
+        async with self._lock:
+            production_line = self._line(line)
+            specs = self._topology.equipment(
+                [spec], {"line": self._positions.get(line, 0), "line_name": line}
+            )
+            self._check_new(
+                [s.get("name", s["type"]) for s in specs],
+                [equipment.name for equipment in production_line.equipment],
+            )
+            created = [
+                create_equipment(s, self._logger, production_line.node, self._idx)
+                for s in specs
+            ]
+            if production_line.simulated:
+                self._check_simulation(created, production_line.coupled)
+            builder = NodeBuilder(production_line.node.session)
+            for equipment in created:
+                await equipment.initialize(builder)
+            await builder.commit()
+            for equipment in created:
+                try:
+                    await self._enterprise.add_equipment(production_line, equipment)
+                except Exception:
+                    await self._enterprise.remove_equipment(
+                        production_line, equipment.name
+                    )
+                    raise
+            self._logger.info(f"Added {len(created)} equipment to {production_line}")
+            return created
+
+    async def remove_equipment(self, line: str, name: str) -> Equipment:
+        """Stop simulating an equipment of a line and delete its nodes"""
+        async with self._lock:
+            production_line = self._line(line)
+            equipment = await self._enterprise.remove_equipment(production_line, name)
+            if equipment is None:
+                raise KeyError(f"No equipment {name} on {production_line}")
+            return equipment
+
+    def _status(self, error: Exception) -> ua.StatusCode:
+        """Status code of a failed change, which is logged"""
+        self._logger.warning(f"{type(error).__name__}: {error}")
+        if isinstance(error, KeyError):
+            return ua.StatusCode(ua.StatusCodes.BadNotFound)
+        if isinstance(error, ValueError):
+            return ua.StatusCode(ua.StatusCodes.BadInvalidArgument)
+        return ua.StatusCode(ua.StatusCodes.BadInvalidState)
+
+    @staticmethod
+    def _parse(spec: str) -> dict[str, Any]:
+        try:
+            parsed = json.loads(spec)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid spec: {e}") from e
+        if not isinstance(parsed, dict):
+            raise ValueError(f"A spec is a JSON object, not {spec}")
+        return parsed
+
+    async def _each(self, names: list[str], change) -> ua.Variant:
+        """Apply a change to every name, return a status code per name"""
+        results = []
+        for name in names:
+            try:
+                await change(name)
+                results.append(ua.StatusCode())
+            except (KeyError, ValueError, RuntimeError) as e:
+                results.append(self._status(e))
+        return ua.Variant(results, ua.VariantType.StatusCode)
+
+    @uamethod
+    async def _add_production_lines(self, parent: Node, spec: str):
+        try:
+            production_lines = await self.add_production_lines(self._parse(spec))
+        except (KeyError, ValueError, RuntimeError) as e:
+            return self._status(e)
+        names = [production_line.name for production_line in production_lines]
+        return ua.Variant(names, ua.VariantType.String)
+
+    @uamethod
+    async def _clone_production_line(self, parent: Node, source: str, names: list):
+        return await self._each(
+            names or [], lambda name: self.clone_production_line(source, name)
+        )
+
+    @uamethod
+    async def _remove_production_lines(self, parent: Node, names: list):
+        return await self._each(names or [], self.remove_production_line)
+
+    @uamethod
+    async def _add_equipment(self, parent: Node, line: str, spec: str):
+        try:
+            created = await self.add_equipment(line, self._parse(spec))
+        except (KeyError, ValueError, RuntimeError) as e:
+            return self._status(e)
+        names = [equipment.name for equipment in created]
+        return ua.Variant(names, ua.VariantType.String)
+
+    @uamethod
+    async def _remove_equipment(self, parent: Node, line: str, names: list):
+        return await self._each(
+            names or [], lambda name: self.remove_equipment(line, name)
+        )